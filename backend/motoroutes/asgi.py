@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'motoroutes.settings')
 
 application = get_asgi_application()
+
+# Build the in-memory autocomplete index before the first request needs it
+from routes.autocomplete import warm_up  # noqa: E402
+
+warm_up()
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'routes.throttling.ConcurrencyLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +90,18 @@ DATABASES = {
     }
 }
 
+# Cache shared by all worker processes: POI cluster tiles, route pack
+# versions and heatmap state. The database cache needs no extra service (run
+# `manage.py createcachetable` once); use Redis in production, e.g.
+# {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#  'LOCATION': 'redis://127.0.0.1:6379'}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -142,9 +155,12 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'routes.throttling.CostThrottle',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
@@ -158,10 +174,145 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.VersionedTokenObtainPairSerializer',
 }
 
+# Seconds a JWT-authenticated user is served from the cache (Redis or
+# Memcached only; otherwise users are always loaded). Entries are
+# invalidated when the user is saved or deleted; bumping User.auth_version
+# (e.g. with a queryset update) revokes tokens within this time.
+AUTH_USER_CACHE_TTL = 60
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
+
+# Duplicate route detection: maximum Fréchet distance between two tracks
+# for them to be reported as likely duplicates
+ROUTE_DUPLICATE_MAX_DISTANCE_KM = 0.5
+
+# Personalized feed: number of routes precomputed per user. A saved route
+# is rescored for the creators of routes updated in the last
+# ROUTE_FEED_RECENT_DAYS within ROUTE_FEED_NEARBY_KM of it, at most
+# ROUTE_FEED_MAX_CANDIDATES of them
+ROUTE_FEED_SIZE = 200
+ROUTE_FEED_NEARBY_KM = 300
+ROUTE_FEED_RECENT_DAYS = 365
+ROUTE_FEED_MAX_CANDIDATES = 2000
+
+# Itinerary planner: default and maximum distance between chained routes,
+# and how long (in seconds) a worker keeps its in-memory route graph
+ITINERARY_DEFAULT_GAP_KM = 25
+ITINERARY_MAX_GAP_KM = 100
+ITINERARY_GRAPH_TTL = 300
+
+# Elevation profiles: directory of SRTM .hgt tiles (e.g. N45E010.hgt),
+# distance between profile samples and maximum samples per route
+ELEVATION_DEM_DIR = BASE_DIR / 'dem'
+ELEVATION_SAMPLE_SPACING_M = 100
+ELEVATION_MAX_SAMPLES = 2000
+
+# Chunked image uploads: where partial files are collected (keep it on the
+# same filesystem as MEDIA_ROOT so finalizing is a rename) and size limit
+IMAGE_UPLOAD_TEMP_DIR = MEDIA_ROOT / 'uploads_tmp'
+IMAGE_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+
+# Trending routes: half-life of route activity in the trending score.
+# Run `manage.py decay_trending_scores` periodically (e.g. hourly).
+TRENDING_HALF_LIFE_HOURS = 72
+
+# Throttling: token buckets charged with each endpoint's cost
+# (see routes/throttling.py). Capacity is the burst size in cost units,
+# refill_rate the sustained cost units per second. Buckets are kept per
+# worker process; with Redis or Memcached as the cache, use
+# 'routes.throttling.CacheBucketStore' to share them between workers.
+THROTTLE_BUCKET_STORE = 'routes.throttling.LocalBucketStore'
+THROTTLE_BUCKETS = {
+    'user': {'capacity': 240, 'refill_rate': 4.0},
+    'anon': {'capacity': 120, 'refill_rate': 2.0},
+}
+# Users never throttled, by username prefix. Set it to 'loadtest-' only on
+# a server under `manage.py loadtest`, where anyone able to register such a
+# username would bypass the throttle.
+THROTTLE_EXEMPT_USERNAME_PREFIX = ''
+# Load shedding: requests costing at least THROTTLE_EXPENSIVE_COST are
+# limited to this many at once per worker process
+THROTTLE_EXPENSIVE_COST = 5
+THROTTLE_MAX_CONCURRENT_EXPENSIVE = 8
+THROTTLE_RETRY_AFTER = 2
+
+# Route geometry ingest: decimals kept per coordinate (6 is ~0.1 m) and
+# minimum distance along the path between stored points
+GEOJSON_COORDINATE_PRECISION = 6
+GEOJSON_MIN_POINT_SPACING_M = 2
+
+# Route preview thumbnails for list cards (width, height in pixels), stored
+# under MEDIA_ROOT/route_previews/
+ROUTE_PREVIEW_SIZE = (320, 180)
+ROUTE_PREVIEW_FORMAT = 'WEBP'
+ROUTE_PREVIEW_CACHE_SECONDS = 60 * 60 * 24 * 30
+
+# Background jobs (routes/jobs.py), run by `manage.py run_jobs`. With
+# JOBS_RUN_EAGERLY jobs run in the request right after commit instead,
+# for development without a worker.
+JOBS_RUN_EAGERLY = False
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF_SECONDS = 30
+# Running jobs older than this are considered abandoned and retried
+JOB_TIMEOUT_SECONDS = 15 * 60
+JOB_KEEP_FINISHED_DAYS = 7
+
+# Admin changelists count rows exactly up to this many; larger unfiltered
+# tables use the database's row estimate
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# POI clusters: cached clusters per map tile, and the most tiles a single
+# viewport may cover (a screen is ~20 tiles). POI writes drop cached tiles
+# from POI_CLUSTER_INVALIDATE_ZOOM up; lower zooms wait for the timeout
+POI_CLUSTER_CACHE_TIMEOUT = 60 * 60
+POI_CLUSTER_MAX_TILES = 64
+POI_CLUSTER_INVALIDATE_ZOOM = 8
+
+# Offline route packs: longest side of image thumbnails and how many pack
+# versions per route are kept for delta downloads
+ROUTE_PACK_IMAGE_SIZE = 800
+ROUTE_PACK_KEEP_VERSIONS = 5
+
+# Delta sync (/api/sync/): items per page and how long deletes are
+# remembered (older sync tokens must sync from scratch). Run
+# `manage.py purge_tombstones` daily.
+SYNC_PAGE_SIZE = 200
+SYNC_TOMBSTONE_DAYS = 90
+
+# Offline reverse geocoding: GeoJSON country boundaries, the feature
+# properties holding the country code and name, and the sampling interval
+# along routes. The bundled file is Natural Earth 1:110m admin 0 countries
+# (see data/README.md); `manage.py fetch_boundaries URL --sha256 HASH`
+# replaces it with a more detailed one. Run `manage.py geocode_countries`
+# after replacing it.
+GEOCODER_BOUNDARIES_FILE = BASE_DIR / 'data' / 'boundaries.geojson'
+GEOCODER_CODE_PROPERTY = 'ISO_A2_EH'
+GEOCODER_NAME_PROPERTY = 'NAME'
+GEOCODER_ROUTE_SPACING_KM = 1
+
+# Routes passing through an area (?bbox=, ?polygon=, ?circle= on the route
+# list): most cell ranges looked up per query and largest circle radius.
+# Run `manage.py rebuild_route_cells` after importing routes.
+ROUTE_CELL_MAX_RANGES = 64
+ROUTE_PASSING_MAX_RADIUS_KM = 200
+
+# Typeahead (/api/routes/autocomplete/): most route titles and POI names
+# kept in memory per process, seconds before the index is rebuilt in the
+# background, and most suggestions per request
+AUTOCOMPLETE_MAX_ENTRIES = 50000
+AUTOCOMPLETE_INDEX_TTL = 300
+AUTOCOMPLETE_MAX_RESULTS = 20
+
+# Route heatmap tiles (/api/routes/heatmap/<z>/<x>/<y>.png): highest zoom
+# with stored density grids, bins per tile side and browser cache time.
+# Run `manage.py rebuild_heatmap` after changing the first two.
+HEATMAP_MAX_ZOOM = 12
+HEATMAP_TILE_BINS = 64
+HEATMAP_TILE_CACHE_SECONDS = 60 * 60
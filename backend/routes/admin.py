@@ -1,46 +1,229 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Route, Location, Image, Comment
+from django.core.paginator import Paginator
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from users.stats import rebuild_stats
+from .models import Route, Location, Image, Comment, Job
+from .jobs import enqueue, PRIORITY_LOW
+from . import tasks
+
+
+def estimated_row_count(model):
+    """
+    The database's own estimate of a table's row count, or None if it has
+    none (e.g. the table was never analyzed).
+    """
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table]),
+        'mysql': (
+            'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+            [table],
+        ),
+        'sqlite': ('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]),
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(*queries[connection.vendor])
+            row = cursor.fetchone()
+    except OperationalError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    # sqlite_stat1 stores "<rows> <rows per key>..."
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids exact COUNT(*) over large tables.
+    Unfiltered changelists use the database's row estimate once the table
+    is larger than ADMIN_EXACT_COUNT_LIMIT; filtered ones are counted up to
+    that limit.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        if not self.object_list.query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return self.object_list.order_by()[:limit].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables too large for exact counts and full-row loading.
+    Changelists load only `list_only` fields and bulk deletes run in
+    batches that load only `delete_only` fields.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_only = None
+    delete_only = None
+    delete_batch_size = 500
+
+    def get_changelist(self, request, **kwargs):
+        changelist = super().get_changelist(request, **kwargs)
+        only = self.list_only
+        if not only:
+            return changelist
+
+        class OnlyChangeList(changelist):
+            def get_queryset(self, request, *args, **kwargs):
+                return super().get_queryset(request, *args, **kwargs).only(*only)
+
+        return OnlyChangeList
+
+    def delete_queryset(self, request, queryset):
+        """
+        Delete in batches, loading only the fields the delete signals use.
+        """
+        ids = list(queryset.values_list('pk', flat=True))
+        for start in range(0, len(ids), self.delete_batch_size):
+            batch = self.model.objects.filter(pk__in=ids[start:start + self.delete_batch_size])
+            if self.delete_only:
+                batch = batch.only(*self.delete_only)
+            with transaction.atomic():
+                batch.delete()
 
 
 @admin.register(Route)
-class RouteAdmin(admin.ModelAdmin):
+class RouteAdmin(LargeTableAdmin):
     """
     Admin interface for Route model.
+    The GeoJSON path is never loaded; the change form shows its preview.
     """
     list_display = ['title', 'creator', 'difficulty', 'distance', 'created_at']
     list_filter = ['difficulty', 'created_at']
-    search_fields = ['title', 'description', 'creator__username']
-    readonly_fields = ['created_at', 'updated_at']
+    list_select_related = ['creator']
+    list_only = ['title', 'creator__username', 'difficulty', 'distance', 'created_at']
+    delete_only = ['id', 'creator_id', 'distance', 'difficulty']
+    search_fields = ['^title', '=creator__username']
+    search_help_text = 'Title prefix or exact creator username'
+    exclude = ['geojson']
+    raw_id_fields = ['creator']
+    readonly_fields = ['path_preview', 'geometry_version', 'trending', 'created_at', 'updated_at', 'sync_seq']
+    actions = ['refresh_derived_data', 'rebuild_creator_stats']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('geojson')
+
+    def save_model(self, request, obj, form, change):
+        # Only write what the form changed, so concurrent trending updates are kept
+        if change:
+            obj.save(update_fields=[*form.changed_data, 'updated_at'])
+        else:
+            super().save_model(request, obj, form, change)
+
+    @admin.display(description='Path')
+    def path_preview(self, obj):
+        if not obj.pk:
+            return '-'
+        return format_html('<img src="{}" alt="">', reverse('route-preview', args=[obj.pk]))
+
+    @admin.action(description='Recompute signatures, cells, cards, feeds, previews, elevation and countries')
+    def refresh_derived_data(self, request, queryset):
+        route_ids = list(queryset.values_list('pk', flat=True))
+        with transaction.atomic():
+            for route_id in route_ids:
+                enqueue(tasks.refresh_route_signature, priority=PRIORITY_LOW, route_id=route_id)
+                enqueue(tasks.refresh_route_cells, priority=PRIORITY_LOW, route_id=route_id)
+                enqueue(tasks.refresh_route_card, priority=PRIORITY_LOW, route_id=route_id)
+                enqueue(tasks.refresh_route_feeds, priority=PRIORITY_LOW, route_id=route_id)
+                enqueue(tasks.render_route_preview, priority=PRIORITY_LOW, route_id=route_id)
+                enqueue(tasks.refresh_route_elevation, priority=PRIORITY_LOW, route_id=route_id)
+                enqueue(tasks.refresh_route_countries, priority=PRIORITY_LOW, route_id=route_id)
+        self.message_user(request, f'Queued jobs for {len(route_ids)} routes.')
+
+    @admin.action(description="Rebuild creators' stats")
+    def rebuild_creator_stats(self, request, queryset):
+        user_ids = set(queryset.values_list('creator_id', flat=True))
+        rebuilt = rebuild_stats(user_ids)
+        self.message_user(request, f'Rebuilt stats for {rebuilt} users.')
 
 
 @admin.register(Location)
-class LocationAdmin(admin.ModelAdmin):
+class LocationAdmin(LargeTableAdmin):
     """
     Admin interface for Location model.
     """
     list_display = ['name', 'location_type', 'route', 'creator', 'created_at']
     list_filter = ['location_type', 'created_at']
-    search_fields = ['name', 'description', 'creator__username']
-    readonly_fields = ['created_at', 'updated_at']
+    list_select_related = ['route', 'creator']
+    list_only = ['name', 'location_type', 'route__title', 'creator__username', 'created_at']
+    delete_only = ['id', 'creator_id', 'route_id', 'cell', 'location_type']
+    search_fields = ['^name', '=creator__username']
+    search_help_text = 'Name prefix or exact creator username'
+    raw_id_fields = ['route', 'creator']
+    readonly_fields = ['created_at', 'updated_at', 'sync_seq']
 
 
 @admin.register(Image)
-class ImageAdmin(admin.ModelAdmin):
+class ImageAdmin(LargeTableAdmin):
     """
     Admin interface for Image model.
     """
     list_display = ['id', 'caption', 'route', 'location', 'uploader', 'created_at']
     list_filter = ['created_at']
-    search_fields = ['caption', 'uploader__username']
-    readonly_fields = ['created_at']
+    list_select_related = ['route', 'location', 'uploader']
+    list_only = ['caption', 'route__title', 'location__name', 'uploader__username', 'created_at']
+    delete_only = ['id', 'uploader_id', 'route_id']
+    search_fields = ['^caption', '=uploader__username']
+    search_help_text = 'Caption prefix or exact uploader username'
+    raw_id_fields = ['route', 'location', 'uploader']
+    readonly_fields = ['created_at', 'sync_seq']
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     """
     Admin interface for Comment model.
     """
     list_display = ['id', 'author', 'route', 'created_at']
     list_filter = ['created_at']
-    search_fields = ['text', 'author__username', 'route__title']
-    readonly_fields = ['created_at', 'updated_at']
+    list_select_related = ['author', 'route']
+    list_only = ['author__username', 'route__title', 'created_at']
+    delete_only = ['id', 'author_id', 'route_id']
+    search_fields = ['=author__username', '^route__title']
+    search_help_text = 'Exact author username or route title prefix'
+    raw_id_fields = ['route', 'author']
+    readonly_fields = ['created_at', 'updated_at', 'sync_seq']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """
+    Admin interface for background jobs.
+    """
+    list_display = ['id', 'task', 'status', 'priority', 'attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'last_error']
+    readonly_fields = [
+        'task', 'kwargs', 'dedup_key', 'attempts', 'worker', 'last_error',
+        'created_at', 'started_at', 'finished_at',
+    ]
+    actions = ['retry_jobs']
+
+    @admin.action(description='Retry selected jobs now')
+    def retry_jobs(self, request, queryset):
+        retried = 0
+        for job in queryset.exclude(status=Job.RUNNING):
+            try:
+                with transaction.atomic():
+                    Job.objects.filter(pk=job.pk).update(
+                        status=Job.PENDING, attempts=0, run_after=timezone.now(), finished_at=None,
+                    )
+                retried += 1
+            except IntegrityError:
+                # An identical job is already pending
+                pass
+        self.message_user(request, f'{retried} jobs queued for retry.')
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RoutesConfig(AppConfig):
     name = 'routes'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,253 @@
+"""
+Typeahead suggestions for route titles and POI names.
+
+Names are normalized (accents stripped, case folded) and every word-suffix
+of a name ("passo dello stelvio", "dello stelvio", "stelvio") is kept in
+one sorted list, so the names matching a query are a contiguous range
+found with bisect. Routes weigh by their trending score and POIs by the
+score of their route. Short prefixes match large ranges; their best
+suggestions are cached and kept up to date as names are added.
+
+The index is process-wide and holds at most AUTOCOMPLETE_MAX_ENTRIES
+names, the most popular ones. It is kept fresh by route and location
+signals and rebuilt in a background thread after AUTOCOMPLETE_INDEX_TTL
+seconds, so changes handled by other worker processes are picked up
+without a request waiting for the database.
+"""
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import Route, Location
+
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+')
+# Word-suffixes indexed per name
+MAX_WORDS = 8
+# Prefix ranges larger than this get their suggestions cached
+SCAN_LIMIT = 2000
+END = '\U0010ffff'
+
+
+def normalize(text):
+    """
+    Lowercase words of `text` without accents, joined by single spaces.
+    """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    return ' '.join(WORD_RE.findall(text))
+
+
+def _keys(name):
+    words = normalize(name).split(' ')
+    return {' '.join(words[i:]) for i in range(min(len(words), MAX_WORDS)) if words[i]}
+
+
+class AutocompleteIndex:
+    """
+    Sorted (key, entry) pairs; entries are ('route' | 'location', id).
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.items = []
+        self.names = {}
+        self.weights = {}
+        # (weight, entry) min-heap for eviction; pairs whose weight is no
+        # longer current are skipped and dropped lazily
+        self.heap = []
+        self.cache = {}
+        self.built_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, entry, name, weight):
+        keys = sorted(_keys(name))
+        with self.lock:
+            self._remove(entry)
+            if len(self.names) >= self.max_entries:
+                lightest = self._lightest()
+                if self.weights[lightest] >= weight:
+                    return
+                self._remove(lightest)
+            self.names[entry] = name
+            self.weights[entry] = weight
+            heapq.heappush(self.heap, (weight, entry))
+            if len(self.heap) > 2 * len(self.weights):
+                self._rebuild_heap()
+            for key in keys:
+                insort(self.items, (key, entry))
+                self._update_cache(key, entry)
+
+    def load(self, rows):
+        """
+        Fill an empty index from (weight, entry, name) rows, sorting once.
+        """
+        with self.lock:
+            for weight, entry, name in itertools.islice(rows, self.max_entries):
+                self.names[entry] = name
+                self.weights[entry] = weight
+                self.items.extend((key, entry) for key in _keys(name))
+            self.items.sort()
+            self._rebuild_heap()
+
+    def remove(self, entry):
+        with self.lock:
+            self._remove(entry)
+
+    def _remove(self, entry):
+        name = self.names.pop(entry, None)
+        if name is None:
+            return
+        del self.weights[entry]
+        for key in _keys(name):
+            index = bisect_left(self.items, (key, entry))
+            if index < len(self.items) and self.items[index] == (key, entry):
+                del self.items[index]
+        for prefix in [prefix for prefix, cached in self.cache.items() if entry in cached]:
+            del self.cache[prefix]
+
+    def _lightest(self):
+        while True:
+            weight, entry = self.heap[0]
+            if self.weights.get(entry) == weight:
+                return entry
+            heapq.heappop(self.heap)
+
+    def _rebuild_heap(self):
+        self.heap = [(weight, entry) for entry, weight in self.weights.items()]
+        heapq.heapify(self.heap)
+
+    def _update_cache(self, key, entry):
+        for prefix, cached in self.cache.items():
+            if key.startswith(prefix) and entry not in cached:
+                cached.append(entry)
+                cached.sort(key=self.weights.get, reverse=True)
+                del cached[settings.AUTOCOMPLETE_MAX_RESULTS:]
+
+    def _best(self, start, end, limit):
+        """
+        The `limit` heaviest distinct entries among items[start:end].
+        """
+        count = limit
+        while True:
+            top = heapq.nlargest(count, range(start, end), key=lambda i: self.weights[self.items[i][1]])
+            entries = list(dict.fromkeys(self.items[i][1] for i in top))
+            if len(entries) >= limit or count >= end - start:
+                return entries[:limit]
+            count *= 2
+
+    def suggest(self, query, limit):
+        """
+        (entry, name) of the most popular names with a word starting with
+        `query`.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        with self.lock:
+            start = bisect_left(self.items, (prefix,))
+            end = bisect_left(self.items, (prefix + END,))
+            if end - start <= SCAN_LIMIT:
+                entries = self._best(start, end, limit)
+            else:
+                if prefix not in self.cache:
+                    self.cache[prefix] = self._best(start, end, settings.AUTOCOMPLETE_MAX_RESULTS)
+                entries = self.cache[prefix][:limit]
+            return [(entry, self.names[entry]) for entry in entries]
+
+
+def build_index():
+    index = AutocompleteIndex(settings.AUTOCOMPLETE_MAX_ENTRIES)
+    limit = settings.AUTOCOMPLETE_MAX_ENTRIES
+    routes = Route.objects.order_by('-trending', '-id').values_list('trending', 'id', 'title')[:limit]
+    locations = Location.objects.order_by(
+        F('route__trending').desc(nulls_last=True), '-id',
+    ).values_list('route__trending', 'id', 'name')[:limit]
+    rows = heapq.merge(
+        ((weight, ('route', route_id), title) for weight, route_id, title in routes.iterator(chunk_size=2000)),
+        ((weight or 0.0, ('location', location_id), name) for weight, location_id, name in locations.iterator(chunk_size=2000)),
+        key=lambda row: row[0], reverse=True,
+    )
+    index.load(rows)
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+_rebuilding = False
+
+
+def _rebuild():
+    global _index, _rebuilding
+    try:
+        index = build_index()
+        with _index_lock:
+            _index = index
+    except Exception:
+        logger.exception('Rebuilding the autocomplete index failed')
+    finally:
+        _rebuilding = False
+
+
+def get_index():
+    """
+    Return the process-wide index, building it if needed. An expired index
+    is still used while a fresh one is built in the background.
+    """
+    global _index, _rebuilding
+    with _index_lock:
+        if _index is None:
+            _index = build_index()
+        elif not _rebuilding and time.monotonic() - _index.built_at > settings.AUTOCOMPLETE_INDEX_TTL:
+            _rebuilding = True
+            threading.Thread(target=_rebuild, name='autocomplete-rebuild', daemon=True).start()
+        return _index
+
+
+def warm_up():
+    """
+    Build the index in the background, so the first request finds it
+    ready.
+    """
+    global _rebuilding
+    with _index_lock:
+        if _index is not None or _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild, name='autocomplete-build', daemon=True).start()
+
+
+def update_route(route):
+    """
+    Apply a saved route to the index, if one has been built.
+    """
+    if _index is not None:
+        _index.add(('route', route.pk), route.title, route.trending)
+
+
+def update_location(location):
+    """
+    Apply a saved location to the index, if one has been built.
+    """
+    if _index is not None:
+        # Locations weigh by their route's score, as indexed
+        weight = _index.weights.get(('route', location.route_id)) if location.route_id else None
+        _index.add(('location', location.pk), location.name, weight or 0.0)
+
+
+def remove(kind, object_id):
+    """
+    Drop a deleted route or location from the index, if one has been built.
+    """
+    if _index is not None:
+        _index.remove((kind, object_id))
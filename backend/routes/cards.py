@@ -0,0 +1,120 @@
+"""
+Pre-rendered route cards for the route lists.
+
+The RouteListSerializer output of every route, without its creator, is
+stored as JSON text in a RouteCard. List endpoints select only the ids of a
+page, in filter order, and join the stored cards into the response, adding
+the creators (embedded, or side-loaded with `?sideload=users`) from one
+query, so no per-row serialization happens on the hottest endpoints.
+
+Cards are deleted when the route, its images, locations or comments change,
+and rebuilt by a job; a page with missing cards builds them inline. URLs are
+stored relative with an ORIGIN marker in front, which is replaced with the
+request's scheme and host once per response. The JSON is dumped with
+ensure_ascii, so the marker cannot come from user content.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Route, RouteCard
+from .serializers import RouteListSerializer, serialize_users
+
+
+ORIGIN = '\ue000'
+URL_FIELDS = ['first_image', 'preview_url']
+BUILD_BATCH = 200
+
+
+def _url(value):
+    if value is None:
+        return 'null'
+    encoded = json.dumps(value)
+    return f'"{ORIGIN}{encoded[1:]}' if value.startswith('/') else encoded
+
+
+def _dump(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=True, separators=(',', ':'))
+
+
+def render_card(data):
+    """
+    JSON text of one route serialized with side-loaded users, without its
+    creator and with its URLs left relative.
+    """
+    data = dict(data)
+    data.pop('creator_id')
+    urls = [data.pop(field) for field in URL_FIELDS]
+    body = _dump(data)
+    extra = ''.join(f',"{field}":{_url(url)}' for field, url in zip(URL_FIELDS, urls))
+    return body[:-1] + extra + '}'
+
+
+def build_cards(route_ids):
+    """
+    Render and store the cards of the given routes. Returns {id: (creator
+    id, card)}.
+    """
+    cards = {}
+    route_ids = list(route_ids)
+    for i in range(0, len(route_ids), BUILD_BATCH):
+        routes = Route.objects.filter(id__in=route_ids[i:i + BUILD_BATCH]).prefetch_related(
+            'locations', 'images', 'comments', 'countries',
+        )
+        serializer = RouteListSerializer(routes, many=True, context={'sideloaded_users': set()})
+        batch = {data['id']: (data['creator_id'], render_card(data)) for data in serializer.data}
+        RouteCard.objects.bulk_create(
+            [RouteCard(route_id=route_id, data=card) for route_id, (_, card) in batch.items()],
+            update_conflicts=True,
+            unique_fields=['route'],
+            update_fields=['data', 'built_at'],
+        )
+        cards.update(batch)
+    return cards
+
+
+def get_cards(route_ids):
+    """
+    {id: (creator id, card)} for the given routes, building missing cards.
+    """
+    cards = {
+        route_id: (creator_id, card)
+        for route_id, creator_id, card in RouteCard.objects.filter(route_id__in=route_ids).values_list(
+            'route_id', 'route__creator_id', 'data',
+        )
+    }
+    missing = [route_id for route_id in route_ids if route_id not in cards]
+    if missing:
+        cards.update(build_cards(missing))
+    return cards
+
+
+def render_list(route_ids, request, sideload_users=False):
+    """
+    JSON array of the cards of the given routes, in order, and a JSON object
+    of their creators by id if `sideload_users` is set (else None and the
+    creators are embedded in the cards).
+    """
+    cards = get_cards(route_ids)
+    rows = [cards[route_id] for route_id in route_ids if route_id in cards]
+    users = {
+        user_id: _dump(data)
+        for user_id, data in serialize_users({creator_id for creator_id, _ in rows}, {'request': request}).items()
+    }
+    if sideload_users:
+        items = [f'{card[:-1]},"creator_id":{creator_id}}}' for creator_id, card in rows]
+        included = '{' + ','.join(f'"{user_id}":{user}' for user_id, user in users.items()) + '}'
+    else:
+        items = [f'{card[:-1]},"creator":{users.get(creator_id, "null")}}}' for creator_id, card in rows]
+        included = None
+    body = '[' + ','.join(items) + ']'
+    return body.replace(ORIGIN, request.build_absolute_uri('/')[:-1]), included
+
+
+def invalidate_cards(route_ids):
+    """
+    Drop the cards of changed routes; they are rebuilt by a job or when
+    next listed.
+    """
+    RouteCard.objects.filter(route_id__in=route_ids).delete()
+
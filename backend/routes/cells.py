@@ -0,0 +1,347 @@
+"""
+Segment index of route paths for "routes passing through" queries.
+
+Paths are rasterized onto a fixed longitude/latitude grid of 2**CELL_LEVEL
+by 2**CELL_LEVEL cells (about 2.4 x 1.2 km at the equator) and every cell a
+segment crosses is stored as a RouteCell, keyed by its Morton code. As with
+the POI cells in clusters.py, the cells inside a coarser quadtree tile are
+a single range of codes.
+
+A query shape is covered with quadtree tiles, refined down to CELL_LEVEL
+along its boundary. Routes with a cell in a tile inside the shape pass
+through it without further checks. The cells routes occupy in boundary
+tiles are then classified one by one: a route with a cell inside the shape
+passes, and only routes whose remaining cells are all partly inside it are
+tested against the shape segment by segment.
+"""
+import json
+import math
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .clusters import morton_codes, morton_decode
+from .geocoding import points_in_ring, _closed_ring
+from .geometry import extract_lines
+from .models import Route, RouteCell
+
+
+CELL_LEVEL = 14
+GRID_SIZE = 2 ** CELL_LEVEL
+KM_PER_DEGREE = 111.32
+# Bound on pairs of route segments and polygon edges compared at once
+MAX_BATCH = 1_000_000
+# Candidate routes loaded at once for the exact test
+CANDIDATE_BATCH = 100
+
+INSIDE, BOUNDARY, OUTSIDE = 1, 0, -1
+
+# Subqueries expanding one JSON array parameter into rows, so that long id
+# lists stay within the database's limit on query parameters
+ID_LIST_QUERIES = {
+    'sqlite': 'SELECT value FROM json_each(%s)',
+    'postgresql': 'SELECT jsonb_array_elements_text(%s::jsonb)::bigint',
+    'mysql': "SELECT id FROM JSON_TABLE(%s, '$[*]' COLUMNS (id BIGINT PATH '$')) AS ids",
+}
+
+
+def to_grid(lngs, lats):
+    """
+    Fractional grid coordinates of longitude and latitude arrays.
+    """
+    x = (np.asarray(lngs, dtype=np.float64) + 180.0) / 360.0 * GRID_SIZE
+    y = (np.asarray(lats, dtype=np.float64) + 90.0) / 180.0 * GRID_SIZE
+    return x, y
+
+
+def _crossings(a0, a1):
+    """
+    (segment index, t) of every grid line crossed by the segments a0 -> a1
+    along one axis, with t the fraction of the segment before the crossing.
+    """
+    start = np.floor(np.minimum(a0, a1))
+    counts = (np.floor(np.maximum(a0, a1)) - start).astype(np.int64)
+    segments = np.repeat(np.arange(len(a0)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    lines = start[segments] + 1 + offsets
+    return segments, (lines - a0[segments]) / (a1 - a0)[segments]
+
+
+def path_cells(points):
+    """
+    Sorted Morton codes of the grid cells crossed by a path of (lng, lat)
+    points.
+    """
+    if not len(points):
+        return np.zeros(0, dtype=np.uint64)
+    coords = np.asarray(points, dtype=np.float64)[:, :2]
+    x, y = to_grid(coords[:, 0], coords[:, 1])
+    x0, y0, x1, y1 = x[:-1], y[:-1], x[1:], y[1:]
+
+    # Cut each segment where it crosses a grid line; the middle of every
+    # piece lies in exactly one of the cells the segment crosses
+    x_segments, x_t = _crossings(x0, x1)
+    y_segments, y_t = _crossings(y0, y1)
+    count = len(x0)
+    segments = np.concatenate([np.arange(count), np.arange(count), x_segments, y_segments])
+    t = np.concatenate([np.zeros(count), np.ones(count), x_t, y_t])
+    order = np.lexsort((t, segments))
+    segments, t = segments[order], t[order]
+    same = segments[:-1] == segments[1:]
+    pieces = segments[:-1][same]
+    middle = (t[:-1][same] + t[1:][same]) / 2
+
+    cell_x = np.concatenate([x, x0[pieces] + middle * (x1 - x0)[pieces]])
+    cell_y = np.concatenate([y, y0[pieces] + middle * (y1 - y0)[pieces]])
+    cell_x = np.clip(np.floor(cell_x), 0, GRID_SIZE - 1).astype(np.uint64)
+    cell_y = np.clip(np.floor(cell_y), 0, GRID_SIZE - 1).astype(np.uint64)
+    return np.unique(morton_codes(cell_x, cell_y))
+
+
+def route_cells(geojson):
+    """
+    Sorted Morton codes of the cells crossed by a route, each line of a
+    MultiLineString indexed separately so no segment joins their ends.
+    """
+    cells = [path_cells(line) for line in extract_lines(geojson) if line]
+    if not cells:
+        return np.zeros(0, dtype=np.uint64)
+    return np.unique(np.concatenate(cells))
+
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+
+def _overlapping(boxes, bbox):
+    min_x, min_y, max_x, max_y = bbox
+    return (boxes[:, 0] <= max_x) & (boxes[:, 2] >= min_x) & (boxes[:, 1] <= max_y) & (boxes[:, 3] >= min_y)
+
+
+def _segment_boxes(coords):
+    a, b = coords[:-1], coords[1:]
+    return np.column_stack([np.minimum(a, b), np.maximum(a, b)])
+
+
+class PolygonShape:
+    """
+    A simple polygon given as a ring of (lng, lat) points.
+    """
+
+    def __init__(self, ring):
+        self.ring = _closed_ring(ring)
+        self.edges = _segment_boxes(self.ring)
+        self.bbox = (*self.ring.min(axis=0), *self.ring.max(axis=0))
+
+    def classify(self, boxes):
+        """
+        INSIDE, BOUNDARY or OUTSIDE for each (min_lng, min_lat, max_lng,
+        max_lat) box.
+        """
+        x1, y1 = self.ring[:-1, 0], self.ring[:-1, 1]
+        x2, y2 = self.ring[1:, 0], self.ring[1:, 1]
+        hit = np.zeros(len(boxes), dtype=bool)
+        step = max(1, MAX_BATCH // len(x1))
+        for i in range(0, len(boxes), step):
+            chunk = boxes[i:i + step, None, :]
+            overlap = (
+                (self.edges[:, 0] <= chunk[..., 2]) & (self.edges[:, 2] >= chunk[..., 0])
+                & (self.edges[:, 1] <= chunk[..., 3]) & (self.edges[:, 3] >= chunk[..., 1])
+            )
+            # An edge misses a box when all four corners are on one side of it
+            sides = [
+                _orientation(x1, y1, x2, y2, chunk[..., cx], chunk[..., cy])
+                for cx, cy in ((0, 1), (2, 1), (0, 3), (2, 3))
+            ]
+            separated = np.all([side > 0 for side in sides], axis=0) | np.all([side < 0 for side in sides], axis=0)
+            hit[i:i + step] = (overlap & ~separated).any(axis=1)
+        centers_inside = points_in_ring(self.ring, (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2)
+        return np.where(hit, BOUNDARY, np.where(centers_inside, INSIDE, OUTSIDE))
+
+    def matches(self, coords):
+        """
+        True if a path of (lng, lat) points enters the polygon.
+        """
+        if points_in_ring(self.ring, coords[:, 0], coords[:, 1]).any():
+            return True
+        segments = _segment_boxes(coords)
+        near = _overlapping(segments, self.bbox)
+        a, b = coords[:-1][near], coords[1:][near]
+        c, d = self.ring[:-1], self.ring[1:]
+        step = max(1, MAX_BATCH // len(c))
+        for i in range(0, len(a), step):
+            ax, ay = a[i:i + step, 0, None], a[i:i + step, 1, None]
+            bx, by = b[i:i + step, 0, None], b[i:i + step, 1, None]
+            crossing = (
+                (_orientation(ax, ay, bx, by, c[:, 0], c[:, 1]) * _orientation(ax, ay, bx, by, d[:, 0], d[:, 1]) <= 0)
+                & (_orientation(c[:, 0], c[:, 1], d[:, 0], d[:, 1], ax, ay) * _orientation(c[:, 0], c[:, 1], d[:, 0], d[:, 1], bx, by) <= 0)
+            )
+            overlap = (
+                (np.minimum(ax, bx) <= self.edges[:, 2]) & (np.maximum(ax, bx) >= self.edges[:, 0])
+                & (np.minimum(ay, by) <= self.edges[:, 3]) & (np.maximum(ay, by) >= self.edges[:, 1])
+            )
+            if (crossing & overlap).any():
+                return True
+        return False
+
+
+class CircleShape:
+    """
+    A circle around a (lng, lat) center. Distances are measured on a local
+    equirectangular projection, which is close to exact for radii of up to
+    a few hundred kilometres.
+    """
+
+    def __init__(self, longitude, latitude, radius_km):
+        self.center = (longitude, latitude)
+        self.radius = radius_km
+        self.scale_x = KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)
+        self.bbox = (
+            max(longitude - radius_km / self.scale_x, -180.0),
+            max(latitude - radius_km / KM_PER_DEGREE, -90.0),
+            min(longitude + radius_km / self.scale_x, 180.0),
+            min(latitude + radius_km / KM_PER_DEGREE, 90.0),
+        )
+
+    def _project(self, lngs, lats):
+        return (lngs - self.center[0]) * self.scale_x, (lats - self.center[1]) * KM_PER_DEGREE
+
+    def classify(self, boxes):
+        min_x, min_y = self._project(boxes[:, 0], boxes[:, 1])
+        max_x, max_y = self._project(boxes[:, 2], boxes[:, 3])
+        nearest = np.hypot(np.clip(0, min_x, max_x), np.clip(0, min_y, max_y))
+        farthest = np.hypot(np.maximum(-min_x, max_x), np.maximum(-min_y, max_y))
+        return np.where(nearest > self.radius, OUTSIDE, np.where(farthest <= self.radius, INSIDE, BOUNDARY))
+
+    def matches(self, coords):
+        """
+        True if a path of (lng, lat) points comes within the radius.
+        """
+        x, y = self._project(coords[:, 0], coords[:, 1])
+        if len(x) == 1:
+            return bool(np.hypot(x[0], y[0]) <= self.radius)
+        dx, dy = x[1:] - x[:-1], y[1:] - y[:-1]
+        length = dx * dx + dy * dy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.where(length > 0, -(x[:-1] * dx + y[:-1] * dy) / length, 0.0), 0.0, 1.0)
+        return bool((np.hypot(x[:-1] + t * dx, y[:-1] + t * dy) <= self.radius).any())
+
+
+def _tile_boxes(tx, ty, level):
+    width, height = 360.0 / 2 ** level, 180.0 / 2 ** level
+    return np.column_stack([tx * width - 180.0, ty * height - 90.0, (tx + 1) * width - 180.0, (ty + 1) * height - 90.0])
+
+
+def _merge(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def cover(shape, max_ranges=None):
+    """
+    Cover a shape with quadtree tiles, refining its boundary while the
+    result stays within `max_ranges` tiles. Returns (inside, boundary) as
+    lists of [start, end) cell code ranges.
+    """
+    max_ranges = max_ranges or settings.ROUTE_CELL_MAX_RANGES
+    min_lng, min_lat, max_lng, max_lat = shape.bbox
+    # Start at the deepest level where the bounding box spans at most 2x2 tiles
+    extent = max((max_lng - min_lng) / 360.0, (max_lat - min_lat) / 180.0)
+    level = CELL_LEVEL if extent <= 0 else min(CELL_LEVEL, max(0, math.floor(-math.log2(extent))))
+
+    (x0, x1), (y0, y1) = to_grid([min_lng, max_lng], [min_lat, max_lat])
+    shift = CELL_LEVEL - level
+    xs = np.arange(int(min(x0, GRID_SIZE - 1)) >> shift, (int(min(x1, GRID_SIZE - 1)) >> shift) + 1)
+    ys = np.arange(int(min(y0, GRID_SIZE - 1)) >> shift, (int(min(y1, GRID_SIZE - 1)) >> shift) + 1)
+    tx, ty = (grid.ravel() for grid in np.meshgrid(xs, ys))
+
+    inside, boundary = [], []
+    while len(tx):
+        state = shape.classify(_tile_boxes(tx, ty, CELL_LEVEL - shift))
+        starts = morton_codes(tx.astype(np.uint64), ty.astype(np.uint64)).astype(np.int64) << (2 * shift)
+        span = 1 << (2 * shift)
+        inside += [(start, start + span) for start in starts[state == INSIDE].tolist()]
+        edge = state == BOUNDARY
+        if shift == 0 or len(inside) + len(boundary) + 4 * edge.sum() > max_ranges:
+            boundary += [(start, start + span) for start in starts[edge].tolist()]
+            break
+        tx = np.repeat(tx[edge] * 2, 4) + np.tile([0, 1, 0, 1], edge.sum())
+        ty = np.repeat(ty[edge] * 2, 4) + np.tile([0, 0, 1, 1], edge.sum())
+        shift -= 1
+    return _merge(inside), _merge(boundary)
+
+
+def in_ranges(ranges):
+    """
+    Condition on `cell` matching any of the [start, end) code ranges
+    returned by cover().
+    """
+    condition = Q()
+    for start, end in ranges:
+        condition |= Q(cell__gte=start, cell__lt=end)
+    return condition
+
+
+def _id_list(ids):
+    """
+    Right-hand side for an `__in` lookup on a list of ids: a subquery on a
+    single parameter where the database supports one, else the list.
+    """
+    query = ID_LIST_QUERIES.get(connection.vendor)
+    return RawSQL(query, [json.dumps(ids)]) if query else ids
+
+
+def routes_passing(shape):
+    """
+    Condition on route ids matching the routes whose path passes through a
+    PolygonShape or CircleShape. Routes with cells inside the shape are
+    matched by a subquery. For the others, only the cells they occupy in
+    boundary tiles are loaded; the routes with none of them inside the
+    shape but some partly inside it are tested against the shape.
+    """
+    inside, boundary = cover(shape)
+    cells = RouteCell.objects.order_by()
+    inside_routes = cells.filter(in_ranges(inside)).values('route_id') if inside else cells.none().values('route_id')
+    if not boundary:
+        return Q(id__in=inside_routes)
+
+    rows = np.array(
+        cells.filter(in_ranges(boundary)).exclude(route_id__in=inside_routes).values_list('route_id', 'cell'),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    codes, row_codes = np.unique(rows[:, 1], return_inverse=True)
+    x, y = morton_decode(codes)
+    state = shape.classify(_tile_boxes(x, y, CELL_LEVEL))[row_codes]
+    matched = np.unique(rows[state == INSIDE, 0])
+    partial = np.setdiff1d(rows[state == BOUNDARY, 0], matched)
+
+    found = matched.tolist()
+    for i in range(0, len(partial), CANDIDATE_BATCH):
+        batch = Route.objects.filter(id__in=partial[i:i + CANDIDATE_BATCH].tolist()).values_list('id', 'geojson')
+        for route_id, geojson in batch:
+            lines = [np.asarray(line, dtype=np.float64) for line in extract_lines(geojson) if line]
+            if any(shape.matches(line) for line in lines):
+                found.append(route_id)
+    return Q(id__in=inside_routes) | Q(id__in=_id_list(found))
+
+
+def update_route_cells(route):
+    """
+    Bring the stored cells of a saved route up to date, writing only the
+    cells that changed. Returns the number of cells.
+    """
+    cells = set(route_cells(route.geojson).tolist())
+    with transaction.atomic():
+        stored = set(RouteCell.objects.filter(route=route).values_list('cell', flat=True))
+        if stored - cells:
+            RouteCell.objects.filter(route=route, cell__in=stored - cells).delete()
+        RouteCell.objects.bulk_create([RouteCell(route=route, cell=cell) for cell in cells - stored], batch_size=2000)
+    return len(cells)
@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+# Cache backends kept in memory and shared by all worker processes, with
+# an atomic incr
+SHARED_MEMORY_CACHE_BACKENDS = {
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+}
+
+
+def cache_is_shared_memory():
+    """
+    Whether the default cache is an in-memory cache seen by every worker
+    process, so reading it is cheaper than a database query.
+    """
+    return settings.CACHES['default']['BACKEND'] in SHARED_MEMORY_CACHE_BACKENDS
+
+
+@register()
+def check_throttle_cache(app_configs, **kwargs):
+    if settings.THROTTLE_BUCKET_STORE == 'routes.throttling.CacheBucketStore' and not cache_is_shared_memory():
+        return [Warning(
+            f"CacheBucketStore needs a cache with an atomic incr, which {settings.CACHES['default']['BACKEND']} does not have.",
+            hint='Use a Redis or Memcached CACHES backend, or routes.throttling.LocalBucketStore.',
+            id='routes.W001',
+        )]
+    return []
+
+
+@register()
+def check_geocoder_boundaries(app_configs, **kwargs):
+    path = settings.GEOCODER_BOUNDARIES_FILE
+    if not path or not Path(path).is_file():
+        return [Warning(
+            f'GEOCODER_BOUNDARIES_FILE ({path}) does not exist, so routes and locations get no countries.',
+            hint='Restore the bundled data/boundaries.geojson or point the setting at another file, then run `python manage.py geocode_countries`.',
+            id='routes.W002',
+        )]
+    return []
@@ -0,0 +1,203 @@
+"""
+Server-side clustering of POIs for map views.
+
+Every location stores `cell`, the Morton code (interleaved x/y bits) of its
+Web Mercator tile at CELL_ZOOM. Because Morton codes keep quadtree tiles
+contiguous, the POIs inside any tile at a lower zoom are a single range of
+cells, and the cell id at zoom z is just `cell >> 2 * (CELL_ZOOM - z)`.
+
+A request is answered tile by tile: the POIs of each map tile covering the
+viewport are grouped into an 8x8 grid of cells by the database and the
+result is cached per zoom, tile and POI type. Saving or deleting a POI
+drops the cached tiles containing it down to POI_CLUSTER_INVALIDATE_ZOOM;
+lower zooms, which span large parts of the table, expire after
+POI_CLUSTER_CACHE_TIMEOUT.
+"""
+import math
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Min
+
+from .models import Location
+
+
+CELL_ZOOM = 24
+MAX_ZOOM = 20
+# Each tile is split into 2**CLUSTER_LEVELS cells per side
+CLUSTER_LEVELS = 3
+MAX_LATITUDE = 85.05112878
+
+_SPREAD_MASKS = [
+    (16, 0x0000FFFF0000FFFF),
+    (8, 0x00FF00FF00FF00FF),
+    (4, 0x0F0F0F0F0F0F0F0F),
+    (2, 0x3333333333333333),
+    (1, 0x5555555555555555),
+]
+_COMPACT_MASKS = [
+    (1, 0x3333333333333333),
+    (2, 0x0F0F0F0F0F0F0F0F),
+    (4, 0x00FF00FF00FF00FF),
+    (8, 0x0000FFFF0000FFFF),
+    (16, 0x00000000FFFFFFFF),
+]
+
+
+def _spread_bits(values):
+    values = values.astype(np.uint64)
+    for shift, mask in _SPREAD_MASKS:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_codes(x, y):
+    """
+    Interleave the bits of integer x and y arrays (x in the even bits).
+    """
+    return _spread_bits(np.asarray(x)) | (_spread_bits(np.asarray(y)) << np.uint64(1))
+
+
+def _compact_bits(values):
+    values = values & np.uint64(_SPREAD_MASKS[-1][1])
+    for shift, mask in _COMPACT_MASKS:
+        values = (values | (values >> np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_decode(codes):
+    """
+    Split Morton codes back into their x and y arrays.
+    """
+    codes = np.asarray(codes).astype(np.uint64)
+    return _compact_bits(codes), _compact_bits(codes >> np.uint64(1))
+
+
+def lnglat_to_tiles(lngs, lats, zoom):
+    """
+    Web Mercator tile x and y at `zoom` for arrays of coordinates.
+    """
+    n = 2 ** zoom
+    lngs = np.asarray(lngs, dtype=np.float64)
+    lats = np.radians(np.clip(np.asarray(lats, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((lngs + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.log(np.tan(lats) + 1.0 / np.cos(lats)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.uint64), np.clip(y, 0, n - 1).astype(np.uint64)
+
+
+def encode_cells(lngs, lats):
+    """
+    Morton codes of the CELL_ZOOM tiles containing the given coordinates.
+    """
+    return morton_codes(*lnglat_to_tiles(lngs, lats, CELL_ZOOM))
+
+
+def location_cell(longitude, latitude):
+    return int(encode_cells([longitude], [latitude])[0])
+
+
+def tile_code(x, y):
+    """
+    Morton code of tile (x, y); equal to the cell id of the tile at its zoom.
+    """
+    return int(morton_codes([x], [y])[0])
+
+
+def tile_range(bbox, zoom):
+    """
+    Inclusive (min_x, max_x, min_y, max_y) of the tiles at `zoom` covering a
+    (min_lng, min_lat, max_lng, max_lat) box.
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    xs, ys = lnglat_to_tiles([min_lng, max_lng], [max_lat, min_lat], zoom)
+    return int(xs[0]), int(xs[1]), int(ys[0]), int(ys[1])
+
+
+def count_tiles(bbox, zoom):
+    min_x, max_x, min_y, max_y = tile_range(bbox, zoom)
+    return (max_x - min_x + 1) * (max_y - min_y + 1)
+
+
+def tiles_for_bbox(bbox, zoom):
+    min_x, max_x, min_y, max_y = tile_range(bbox, zoom)
+    return [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+
+def _cache_key(zoom, code, location_type):
+    return f'poi-clusters:{location_type or "all"}:{zoom}:{code}'
+
+
+def tile_clusters(zoom, x, y, location_type=None):
+    """
+    Clusters of the POIs in one tile as (latitude, longitude, count,
+    location id, location type) tuples; id and type are set for single POIs.
+    """
+    code = tile_code(x, y)
+    key = _cache_key(zoom, code, location_type)
+    clusters = cache.get(key)
+    if clusters is not None:
+        return clusters
+
+    shift = 2 * (CELL_ZOOM - zoom)
+    locations = Location.objects.filter(cell__gte=code << shift, cell__lt=(code + 1) << shift)
+    if location_type:
+        locations = locations.filter(location_type=location_type)
+    # Group by the cell at zoom + CLUSTER_LEVELS in the database; id and
+    # type are only used for groups of a single POI
+    groups = locations.order_by().annotate(
+        group=F('cell') / (1 << (shift - 2 * CLUSTER_LEVELS)),
+    ).values('group').annotate(
+        count=Count('id'),
+        lat=Avg('latitude'),
+        lng=Avg('longitude'),
+        first_id=Min('id'),
+        first_type=Min('location_type'),
+    ).order_by('group')
+
+    clusters = []
+    for row in groups:
+        single = row['count'] == 1
+        clusters.append((
+            round(row['lat'], 6),
+            round(row['lng'], 6),
+            row['count'],
+            row['first_id'] if single else None,
+            row['first_type'] if single else None,
+        ))
+    cache.set(key, clusters, settings.POI_CLUSTER_CACHE_TIMEOUT)
+    return clusters
+
+
+def clusters_for_bbox(bbox, zoom, location_type=None):
+    """
+    Clusters with their centroid inside the bounding box, as dicts.
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    results = []
+    for x, y in tiles_for_bbox(bbox, zoom):
+        for lat, lng, count, location_id, kind in tile_clusters(zoom, x, y, location_type):
+            if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                results.append({
+                    'latitude': lat,
+                    'longitude': lng,
+                    'count': count,
+                    'location': location_id,
+                    'location_type': kind,
+                })
+    return results
+
+
+def invalidate_cell(cell, location_type):
+    """
+    Drop the cached tiles containing `cell` from POI_CLUSTER_INVALIDATE_ZOOM
+    up. Lower zoom tiles cover too many POIs to recompute on every write;
+    they are refreshed when they expire.
+    """
+    if cell is None:
+        return
+    keys = []
+    for zoom in range(settings.POI_CLUSTER_INVALIDATE_ZOOM, MAX_ZOOM + 1):
+        code = cell >> 2 * (CELL_ZOOM - zoom)
+        keys += [_cache_key(zoom, code, None), _cache_key(zoom, code, location_type)]
+    cache.delete_many(keys)
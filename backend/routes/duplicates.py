@@ -0,0 +1,155 @@
+"""
+Near-duplicate route detection.
+
+Each route gets a RouteSignature: the grid cells of its endpoints, its
+bounding box and a short resampled track. Candidates are found through the
+indexed endpoint cells and confirmed with a discrete Fréchet distance on the
+resampled tracks, so a lookup never scans the routes table. The distances
+of all candidates are computed at once as a stack of NumPy matrices, and a
+direction is skipped when its endpoints alone are already too far apart.
+"""
+import math
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from .geometry import extract_coordinates, bounding_box, resample, distance_matrix_km, frechet_from_distances
+from .models import RouteSignature
+
+
+SIGNATURE_POINTS = 32
+SIGNATURE_PRECISION = 5
+CELL_DEGREES = 0.01
+CELLS_PER_ROW = round(360 / CELL_DEGREES)
+ROWS = round(180 / CELL_DEGREES)
+
+
+def grid_cell(lng, lat):
+    """
+    Return the integer id of the grid cell containing a point.
+    """
+    row = min(math.floor((lat + 90) / CELL_DEGREES), ROWS - 1)
+    col = math.floor((lng + 180) / CELL_DEGREES) % CELLS_PER_ROW
+    return row * CELLS_PER_ROW + col
+
+
+def neighbouring_cells(cell):
+    """
+    Return a cell id and the ids of its neighbours, wrapping around the
+    antimeridian. Cells at the poles have no neighbours beyond them.
+    """
+    row, col = divmod(cell, CELLS_PER_ROW)
+    return [
+        (row + d_row) * CELLS_PER_ROW + (col + d_col) % CELLS_PER_ROW
+        for d_row in (-1, 0, 1)
+        if 0 <= row + d_row < ROWS
+        for d_col in (-1, 0, 1)
+    ]
+
+
+def build_signature(geojson):
+    """
+    Compute signature fields for a GeoJSON path, or None if it has fewer
+    than two points.
+    """
+    points = extract_coordinates(geojson)
+    if len(points) < 2:
+        return None
+
+    min_lng, min_lat, max_lng, max_lat = bounding_box(points)
+    track = [
+        [round(lng, SIGNATURE_PRECISION), round(lat, SIGNATURE_PRECISION)]
+        for lng, lat in resample(points, SIGNATURE_POINTS)
+    ]
+    return {
+        'start_cell': grid_cell(*points[0]),
+        'end_cell': grid_cell(*points[-1]),
+        'min_lat': min_lat,
+        'min_lng': min_lng,
+        'max_lat': max_lat,
+        'max_lng': max_lng,
+        'start_lng': points[0][0],
+        'start_lat': points[0][1],
+        'end_lng': points[-1][0],
+        'end_lat': points[-1][1],
+        'points': track,
+    }
+
+
+def update_route_signature(route):
+    """
+    Create, refresh or remove the signature of a saved route.
+    """
+    signature = build_signature(route.geojson)
+    if signature is None:
+        RouteSignature.objects.filter(route=route).delete()
+        return None
+    obj, _ = RouteSignature.objects.update_or_create(route=route, defaults=signature)
+    return obj
+
+
+def find_duplicates(geojson, exclude_route_id=None, limit=5):
+    """
+    Return likely duplicates of a GeoJSON path as a list of
+    {'route': <id>, 'title': ..., 'distance_km': ...} ordered by distance.
+    Routes ridden in the opposite direction are matched as well.
+    """
+    signature = build_signature(geojson)
+    if signature is None:
+        return []
+
+    max_distance = settings.ROUTE_DUPLICATE_MAX_DISTANCE_KM
+    # One degree of latitude is ~111 km; longitude degrees only get shorter
+    # towards the poles, so scale the bbox tolerance accordingly.
+    lat_tolerance = max_distance / 111.0
+    cos_lat = max(math.cos(math.radians((signature['min_lat'] + signature['max_lat']) / 2)), 0.01)
+    lng_tolerance = lat_tolerance / cos_lat
+
+    starts = neighbouring_cells(signature['start_cell'])
+    ends = neighbouring_cells(signature['end_cell'])
+
+    candidates = RouteSignature.objects.filter(
+        Q(start_cell__in=starts, end_cell__in=ends) | Q(start_cell__in=ends, end_cell__in=starts),
+        min_lat__range=(signature['min_lat'] - lat_tolerance, signature['min_lat'] + lat_tolerance),
+        max_lat__range=(signature['max_lat'] - lat_tolerance, signature['max_lat'] + lat_tolerance),
+    ).select_related('route').only('route__id', 'route__title', 'points')
+    # Longitude bounds are not comparable when either box could reach across
+    # the antimeridian; the endpoint cells and the track check still apply
+    if -180 < signature['min_lng'] - lng_tolerance and signature['max_lng'] + lng_tolerance < 180:
+        candidates = candidates.filter(
+            min_lng__range=(signature['min_lng'] - lng_tolerance, signature['min_lng'] + lng_tolerance),
+            max_lng__range=(signature['max_lng'] - lng_tolerance, signature['max_lng'] + lng_tolerance),
+        )
+
+    if exclude_route_id is not None:
+        candidates = candidates.exclude(route_id=exclude_route_id)
+
+    # Tracks of one length are compared together
+    groups = {}
+    for candidate in candidates:
+        if candidate.points:
+            groups.setdefault(len(candidate.points), []).append(candidate)
+
+    matches = []
+    for group in groups.values():
+        distances = distance_matrix_km(signature['points'], [candidate.points for candidate in group])
+        # The Fréchet distance is at least that between paired endpoints;
+        # the reversed track is the same matrices with their rows reversed
+        forward = np.maximum(distances[:, 0, 0], distances[:, -1, -1]) <= max_distance
+        backward = np.maximum(distances[:, -1, 0], distances[:, 0, -1]) <= max_distance
+        best = np.full(len(group), math.inf)
+        if forward.any():
+            best[forward] = frechet_from_distances(distances[forward])
+        if backward.any():
+            best[backward] = np.minimum(best[backward], frechet_from_distances(distances[backward, ::-1]))
+        for candidate, distance in zip(group, best.tolist()):
+            if distance <= max_distance:
+                matches.append({
+                    'route': candidate.route.id,
+                    'title': candidate.route.title,
+                    'distance_km': round(distance, 3),
+                })
+
+    matches.sort(key=lambda match: match['distance_km'])
+    return matches[:limit]
@@ -0,0 +1,121 @@
+"""
+Partial edits of route geometry.
+
+A patch is a list of splice operations on the points of a route's lines,
+applied in order, each to the result of the previous one. It names the
+geometry_version it was based on; the version is bumped with a conditional
+UPDATE, so a patch based on an outdated copy is rejected with 409 instead
+of overwriting newer changes.
+
+Only the edited ranges are cleaned and measured: new points go through
+clean_line, and the route distance changes by the difference in path
+length over each edited range, including the segments joining it to the
+points around it.
+
+The rest of the derived data is not incremental. The route's cells are
+recomputed from the whole path, since a cell dropped by an edit may still
+be crossed elsewhere, but only changed cells are written. Jobs then
+refresh the signature, elevation, preview, heatmap, countries and feeds
+from the whole route, as on any save. What a patch saves is the upload,
+cleaning and measuring of the unchanged points.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .cells import update_route_cells
+from .geometry import clean_line, path_length_km
+from .models import Route
+
+
+class GeometryConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The route geometry was changed since this version.'
+    default_code = 'geometry_conflict'
+
+    def __init__(self, version):
+        super().__init__()
+        self.detail = {'detail': self.detail, 'version': version}
+
+
+def route_lines(geojson):
+    """
+    The point lists of a route's LineString or MultiLineString, which can be
+    modified in place.
+    """
+    geometry = geojson.get('geometry') if geojson.get('type') == 'Feature' else geojson
+    if not isinstance(geometry, dict) or geometry.get('type') not in ('LineString', 'MultiLineString'):
+        raise ValidationError({'geojson': "Only LineString and MultiLineString routes can be patched."})
+    if geometry['type'] == 'LineString':
+        return [geometry['coordinates']]
+    return geometry['coordinates']
+
+
+def _window(line, start, end):
+    """
+    Points [start, end) of a line and their neighbours on both sides.
+    """
+    return line[max(start - 1, 0):min(end + 1, len(line))]
+
+
+def apply_operations(geojson, operations):
+    """
+    Apply splice operations to a GeoJSON path in place. Returns the change
+    in path length (km) and a report of the points cleaning removed from
+    the new coordinates.
+    """
+    lines = route_lines(geojson)
+    precision = settings.GEOJSON_COORDINATE_PRECISION
+    min_spacing_km = settings.GEOJSON_MIN_POINT_SPACING_M / 1000
+    length_change = 0.0
+    points_before = points_after = 0
+
+    for number, operation in enumerate(operations):
+        if operation['line'] >= len(lines):
+            raise ValidationError({'operations': f"Operation {number}: line {operation['line']} does not exist."})
+        line = lines[operation['line']]
+        start, end = operation['start'], operation['end']
+        if end > len(line):
+            raise ValidationError({'operations': f"Operation {number}: range {start}-{end} is outside the line's {len(line)} points."})
+        try:
+            points = clean_line(operation['coordinates'], precision, min_spacing_km) if operation['coordinates'] else []
+        except ValueError as exc:
+            raise ValidationError({'operations': f"Operation {number}: {exc}"})
+        points_before += len(operation['coordinates'])
+        points_after += len(points)
+
+        length_change -= path_length_km(_window(line, start, end))
+        line[start:end] = points
+        length_change += path_length_km(_window(line, start, start + len(points)))
+
+    if any(len(line) < 2 for line in lines):
+        raise ValidationError({'operations': "Every line needs at least 2 points."})
+    return length_change, {
+        'points_before': points_before,
+        'points_after': points_after,
+        'removed_points': points_before - points_after,
+    }
+
+
+def patch_geometry(route_id, version, operations):
+    """
+    Apply a geometry patch based on `version` and save the route. Returns
+    the saved route and a cleanup report.
+    """
+    with transaction.atomic():
+        bumped = Route.objects.filter(pk=route_id, geometry_version=version).update(
+            geometry_version=F('geometry_version') + 1,
+        )
+        if not bumped:
+            current = Route.objects.filter(pk=route_id).values_list('geometry_version', flat=True).first()
+            raise GeometryConflict(current)
+        route = Route.objects.get(pk=route_id)
+        length_change, cleanup = apply_operations(route.geojson, operations)
+        route.distance = max(round(route.distance + length_change, 3), 0.0)
+        # Cells are updated below, no job needed
+        route._cells_updated = True
+        route.save(update_fields=['geojson', 'distance', 'updated_at'])
+        update_route_cells(route)
+    return route, cleanup
@@ -0,0 +1,164 @@
+"""
+Elevation profiles from local DEM tiles.
+
+Elevations come from SRTM-style .hgt tiles in ELEVATION_DEM_DIR: one tile
+per 1x1 degree cell, named after its south-west corner (e.g. N45E010.hgt),
+holding a square grid of big-endian 16-bit heights ordered north to south.
+Tiles are memory mapped, so only the pages touched by a route are read from
+disk, and samples are bilinearly interpolated with NumPy.
+"""
+import math
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .geometry import extract_coordinates, cumulative_distance_km
+from .models import RouteElevation
+
+
+HGT_VOID = -32768
+
+
+def tile_name(lat_key, lng_key):
+    """
+    Return the file name of the tile whose south-west corner is at
+    (lat_key, lng_key).
+    """
+    return '{}{:02d}{}{:03d}.hgt'.format(
+        'N' if lat_key >= 0 else 'S', abs(lat_key),
+        'E' if lng_key >= 0 else 'W', abs(lng_key),
+    )
+
+
+class DemSource:
+    """
+    A directory of .hgt tiles, opened lazily and kept memory mapped.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.tiles = {}
+
+    def tile(self, lat_key, lng_key):
+        key = (lat_key, lng_key)
+        if key not in self.tiles:
+            path = self.directory / tile_name(lat_key, lng_key)
+            tile = None
+            if path.exists():
+                size = math.isqrt(path.stat().st_size // 2)
+                tile = np.memmap(path, dtype='>i2', mode='r', shape=(size, size))
+            self.tiles[key] = tile
+        return self.tiles[key]
+
+    def sample(self, lngs, lats):
+        """
+        Bilinearly interpolated elevations in meters for arrays of points.
+        Points outside available tiles or on voids are NaN.
+        """
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        result = np.full(lngs.shape, np.nan)
+
+        keys = np.stack([np.floor(lats), np.floor(lngs)], axis=1).astype(np.int64)
+        unique_keys, groups = np.unique(keys, axis=0, return_inverse=True)
+        groups = groups.ravel()
+
+        for index, (lat_key, lng_key) in enumerate(unique_keys):
+            tile = self.tile(int(lat_key), int(lng_key))
+            if tile is None:
+                continue
+            mask = groups == index
+            last = tile.shape[0] - 1
+
+            rows = (lat_key + 1 - lats[mask]) * last
+            cols = (lngs[mask] - lng_key) * last
+            row0 = np.clip(np.floor(rows).astype(np.int64), 0, last - 1)
+            col0 = np.clip(np.floor(cols).astype(np.int64), 0, last - 1)
+            d_row = rows - row0
+            d_col = cols - col0
+
+            corners = [
+                tile[row0, col0], tile[row0, col0 + 1],
+                tile[row0 + 1, col0], tile[row0 + 1, col0 + 1],
+            ]
+            corners = [np.where(c == HGT_VOID, np.nan, c.astype(np.float64)) for c in corners]
+            top = corners[0] * (1 - d_col) + corners[1] * d_col
+            bottom = corners[2] * (1 - d_col) + corners[3] * d_col
+            result[mask] = top * (1 - d_row) + bottom * d_row
+
+        return result
+
+
+_source = None
+
+
+def get_dem_source():
+    """
+    Return the configured DEM source, or None if no DEM directory exists.
+    """
+    global _source
+    directory = settings.ELEVATION_DEM_DIR
+    if not directory or not Path(directory).is_dir():
+        return None
+    if _source is None or _source.directory != Path(directory):
+        _source = DemSource(directory)
+    return _source
+
+
+def compute_elevation(geojson, source=None):
+    """
+    Compute the elevation profile and statistics of a GeoJSON path.
+    Returns a dict of RouteElevation fields, or None when the path has no
+    DEM coverage.
+    """
+    source = source or get_dem_source()
+    points = extract_coordinates(geojson)
+    if source is None or len(points) < 2:
+        return None
+
+    coords = np.asarray(points, dtype=np.float64)
+    distances = cumulative_distance_km(coords[:, 0], coords[:, 1])
+    total = distances[-1]
+
+    # Resample evenly so that the statistics don't depend on how densely
+    # the original track was recorded.
+    spacing_km = settings.ELEVATION_SAMPLE_SPACING_M / 1000
+    count = int(min(settings.ELEVATION_MAX_SAMPLES, max(2, math.ceil(total / spacing_km) + 1)))
+    targets = np.linspace(0.0, total, count)
+    lngs = np.interp(targets, distances, coords[:, 0])
+    lats = np.interp(targets, distances, coords[:, 1])
+
+    elevations = source.sample(lngs, lats)
+    valid = ~np.isnan(elevations)
+    if not valid.any():
+        return None
+    targets, elevations = targets[valid], elevations[valid]
+
+    climbs = np.diff(elevations)
+    runs = np.diff(targets) * 1000
+    grades = np.divide(climbs, runs, out=np.zeros_like(climbs), where=runs > 0)
+
+    return {
+        'profile': [[round(float(d), 3), round(float(e), 1)] for d, e in zip(targets, elevations)],
+        'total_ascent': round(float(climbs[climbs > 0].sum()), 1),
+        'total_descent': round(float(-climbs[climbs < 0].sum()), 1),
+        'min_elevation': round(float(elevations.min()), 1),
+        'max_elevation': round(float(elevations.max()), 1),
+        'max_grade': round(float(np.abs(grades).max() * 100) if len(grades) else 0.0, 1),
+    }
+
+
+def update_route_elevation(route):
+    """
+    Recompute and store the elevation of a saved route. Removes stale data
+    if the new path has no DEM coverage.
+    """
+    if get_dem_source() is None:
+        return None
+    values = compute_elevation(route.geojson)
+    if values is None:
+        RouteElevation.objects.filter(route=route).delete()
+        return None
+    obj, _ = RouteElevation.objects.update_or_create(route=route, defaults=values)
+    return obj
@@ -0,0 +1,234 @@
+"""
+Personalized route feed.
+
+Each user's feed is stored as FeedEntry rows holding the top scored routes
+for that user, so reading a feed is a single indexed query. Feeds are
+rebuilt in bulk by the rebuild_route_feed command. When a route is saved
+it is only rescored for the users likely to see it: those who already have
+it in their feed and those who recently rode near it, found through the
+route cell index. A full feed drops its lowest entry for each one added.
+Users without a feed get a full one instead, when a route is saved near
+them or when they first read it.
+"""
+import heapq
+import math
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min
+from django.utils import timezone
+
+from .cells import CircleShape, cover, in_ranges
+from .geometry import haversine_km
+from .models import Route, RouteCell, RouteSignature, FeedEntry
+
+
+WEIGHTS = {
+    'motorcycle_type': 1.0,
+    'difficulty': 1.5,
+    'country': 1.0,
+    'proximity': 2.0,
+    'activity': 1.5,
+}
+
+# Route difficulties that suit each motorcycle type
+MOTORCYCLE_DIFFICULTIES = {
+    'sport': {'moderate', 'hard'},
+    'cruiser': {'easy', 'moderate'},
+    'touring': {'easy', 'moderate'},
+    'adventure': {'hard', 'expert'},
+    'naked': {'moderate', 'hard'},
+    'dual_sport': {'hard', 'expert'},
+    'scooter': {'easy'},
+    'cafe_racer': {'easy', 'moderate'},
+    'scrambler': {'moderate', 'hard'},
+}
+
+PROXIMITY_SCALE_KM = 300.0
+ACTIVITY_HALF_LIFE_DAYS = 30.0
+
+RouteFeatures = namedtuple('RouteFeatures', [
+    'id', 'creator_id', 'difficulty', 'creator_country', 'creator_motorcycle_type', 'center', 'last_activity',
+])
+UserContext = namedtuple('UserContext', ['id', 'motorcycle_type', 'country', 'difficulties', 'home'])
+
+
+def load_route_features(queryset=None):
+    """
+    Load the fields needed for scoring from a Route queryset.
+    """
+    if queryset is None:
+        queryset = Route.objects.all()
+    rows = queryset.annotate(
+        last_comment_at=Max('comments__created_at'),
+    ).values_list(
+        'id', 'creator_id', 'difficulty', 'creator__country', 'creator__motorcycle_type',
+        'signature__min_lng', 'signature__min_lat', 'signature__max_lng', 'signature__max_lat',
+        'updated_at', 'last_comment_at',
+    )
+    features = []
+    for (route_id, creator_id, difficulty, country, motorcycle_type,
+         min_lng, min_lat, max_lng, max_lat, updated_at, last_comment_at) in rows:
+        center = None
+        if min_lng is not None:
+            center = ((min_lng + max_lng) / 2, (min_lat + max_lat) / 2)
+        last_activity = max(updated_at, last_comment_at) if last_comment_at else updated_at
+        features.append(RouteFeatures(
+            route_id, creator_id, difficulty, country.lower(), motorcycle_type, center, last_activity,
+        ))
+    return features
+
+
+def load_user_contexts(user_ids=None):
+    """
+    Load each user's preferences: motorcycle type, country, preferred
+    difficulties and the average center of their own routes.
+    """
+    users = get_user_model().objects.filter(is_active=True)
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+
+    difficulty_counts = {}
+    own_routes = Route.objects.values('creator_id', 'difficulty').annotate(n=Count('id'))
+    signatures = RouteSignature.objects.values(creator_id=F('route__creator_id')).annotate(
+        lat=Avg((F('min_lat') + F('max_lat')) / 2),
+        lng=Avg((F('min_lng') + F('max_lng')) / 2),
+    )
+    if user_ids is not None:
+        own_routes = own_routes.filter(creator_id__in=user_ids)
+        signatures = signatures.filter(route__creator_id__in=user_ids)
+
+    for row in own_routes:
+        difficulty_counts.setdefault(row['creator_id'], Counter())[row['difficulty']] = row['n']
+    homes = {row['creator_id']: (row['lng'], row['lat']) for row in signatures}
+
+    contexts = []
+    for user_id, motorcycle_type, country in users.values_list('id', 'motorcycle_type', 'country'):
+        counts = difficulty_counts.get(user_id)
+        if counts:
+            difficulties = {counts.most_common(1)[0][0]}
+        else:
+            difficulties = MOTORCYCLE_DIFFICULTIES.get(motorcycle_type, set())
+        contexts.append(UserContext(user_id, motorcycle_type, country.lower(), difficulties, homes.get(user_id)))
+    return contexts
+
+
+def score_route(user, route, now):
+    """
+    Relevance of a route for a user; higher is better.
+    """
+    score = 0.0
+    if user.motorcycle_type and route.creator_motorcycle_type == user.motorcycle_type:
+        score += WEIGHTS['motorcycle_type']
+    if route.difficulty in user.difficulties:
+        score += WEIGHTS['difficulty']
+    if user.country and route.creator_country == user.country:
+        score += WEIGHTS['country']
+    if user.home and route.center:
+        distance = haversine_km(user.home[0], user.home[1], route.center[0], route.center[1])
+        score += WEIGHTS['proximity'] * math.exp(-distance / PROXIMITY_SCALE_KM)
+    age_days = max((now - route.last_activity).total_seconds() / 86400, 0.0)
+    score += WEIGHTS['activity'] * 0.5 ** (age_days / ACTIVITY_HALF_LIFE_DAYS)
+    return score
+
+
+def rebuild_feeds(user_ids=None, batch_size=1000):
+    """
+    Recompute the full feed of the given users (all users by default).
+    Returns the number of users processed.
+    """
+    feed_size = settings.ROUTE_FEED_SIZE
+    routes = load_route_features()
+    contexts = load_user_contexts(user_ids)
+    now = timezone.now()
+
+    for start in range(0, len(contexts), batch_size):
+        chunk = contexts[start:start + batch_size]
+        entries = []
+        for user in chunk:
+            top = heapq.nlargest(
+                feed_size,
+                ((score_route(user, route, now), route.id) for route in routes if route.creator_id != user.id),
+            )
+            entries.extend(FeedEntry(user_id=user.id, route_id=route_id, score=score) for score, route_id in top)
+        with transaction.atomic():
+            FeedEntry.objects.filter(user_id__in=[user.id for user in chunk]).delete()
+            FeedEntry.objects.bulk_create(entries, batch_size=batch_size)
+    return len(contexts)
+
+
+def candidate_users(route_id, center):
+    """
+    Ids of the users a saved route may be relevant to: those with the route
+    in their feed and the creators of routes updated in the last
+    ROUTE_FEED_RECENT_DAYS passing within ROUTE_FEED_NEARBY_KM of its
+    center, at most ROUTE_FEED_MAX_CANDIDATES of the latter.
+    """
+    users = set(FeedEntry.objects.filter(route_id=route_id).values_list('user_id', flat=True))
+    if center is not None:
+        inside, boundary = cover(CircleShape(center[0], center[1], settings.ROUTE_FEED_NEARBY_KM))
+        since = timezone.now() - timedelta(days=settings.ROUTE_FEED_RECENT_DAYS)
+        nearby = RouteCell.objects.filter(in_ranges(inside + boundary), route__updated_at__gte=since).exclude(
+            route_id=route_id,
+        ).order_by().values_list('route__creator_id', flat=True).distinct()
+        users.update(nearby[:settings.ROUTE_FEED_MAX_CANDIDATES])
+    return users
+
+
+def refresh_route_feed(route):
+    """
+    Rescore a single route for its candidate users and insert it into the
+    feeds it now qualifies for, dropping the lowest entry of full feeds.
+    """
+    features = load_route_features(Route.objects.filter(pk=route.pk))
+    if not features:
+        return
+    features = features[0]
+    feed_size = settings.ROUTE_FEED_SIZE
+    now = timezone.now()
+
+    user_ids = candidate_users(route.pk, features.center) - {features.creator_id}
+    if not user_ids:
+        return
+    thresholds = {
+        row['user_id']: (row['n'], row['lowest'])
+        for row in FeedEntry.objects.filter(user_id__in=user_ids).values('user_id').annotate(
+            n=Count('id'), lowest=Min('score'),
+        )
+    }
+    # A single entry would hide the default list from users without a
+    # feed, so they get a full one, which includes this route if it ranks
+    missing = user_ids - thresholds.keys()
+    if missing:
+        rebuild_feeds(missing)
+        user_ids -= missing
+        if not user_ids:
+            return
+    existing = set(FeedEntry.objects.filter(route=route).values_list('user_id', flat=True))
+
+    entries = []
+    full = []
+    for user in load_user_contexts(user_ids):
+        score = score_route(user, features, now)
+        count, lowest = thresholds.get(user.id, (0, None))
+        if user.id in existing:
+            entries.append(FeedEntry(user_id=user.id, route_id=route.pk, score=score))
+        elif count < feed_size or score > lowest:
+            entries.append(FeedEntry(user_id=user.id, route_id=route.pk, score=score))
+            if count >= feed_size:
+                full.append(user.id)
+
+    with transaction.atomic():
+        FeedEntry.objects.bulk_create(
+            entries,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['user', 'route'],
+            update_fields=['score'],
+        )
+        for user_id in full:
+            lowest = FeedEntry.objects.filter(user_id=user_id).exclude(route=route).order_by('score', 'id')
+            FeedEntry.objects.filter(pk__in=list(lowest.values_list('pk', flat=True)[:1])).delete()
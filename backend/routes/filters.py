@@ -0,0 +1,100 @@
+from django.conf import settings
+from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
+
+from .cells import CircleShape, PolygonShape, routes_passing
+from .geocoding import get_boundary_index
+from .models import Route, Location
+
+
+MAX_POLYGON_VERTICES = 200
+
+
+def normalize_country(value):
+    """
+    Country code for a code or a name known to the boundaries file.
+    """
+    index = get_boundary_index()
+    return index.normalize(value) if index else value.strip().upper()
+
+
+def _numbers(value, name, separator=','):
+    try:
+        return [float(part) for part in value.split(separator)]
+    except ValueError:
+        raise ValidationError({name: "Expected comma-separated numbers."})
+
+
+def _check_point(lng, lat, name):
+    if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+        raise ValidationError({name: "Coordinates out of range."})
+
+
+class RouteFilter(filters.FilterSet):
+    """
+    Route list filters. `country` matches routes crossing the country;
+    `bbox`, `polygon` and `circle` match routes whose path passes through
+    the area, not just routes whose bounding box overlaps it.
+    """
+    country = filters.CharFilter(method='filter_country')
+    bbox = filters.CharFilter(method='filter_bbox', help_text="min_lng,min_lat,max_lng,max_lat")
+    polygon = filters.CharFilter(method='filter_polygon', help_text="lng,lat;lng,lat;...")
+    circle = filters.CharFilter(method='filter_circle', help_text="lng,lat,radius_km")
+
+    class Meta:
+        model = Route
+        fields = ['difficulty', 'duration_days', 'country', 'bbox', 'polygon', 'circle']
+
+    def filter_country(self, queryset, name, value):
+        return queryset.filter(countries__country=normalize_country(value))
+
+    def _passing(self, queryset, shape):
+        return queryset.filter(routes_passing(shape))
+
+    def filter_bbox(self, queryset, name, value):
+        numbers = _numbers(value, name)
+        if len(numbers) != 4:
+            raise ValidationError({name: "Expected min_lng,min_lat,max_lng,max_lat."})
+        min_lng, min_lat, max_lng, max_lat = numbers
+        _check_point(min_lng, min_lat, name)
+        _check_point(max_lng, max_lat, name)
+        if min_lng >= max_lng or min_lat >= max_lat:
+            raise ValidationError({name: "Invalid bounding box."})
+        ring = [(min_lng, min_lat), (max_lng, min_lat), (max_lng, max_lat), (min_lng, max_lat)]
+        return self._passing(queryset, PolygonShape(ring))
+
+    def filter_polygon(self, queryset, name, value):
+        ring = []
+        for point in value.split(';'):
+            numbers = _numbers(point, name)
+            if len(numbers) != 2:
+                raise ValidationError({name: "Expected lng,lat pairs separated by semicolons."})
+            _check_point(*numbers, name)
+            ring.append(numbers)
+        if not 3 <= len(ring) <= MAX_POLYGON_VERTICES:
+            raise ValidationError({name: f"A polygon needs between 3 and {MAX_POLYGON_VERTICES} points."})
+        return self._passing(queryset, PolygonShape(ring))
+
+    def filter_circle(self, queryset, name, value):
+        numbers = _numbers(value, name)
+        if len(numbers) != 3:
+            raise ValidationError({name: "Expected lng,lat,radius_km."})
+        lng, lat, radius = numbers
+        _check_point(lng, lat, name)
+        if not 0 < radius <= settings.ROUTE_PASSING_MAX_RADIUS_KM:
+            raise ValidationError({name: f"Radius must be between 0 and {settings.ROUTE_PASSING_MAX_RADIUS_KM} km."})
+        return self._passing(queryset, CircleShape(lng, lat, radius))
+
+
+class LocationFilter(filters.FilterSet):
+    """
+    Location list filters.
+    """
+    country = filters.CharFilter(method='filter_country')
+
+    class Meta:
+        model = Location
+        fields = ['location_type', 'route', 'country']
+
+    def filter_country(self, queryset, name, value):
+        return queryset.filter(country=normalize_country(value))
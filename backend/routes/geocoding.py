@@ -0,0 +1,243 @@
+"""
+Offline reverse geocoding to countries.
+
+Boundaries come from a local GeoJSON FeatureCollection of (Multi)Polygons
+(GEOCODER_BOUNDARIES_FILE, e.g. Natural Earth admin 0 countries), with the
+country code and name in the GEOCODER_CODE_PROPERTY and
+GEOCODER_NAME_PROPERTY properties. No network geocoder is used.
+
+Polygon bounding boxes are packed into a static R-tree (sort-tile-recursive
+order, NODE_SIZE entries per node). Lookups walk the tree with whole arrays
+of points at once, and the candidate polygons are tested with a vectorized
+ray-casting (even-odd) test.
+"""
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .geometry import extract_coordinates, cumulative_distance_km
+from .models import RouteCountry
+
+
+NODE_SIZE = 16
+# Bound on points x edges compared at once by the ray-casting test
+MAX_BATCH = 1_000_000
+
+
+class RTree:
+    """
+    Static packed R-tree over (min_x, min_y, max_x, max_y) boxes.
+    """
+
+    def __init__(self, boxes, node_size=NODE_SIZE):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.node_size = node_size
+        self.items = self._str_order(boxes)
+        # levels[0] holds the item boxes in tree order; each entry of
+        # levels[k] covers node_size consecutive entries of levels[k - 1]
+        self.levels = [boxes[self.items]]
+        while len(self.levels[-1]) > node_size:
+            below = self.levels[-1]
+            starts = np.arange(0, len(below), node_size)
+            self.levels.append(np.column_stack([
+                np.minimum.reduceat(below[:, 0], starts),
+                np.minimum.reduceat(below[:, 1], starts),
+                np.maximum.reduceat(below[:, 2], starts),
+                np.maximum.reduceat(below[:, 3], starts),
+            ]))
+
+    def _str_order(self, boxes):
+        """
+        Sort-tile-recursive order: vertical slices by x center, each sorted
+        by y center, so neighbouring entries are close in space.
+        """
+        count = len(boxes)
+        if count == 0:
+            return np.zeros(0, dtype=np.int64)
+        centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+        centers_y = (boxes[:, 1] + boxes[:, 3]) / 2
+        leaves = math.ceil(count / self.node_size)
+        slice_size = math.ceil(math.sqrt(leaves)) * self.node_size
+        by_x = np.argsort(centers_x, kind='stable')
+        order = [
+            chunk[np.argsort(centers_y[chunk], kind='stable')]
+            for chunk in (by_x[i:i + slice_size] for i in range(0, count, slice_size))
+        ]
+        return np.concatenate(order)
+
+    def query_points(self, xs, ys):
+        """
+        Yield (item index, indices of the points inside its box).
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if not len(self.items) or not len(xs):
+            return
+        top = len(self.levels) - 1
+        stack = [(top, 0, len(self.levels[top]), np.arange(len(xs)))]
+        while stack:
+            level, start, end, points = stack.pop()
+            boxes = self.levels[level]
+            px, py = xs[points], ys[points]
+            for entry in range(start, end):
+                min_x, min_y, max_x, max_y = boxes[entry]
+                inside = points[(px >= min_x) & (px <= max_x) & (py >= min_y) & (py <= max_y)]
+                if not len(inside):
+                    continue
+                if level == 0:
+                    yield int(self.items[entry]), inside
+                else:
+                    first = entry * self.node_size
+                    stack.append((level - 1, first, min(first + self.node_size, len(self.levels[level - 1])), inside))
+
+
+def points_in_ring(ring, xs, ys):
+    """
+    Even-odd ray-casting test of points against a closed ring, vectorized
+    over points and edges.
+    """
+    x1, y1 = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    inside = np.zeros(len(xs), dtype=bool)
+    step = max(1, MAX_BATCH // max(len(x1), 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(0, len(xs), step):
+            px = xs[i:i + step, None]
+            py = ys[i:i + step, None]
+            straddles = (y1 > py) != (y2 > py)
+            crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            inside[i:i + step] = np.count_nonzero(straddles & (px < crossing_x), axis=1) % 2 == 1
+    return inside
+
+
+def _closed_ring(coordinates):
+    ring = np.asarray(coordinates, dtype=np.float64)[:, :2]
+    if not np.array_equal(ring[0], ring[-1]):
+        ring = np.vstack([ring, ring[:1]])
+    return ring
+
+
+class BoundaryIndex:
+    """
+    Country polygons with an R-tree over their bounding boxes.
+    """
+
+    def __init__(self, countries, polygons, path=None):
+        # countries: [(code, name)]; polygons: [(country index, [rings])]
+        self.path = path
+        self.countries = countries
+        self.polygons = polygons
+        self.codes_by_name = {name.lower(): code for code, name in countries}
+        self.tree = RTree([
+            (rings[0][:, 0].min(), rings[0][:, 1].min(), rings[0][:, 0].max(), rings[0][:, 1].max())
+            for _, rings in polygons
+        ])
+
+    @classmethod
+    def from_geojson(cls, path):
+        with open(path, encoding='utf-8') as f:
+            collection = json.load(f)
+        countries = []
+        polygons = []
+        for feature in collection.get('features', []):
+            properties = feature.get('properties') or {}
+            code = str(properties.get(settings.GEOCODER_CODE_PROPERTY) or '').upper()
+            geometry = feature.get('geometry') or {}
+            if not code or code == '-99' or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+                continue
+            countries.append((code, str(properties.get(settings.GEOCODER_NAME_PROPERTY) or code)))
+            parts = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+            for part in parts:
+                rings = [_closed_ring(ring) for ring in part if len(ring) >= 3]
+                if rings:
+                    polygons.append((len(countries) - 1, rings))
+        return cls(countries, polygons, Path(path))
+
+    def normalize(self, country):
+        """
+        Country code for a code or name, e.g. 'it' or 'Italy' -> 'IT'.
+        """
+        country = country.strip()
+        return self.codes_by_name.get(country.lower(), country.upper())
+
+    def locate(self, lngs, lats):
+        """
+        Country code of each point, or None outside all boundaries.
+        """
+        xs = np.asarray(lngs, dtype=np.float64)
+        ys = np.asarray(lats, dtype=np.float64)
+        result = [None] * len(xs)
+        for polygon, candidates in self.tree.query_points(xs, ys):
+            country, rings = self.polygons[polygon]
+            cx, cy = xs[candidates], ys[candidates]
+            inside = points_in_ring(rings[0], cx, cy)
+            for hole in rings[1:]:
+                if inside.any():
+                    inside &= ~points_in_ring(hole, cx, cy)
+            for point in candidates[inside].tolist():
+                result[point] = self.countries[country][0]
+        return result
+
+
+_index = None
+
+
+def get_boundary_index():
+    """
+    Return the boundary index, or None if no boundaries file exists.
+    """
+    global _index
+    path = settings.GEOCODER_BOUNDARIES_FILE
+    if not path or not Path(path).is_file():
+        return None
+    if _index is None or _index.path != Path(path):
+        _index = BoundaryIndex.from_geojson(path)
+    return _index
+
+
+def location_country(longitude, latitude, index=None):
+    index = index or get_boundary_index()
+    if index is None:
+        return ''
+    return index.locate([longitude], [latitude])[0] or ''
+
+
+def route_countries(geojson, index=None):
+    """
+    Codes of the countries a path crosses, in the order it enters them.
+    The path is sampled every GEOCODER_ROUTE_SPACING_KM.
+    """
+    index = index or get_boundary_index()
+    points = extract_coordinates(geojson)
+    if index is None or not points:
+        return []
+
+    coords = np.asarray(points, dtype=np.float64)
+    distances = cumulative_distance_km(coords[:, 0], coords[:, 1])
+    count = max(2, math.ceil(distances[-1] / settings.GEOCODER_ROUTE_SPACING_KM) + 1)
+    targets = np.linspace(0.0, distances[-1], count)
+    lngs = np.concatenate([coords[:, 0], np.interp(targets, distances, coords[:, 0])])
+    lats = np.concatenate([coords[:, 1], np.interp(targets, distances, coords[:, 1])])
+    order = np.argsort(np.concatenate([distances, targets]), kind='stable')
+
+    codes = index.locate(lngs[order], lats[order])
+    return list(dict.fromkeys(code for code in codes if code))
+
+
+def update_route_countries(route, index=None):
+    """
+    Replace the stored countries of a saved route. Returns the codes, or
+    None if no boundaries file is configured.
+    """
+    index = index or get_boundary_index()
+    if index is None:
+        return None
+    codes = route_countries(route.geojson, index)
+    RouteCountry.objects.filter(route=route).delete()
+    RouteCountry.objects.bulk_create([
+        RouteCountry(route=route, country=code, position=position) for position, code in enumerate(codes)
+    ])
+    return codes
@@ -0,0 +1,209 @@
+"""
+Geometry helpers for route GeoJSON data.
+
+Coordinates follow the GeoJSON convention of (longitude, latitude) pairs.
+"""
+import math
+
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def extract_lines(geojson):
+    """
+    Return the lines of a route's GeoJSON path, each a list of (lng, lat)
+    pairs.
+
+    Supports LineString and MultiLineString geometries, optionally wrapped
+    in a Feature. Malformed points are skipped.
+    """
+    if not isinstance(geojson, dict):
+        return []
+
+    if geojson.get('type') == 'Feature':
+        return extract_lines(geojson.get('geometry'))
+
+    coordinates = geojson.get('coordinates') or []
+    if geojson.get('type') == 'MultiLineString':
+        lines = coordinates
+    else:
+        lines = [coordinates]
+
+    result = []
+    for line in lines:
+        if not isinstance(line, (list, tuple)):
+            continue
+        points = []
+        for point in line:
+            try:
+                points.append((float(point[0]), float(point[1])))
+            except (TypeError, ValueError, IndexError):
+                continue
+        result.append(points)
+    return result
+
+
+def extract_coordinates(geojson):
+    """
+    Return the (lng, lat) pairs of a route's GeoJSON path, all lines joined.
+    """
+    return [point for line in extract_lines(geojson) for point in line]
+
+
+def haversine_km(lng1, lat1, lng2, lat2):
+    """
+    Great-circle distance between two points in kilometers.
+    """
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    d_lat = lat2_rad - lat1_rad
+    d_lng = math.radians(lng2 - lng1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def path_length_km(points):
+    """
+    Total length of a path in kilometers.
+    """
+    return sum(
+        haversine_km(a[0], a[1], b[0], b[1])
+        for a, b in zip(points, points[1:])
+    )
+
+
+def bounding_box(points):
+    """
+    Return (min_lng, min_lat, max_lng, max_lat) for a list of points.
+    """
+    lngs = [p[0] for p in points]
+    lats = [p[1] for p in points]
+    return min(lngs), min(lats), max(lngs), max(lats)
+
+
+def resample(points, count):
+    """
+    Resample a path to `count` points spaced evenly along its length.
+    Segments crossing the antimeridian are interpolated across it.
+    """
+    if len(points) < 2 or count < 2:
+        return list(points[:count])
+
+    cumulative = [0.0]
+    for a, b in zip(points, points[1:]):
+        cumulative.append(cumulative[-1] + haversine_km(a[0], a[1], b[0], b[1]))
+
+    total = cumulative[-1]
+    if total == 0:
+        return [points[0]] * count
+
+    result = []
+    segment = 0
+    for i in range(count):
+        target = total * i / (count - 1)
+        while segment < len(points) - 2 and cumulative[segment + 1] < target:
+            segment += 1
+        start, end = points[segment], points[segment + 1]
+        span = cumulative[segment + 1] - cumulative[segment]
+        ratio = (target - cumulative[segment]) / span if span else 0.0
+        d_lng = (end[0] - start[0] + 180) % 360 - 180
+        result.append((
+            (start[0] + d_lng * ratio + 180) % 360 - 180,
+            start[1] + (end[1] - start[1]) * ratio,
+        ))
+    return result
+
+
+def distance_matrix_km(p, q):
+    """
+    Great-circle distances in kilometers between every point of path `p`
+    (rows) and every point of path `q` (columns). `q` may be a stack of
+    paths of equal length, giving a stack of matrices.
+    """
+    p = np.radians(np.asarray(p, dtype=np.float64)[:, :2])
+    q = np.radians(np.asarray(q, dtype=np.float64)[..., :2])
+    d_lat = q[..., None, :, 1] - p[:, None, 1]
+    d_lng = q[..., None, :, 0] - p[:, None, 0]
+    a = np.sin(d_lat / 2) ** 2 + np.cos(p[:, None, 1]) * np.cos(q[..., None, :, 1]) * np.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def frechet_from_distances(distances):
+    """
+    Discrete Fréchet distances from a distance matrix or a stack of them,
+    filled one anti-diagonal at a time for the whole stack.
+    """
+    *stack, rows, cols = distances.shape
+    # Coupling distances, offset by one with an infinite border
+    coupling = np.full((*stack, rows + 1, cols + 1), math.inf)
+    coupling[..., 0, 0] = 0.0
+    for k in range(rows + cols - 1):
+        i = np.arange(max(0, k - cols + 1), min(rows - 1, k) + 1)
+        j = k - i
+        best = np.minimum(np.minimum(coupling[..., i, j + 1], coupling[..., i, j]), coupling[..., i + 1, j])
+        coupling[..., i + 1, j + 1] = np.maximum(best, distances[..., i, j])
+    return coupling[..., rows, cols]
+
+
+def discrete_frechet_km(p, q):
+    """
+    Discrete Fréchet distance between two paths in kilometers.
+    """
+    if not len(p) or not len(q):
+        return math.inf
+    return float(frechet_from_distances(distance_matrix_km(p, q)))
+
+
+def cumulative_distance_km(lngs, lats):
+    """
+    Cumulative great-circle distance along a path, vectorized over NumPy
+    arrays. The first element is always 0.
+    """
+    lat_rad = np.radians(lats)
+    d_lat = np.diff(lat_rad)
+    d_lng = np.radians(np.diff(lngs))
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat_rad[:-1]) * np.cos(lat_rad[1:]) * np.sin(d_lng / 2) ** 2
+    steps = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+    return np.concatenate(([0.0], np.cumsum(steps)))
+
+
+def clean_line(coordinates, precision, min_spacing_km):
+    """
+    Validate, quantize and thin the coordinates of a single line.
+
+    Longitude/latitude are rounded to `precision` decimals, and points are
+    kept only when the path has advanced by at least `min_spacing_km` since
+    the previous kept point, which drops duplicates and the jitter recorded
+    while stationary. The first and last points are always kept. Raises
+    ValueError for malformed or out-of-range coordinates.
+    """
+    try:
+        points = np.array(coordinates, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("Coordinates must be arrays of numbers.")
+    if points.ndim != 2 or points.shape[1] not in (2, 3):
+        raise ValueError("Each coordinate must be [longitude, latitude] or [longitude, latitude, altitude].")
+    if not np.isfinite(points).all():
+        raise ValueError("Coordinates must be finite numbers.")
+    out_of_range = (np.abs(points[:, 0]) > 180) | (np.abs(points[:, 1]) > 90)
+    if out_of_range.any():
+        raise ValueError(f"Coordinate {int(np.argmax(out_of_range))} is out of range.")
+
+    points[:, :2] = np.round(points[:, :2], precision)
+    if len(points) > 2:
+        distances = cumulative_distance_km(points[:, 0], points[:, 1]).tolist()
+        kept, last = [0], distances[0]
+        for i, distance in enumerate(distances[1:-1], 1):
+            if distance > last and distance - last >= min_spacing_km:
+                kept.append(i)
+                last = distance
+        # The last point always stays; it replaces the previous kept point
+        # if that one is closer than `min_spacing_km` to it.
+        end = distances[-1]
+        if len(kept) > 1 and (end == last or end - last < min_spacing_km):
+            kept.pop()
+        kept.append(len(points) - 1)
+        points = points[kept]
+    return points.tolist()
@@ -0,0 +1,276 @@
+"""
+Route density heatmap.
+
+The heatmap layer has a grid of HEATMAP_TILE_BINS x HEATMAP_TILE_BINS bins
+per Web Mercator tile at each zoom up to HEATMAP_MAX_ZOOM. A bin counts the
+routes passing through it, each route once.
+
+A route's path is resampled at a fraction of the bin size and binned at
+HEATMAP_MAX_ZOOM. Bins at lower zooms are the same codes shifted right, so
+one rasterization gives the bins at every zoom. These codes are kept per
+route as a HeatmapContribution; when the route changes or is deleted its
+old bins are subtracted and the new ones added, touching only the tiles
+they fall in. Tiles are stored as zlib-compressed int32 grids and rendered
+to PNG on request.
+
+While `rebuild_heatmap` runs, refresh jobs skip their update; the command
+replays the routes of those jobs once it is done.
+"""
+import io
+import math
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from .clusters import MAX_LATITUDE
+from .geometry import EARTH_RADIUS_KM, cumulative_distance_km
+from .models import HeatmapTile, HeatmapContribution
+
+
+TILE_SIZE = 256
+# Tiles read or written per query
+TILE_BATCH = 200
+# Color ramp from sparse to dense, as (position, R, G, B, A)
+COLOR_STOPS = np.array([
+    (0.0, 30, 60, 200, 0),
+    (0.2, 50, 100, 255, 140),
+    (0.5, 255, 200, 0, 200),
+    (1.0, 255, 40, 20, 255),
+])
+PEAK_CACHE_SECONDS = 60
+REBUILD_KEY = 'heatmap-rebuild'
+# The rebuild renews its flag after every batch; this only matters if it dies
+REBUILD_FLAG_SECONDS = 10 * 60
+
+
+def grid_size(zoom):
+    """
+    Bins per side of the whole map at `zoom`.
+    """
+    return 2 ** zoom * settings.HEATMAP_TILE_BINS
+
+
+def _lines(geojson):
+    if not isinstance(geojson, dict):
+        return []
+    if geojson.get('type') == 'Feature':
+        return _lines(geojson.get('geometry'))
+    coordinates = geojson.get('coordinates') or []
+    if geojson.get('type') == 'MultiLineString':
+        return coordinates
+    if geojson.get('type') == 'LineString':
+        return [coordinates]
+    return []
+
+
+def _densify(line, spacing_km):
+    """
+    Points along a line no more than about `spacing_km` apart. Segments
+    crossing the antimeridian take the short way across it.
+    """
+    coords = np.asarray(line, dtype=np.float64)[:, :2]
+    if len(coords) < 2:
+        return coords
+    # Continuous longitudes (e.g. 179 -> 181 instead of 179 -> -179), wrapped back after resampling
+    lngs = np.unwrap(coords[:, 0], period=360.0)
+    distances = cumulative_distance_km(lngs, coords[:, 1])
+    count = max(2, math.ceil(distances[-1] / spacing_km) + 1)
+    targets = np.linspace(0.0, distances[-1], count)
+    return np.column_stack([
+        (np.interp(targets, distances, lngs) + 180.0) % 360.0 - 180.0,
+        np.interp(targets, distances, coords[:, 1]),
+    ])
+
+
+def route_bins(geojson):
+    """
+    Sorted codes (x << 32 | y) of the HEATMAP_MAX_ZOOM bins a path passes
+    through.
+    """
+    size = grid_size(settings.HEATMAP_MAX_ZOOM)
+    bin_km = 2 * math.pi * EARTH_RADIUS_KM / size
+    codes = []
+    for line in _lines(geojson):
+        try:
+            coords = np.asarray(line, dtype=np.float64)[:, :2]
+        except (TypeError, ValueError, IndexError):
+            continue
+        if not len(coords) or not np.isfinite(coords).all():
+            continue
+        # Bins shrink with the cosine of the latitude on the Mercator map
+        scale = max(math.cos(math.radians(min(np.abs(coords[:, 1]).max(), MAX_LATITUDE))), 0.05)
+        points = _densify(coords, bin_km * scale / 2)
+        lats = np.radians(np.clip(points[:, 1], -MAX_LATITUDE, MAX_LATITUDE))
+        x = np.floor((points[:, 0] + 180.0) / 360.0 * size)
+        y = np.floor((1.0 - np.log(np.tan(lats) + 1.0 / np.cos(lats)) / math.pi) / 2.0 * size)
+        x = np.clip(x, 0, size - 1).astype(np.uint64)
+        y = np.clip(y, 0, size - 1).astype(np.uint64)
+        codes.append((x << np.uint64(32)) | y)
+    if not codes:
+        return np.zeros(0, dtype=np.uint64)
+    return np.unique(np.concatenate(codes))
+
+
+def pack_bins(codes):
+    return zlib.compress(np.asarray(codes, dtype='<u8').tobytes())
+
+
+def unpack_bins(data):
+    return np.frombuffer(zlib.decompress(bytes(data)), dtype='<u8').astype(np.uint64)
+
+
+def pack_counts(counts):
+    return zlib.compress(np.asarray(counts, dtype='<i4').tobytes())
+
+
+def unpack_counts(data):
+    bins = settings.HEATMAP_TILE_BINS
+    return np.frombuffer(zlib.decompress(bytes(data)), dtype='<i4').reshape(bins, bins).astype(np.int64)
+
+
+def accumulate(grids, codes, sign=1):
+    """
+    Add (or with sign=-1 subtract) one route's bins to `grids`, a dict of
+    (zoom, x, y) -> flat count array, at every zoom.
+    """
+    if not len(codes):
+        return grids
+    bins = settings.HEATMAP_TILE_BINS
+    max_zoom = settings.HEATMAP_MAX_ZOOM
+    xs = codes >> np.uint64(32)
+    ys = codes & np.uint64(0xFFFFFFFF)
+    for zoom in range(max_zoom + 1):
+        tiles_per_side = 2 ** zoom
+        shift = np.uint64(max_zoom - zoom)
+        # A route counts once per bin, however many finer bins it crosses
+        level = np.unique(((xs >> shift) << np.uint64(32)) | (ys >> shift))
+        bx = (level >> np.uint64(32)).astype(np.int64)
+        by = (level & np.uint64(0xFFFFFFFF)).astype(np.int64)
+        tiles = (bx // bins) * tiles_per_side + by // bins
+        cells = (by % bins) * bins + bx % bins
+        order = np.argsort(tiles, kind='stable')
+        tiles, cells = tiles[order], cells[order]
+        unique_tiles, starts = np.unique(tiles, return_index=True)
+        for tile, tile_cells in zip(unique_tiles.tolist(), np.split(cells, starts[1:])):
+            key = (zoom, tile // tiles_per_side, tile % tiles_per_side)
+            grid = grids.get(key)
+            if grid is None:
+                grid = grids[key] = np.zeros(bins * bins, dtype=np.int64)
+            grid += sign * np.bincount(tile_cells, minlength=bins * bins)
+    return grids
+
+
+def write_tiles(grids):
+    """
+    Add accumulated grids to the stored tiles, dropping tiles left empty.
+    """
+    bins = settings.HEATMAP_TILE_BINS
+    now = timezone.now()
+    keys = list(grids)
+    with transaction.atomic():
+        for i in range(0, len(keys), TILE_BATCH):
+            batch = keys[i:i + TILE_BATCH]
+            lookup = Q()
+            for zoom, x, y in batch:
+                lookup |= Q(zoom=zoom, x=x, y=y)
+            stored = {
+                (tile.zoom, tile.x, tile.y): tile
+                for tile in HeatmapTile.objects.select_for_update().filter(lookup)
+            }
+            created, updated, emptied = [], [], []
+            for key in batch:
+                tile = stored.get(key)
+                counts = grids[key].reshape(bins, bins)
+                if tile is not None:
+                    counts = counts + unpack_counts(tile.counts)
+                counts = np.maximum(counts, 0)
+                peak = int(counts.max())
+                if not peak:
+                    if tile is not None:
+                        emptied.append(tile.pk)
+                    continue
+                if tile is None:
+                    zoom, x, y = key
+                    created.append(HeatmapTile(zoom=zoom, x=x, y=y, counts=pack_counts(counts), peak=peak))
+                else:
+                    tile.counts = pack_counts(counts)
+                    tile.peak = peak
+                    tile.updated_at = now
+                    updated.append(tile)
+            HeatmapTile.objects.bulk_create(created)
+            HeatmapTile.objects.bulk_update(updated, ['counts', 'peak', 'updated_at'])
+            HeatmapTile.objects.filter(pk__in=emptied).delete()
+    cache.delete_many([f'heatmap-peak:{zoom}' for zoom in {zoom for zoom, _, _ in keys}])
+
+
+def update_route_heatmap(route_id, geojson):
+    """
+    Replace a route's contribution to the heatmap with the bins of
+    `geojson`, or remove it if the route is gone (geojson None). Returns
+    the number of tiles changed.
+    """
+    with transaction.atomic():
+        contribution = HeatmapContribution.objects.select_for_update().filter(route_id=route_id).first()
+        old = unpack_bins(contribution.bins) if contribution else np.zeros(0, dtype=np.uint64)
+        new = route_bins(geojson) if geojson is not None else np.zeros(0, dtype=np.uint64)
+        if np.array_equal(old, new):
+            return 0
+        grids = accumulate({}, new)
+        accumulate(grids, old, sign=-1)
+        changed = {key: grid for key, grid in grids.items() if grid.any()}
+        write_tiles(changed)
+        if len(new):
+            HeatmapContribution.objects.update_or_create(route_id=route_id, defaults={'bins': pack_bins(new)})
+        elif contribution:
+            contribution.delete()
+    return len(changed)
+
+
+def rebuilding():
+    return bool(cache.get(REBUILD_KEY))
+
+
+def zoom_peak(zoom):
+    """
+    Highest count of any tile at `zoom`, which the color ramp is scaled to.
+    """
+    key = f'heatmap-peak:{zoom}'
+    peak = cache.get(key)
+    if peak is None:
+        peak = HeatmapTile.objects.filter(zoom=zoom).aggregate(peak=Max('peak'))['peak'] or 0
+        cache.set(key, peak, PEAK_CACHE_SECONDS)
+    return peak
+
+
+def render_tile(counts, peak):
+    """
+    PNG of a count grid, colored on a log scale up to `peak`.
+    """
+    intensity = np.log1p(counts) / math.log1p(max(peak, 1))
+    rgba = np.stack([
+        np.interp(intensity, COLOR_STOPS[:, 0], COLOR_STOPS[:, channel])
+        for channel in range(1, 5)
+    ], axis=-1)
+    rgba[counts == 0] = 0
+    # Scale with premultiplied alpha so empty bins do not darken the edges
+    image = PILImage.fromarray(rgba.round().astype(np.uint8), 'RGBA').convert('RGBa')
+    image = image.resize((TILE_SIZE, TILE_SIZE), PILImage.Resampling.BILINEAR).convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def tile_png(zoom, x, y):
+    """
+    PNG of a heatmap tile; transparent where no route passes.
+    """
+    tile = HeatmapTile.objects.filter(zoom=zoom, x=x, y=y).only('counts').first()
+    bins = settings.HEATMAP_TILE_BINS
+    counts = unpack_counts(tile.counts) if tile else np.zeros((bins, bins), dtype=np.int64)
+    return render_tile(counts, zoom_peak(zoom))
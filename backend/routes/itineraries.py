@@ -0,0 +1,208 @@
+"""
+Multi-day itinerary planner.
+
+Routes are nodes of an in-memory graph; two routes connect when the end of
+one lies within a gap distance of the start of the next. Endpoints are kept
+in a uniform grid so neighbours are found without scanning all routes. The
+graph is built lazily once per process from the route signatures' stored
+endpoints, updated incrementally by route signals and rebuilt in a
+background thread after ITINERARY_GRAPH_TTL seconds, so changes handled by
+other worker processes are picked up without a request waiting for the
+database.
+"""
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+from .geometry import extract_coordinates, haversine_km
+from .models import Route
+
+
+DIFFICULTY_RANK = {'easy': 1, 'moderate': 2, 'hard': 3, 'expert': 4}
+BEAM_WIDTH = 100
+
+logger = logging.getLogger(__name__)
+
+RouteNode = namedtuple('RouteNode', ['id', 'title', 'start', 'end', 'distance', 'days', 'difficulty'])
+Leg = namedtuple('Leg', ['node', 'reversed', 'gap_km'])
+
+
+def _node(route_id, title, start, end, distance, duration_days, difficulty):
+    return RouteNode(route_id, title, tuple(start), tuple(end), distance, duration_days or 1, difficulty)
+
+
+class RouteGraph:
+    """
+    Route endpoints indexed in a grid of `cell_km` sized cells.
+    """
+
+    def __init__(self, cell_km):
+        self.cell_degrees = cell_km / 111.0
+        self.nodes = {}
+        self.grid = defaultdict(set)
+        self.built_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _cell(self, point):
+        return (math.floor(point[1] / self.cell_degrees), math.floor(point[0] / self.cell_degrees))
+
+    def add(self, node):
+        with self.lock:
+            self._remove(node.id)
+            self.nodes[node.id] = node
+            self.grid[self._cell(node.start)].add((node.id, False))
+            self.grid[self._cell(node.end)].add((node.id, True))
+
+    def remove(self, route_id):
+        with self.lock:
+            self._remove(route_id)
+
+    def _remove(self, route_id):
+        node = self.nodes.pop(route_id, None)
+        if node is None:
+            return
+        self.grid[self._cell(node.start)].discard((node.id, False))
+        self.grid[self._cell(node.end)].discard((node.id, True))
+
+    def nearby(self, point, radius_km):
+        """
+        Return (node, reversed, distance_km) for every route with an
+        endpoint within `radius_km` of `point`. `reversed` is True when the
+        route has to be ridden from its end to its start.
+        """
+        lat_cells = math.ceil(radius_km / 111.0 / self.cell_degrees)
+        cos_lat = max(math.cos(math.radians(point[1])), 0.01)
+        lng_cells = math.ceil(radius_km / 111.0 / cos_lat / self.cell_degrees)
+        row, col = self._cell(point)
+
+        with self.lock:
+            candidates = [
+                (self.nodes[route_id], is_end)
+                for d_row in range(-lat_cells, lat_cells + 1)
+                for d_col in range(-lng_cells, lng_cells + 1)
+                for route_id, is_end in self.grid.get((row + d_row, col + d_col), ())
+            ]
+
+        results = []
+        for node, is_end in candidates:
+            endpoint = node.end if is_end else node.start
+            distance = haversine_km(point[0], point[1], endpoint[0], endpoint[1])
+            if distance <= radius_km:
+                results.append((node, is_end, distance))
+        return results
+
+    def plan(self, start, days, max_gap_km, max_difficulty=None, limit=5):
+        """
+        Return up to `limit` itineraries (lists of Legs) starting near
+        `start` and fitting in `days`, best first.
+        """
+        max_rank = DIFFICULTY_RANK.get(max_difficulty, max(DIFFICULTY_RANK.values()))
+
+        def expand(point, used, days_left):
+            for node, is_reversed, gap in self.nearby(point, max_gap_km):
+                if node.id in used or node.days > days_left:
+                    continue
+                if DIFFICULTY_RANK.get(node.difficulty, 0) > max_rank:
+                    continue
+                yield Leg(node, is_reversed, gap)
+
+        # Beam search: each state is (legs, used ids, days used, distance)
+        states = [((), frozenset(), 0, 0.0)]
+        itineraries = []
+        for _ in range(days):
+            candidates = []
+            for legs, used, days_used, distance in states:
+                point = start if not legs else (legs[-1].node.start if legs[-1].reversed else legs[-1].node.end)
+                for leg in expand(point, used, days - days_used):
+                    candidates.append((
+                        legs + (leg,),
+                        used | {leg.node.id},
+                        days_used + leg.node.days,
+                        distance + leg.node.distance,
+                    ))
+            if not candidates:
+                break
+            candidates.sort(key=lambda state: _rank(state[0]))
+            states = candidates[:BEAM_WIDTH]
+            itineraries.extend(state[0] for state in states)
+
+        itineraries.sort(key=_rank)
+        return itineraries[:limit]
+
+
+def _rank(legs):
+    """
+    Sort key: longest total distance first, then easier, then tighter links.
+    """
+    distance = sum(leg.node.distance for leg in legs)
+    difficulty = sum(DIFFICULTY_RANK.get(leg.node.difficulty, 0) for leg in legs) / len(legs)
+    gaps = sum(leg.gap_km for leg in legs)
+    return (-distance, difficulty, gaps)
+
+
+_graph = None
+_graph_lock = threading.Lock()
+_rebuilding = False
+
+
+def build_graph():
+    graph = RouteGraph(cell_km=settings.ITINERARY_MAX_GAP_KM)
+    rows = Route.objects.filter(signature__isnull=False).values_list(
+        'id', 'title', 'signature__start_lng', 'signature__start_lat', 'signature__end_lng', 'signature__end_lat',
+        'distance', 'duration_days', 'difficulty',
+    )
+    for route_id, title, start_lng, start_lat, end_lng, end_lat, *fields in rows.iterator(chunk_size=2000):
+        graph.add(_node(route_id, title, (start_lng, start_lat), (end_lng, end_lat), *fields))
+    return graph
+
+
+def _rebuild():
+    global _graph, _rebuilding
+    try:
+        graph = build_graph()
+        with _graph_lock:
+            _graph = graph
+    except Exception:
+        logger.exception('Rebuilding the itinerary graph failed')
+    finally:
+        _rebuilding = False
+
+
+def get_graph():
+    """
+    Return the process-wide route graph, building it if needed. An expired
+    graph is still used while a fresh one is built in the background.
+    """
+    global _graph, _rebuilding
+    with _graph_lock:
+        if _graph is None:
+            _graph = build_graph()
+        elif not _rebuilding and time.monotonic() - _graph.built_at > settings.ITINERARY_GRAPH_TTL:
+            _rebuilding = True
+            threading.Thread(target=_rebuild, name='itinerary-rebuild', daemon=True).start()
+        return _graph
+
+
+def update_route(route):
+    """
+    Apply a saved route to the graph, if one has been built.
+    """
+    if _graph is None:
+        return
+    points = extract_coordinates(route.geojson)
+    if len(points) < 2:
+        _graph.remove(route.pk)
+        return
+    _graph.add(_node(route.pk, route.title, points[0], points[-1], route.distance, route.duration_days, route.difficulty))
+
+
+def remove_route(route_id):
+    """
+    Drop a deleted route from the graph, if one has been built.
+    """
+    if _graph is not None:
+        _graph.remove(route_id)
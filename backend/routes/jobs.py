@@ -0,0 +1,174 @@
+"""
+Database-backed background jobs.
+
+Functions decorated with @task (in a `tasks` module of any installed app)
+can be queued with enqueue(). Jobs are rows in the `jobs` table, written in
+the same transaction as the change that caused them, and run by the
+`run_jobs` management command. Identical pending jobs are merged, failed
+jobs are retried with exponential backoff, and higher priorities run first.
+"""
+import hashlib
+import json
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+_registry = {}
+
+
+def task(func):
+    """
+    Register a function as a job task under its dotted path.
+    Tasks take JSON-serializable keyword arguments only.
+    """
+    func.task_name = f'{func.__module__}.{func.__qualname__}'
+    _registry[func.task_name] = func
+    return func
+
+
+def get_task(name):
+    if name not in _registry:
+        autodiscover_modules('tasks')
+    return _registry[name]
+
+
+def dedup_key(name, kwargs):
+    payload = json.dumps([name, kwargs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def enqueue(func, priority=PRIORITY_NORMAL, delay=None, **kwargs):
+    """
+    Queue a call of a registered task. Returns the pending Job, which is an
+    existing identical pending job if there is one.
+    """
+    key = dedup_key(func.task_name, kwargs)
+    run_after = timezone.now() + (delay or timedelta(0))
+
+    existing = Job.objects.filter(dedup_key=key, status=Job.PENDING).first()
+    if existing is None:
+        try:
+            with transaction.atomic():
+                existing = Job.objects.create(
+                    task=func.task_name,
+                    kwargs=kwargs,
+                    dedup_key=key,
+                    priority=priority,
+                    run_after=run_after,
+                    max_attempts=settings.JOB_MAX_ATTEMPTS,
+                )
+        except IntegrityError:
+            existing = Job.objects.filter(dedup_key=key, status=Job.PENDING).first()
+    if existing and existing.priority < priority:
+        Job.objects.filter(pk=existing.pk, status=Job.PENDING).update(priority=priority)
+
+    if settings.JOBS_RUN_EAGERLY and existing:
+        job_id = existing.pk
+        transaction.on_commit(lambda: _run_eagerly(job_id))
+    return existing
+
+
+def _run_eagerly(job_id):
+    if Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+        status=Job.RUNNING, attempts=F('attempts') + 1, started_at=timezone.now(), worker=worker_name(),
+    ):
+        run_job(job_id)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(limit, worker):
+    """
+    Mark up to `limit` due jobs as running and return their ids. Each job is
+    claimed with a conditional UPDATE, so concurrent workers never run the
+    same job.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.PENDING, run_after__lte=now).order_by(
+        '-priority', 'run_after', 'id',
+    ).values_list('id', flat=True)[:limit * 2]
+
+    claimed = []
+    for job_id in candidates:
+        updated = Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            worker=worker,
+        )
+        if updated:
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def run_job(job_id):
+    """
+    Run a claimed job and record the outcome. Returns the new status.
+    """
+    job = Job.objects.get(pk=job_id)
+    try:
+        get_task(job.task)(**job.kwargs)
+    except Exception:
+        return _failed(job, traceback.format_exc())
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now(), last_error='')
+    return Job.DONE
+
+
+def _failed(job, error):
+    now = timezone.now()
+    if job.attempts >= job.max_attempts:
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED, finished_at=now, last_error=error)
+        return Job.FAILED
+
+    backoff = settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING,
+                run_after=now + timedelta(seconds=backoff),
+                last_error=error,
+            )
+    except IntegrityError:
+        # An identical job was queued meanwhile and will run instead
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED, finished_at=now, last_error=error)
+        return Job.FAILED
+    return Job.PENDING
+
+
+def requeue_stale():
+    """
+    Return jobs left running by a crashed worker to the queue.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT_SECONDS)
+    requeued = 0
+    for job in Job.objects.filter(status=Job.RUNNING, started_at__lt=cutoff):
+        if _failed(job, 'Timed out or worker stopped.') == Job.PENDING:
+            requeued += 1
+    return requeued
+
+
+def purge_finished():
+    """
+    Delete finished jobs older than JOB_KEEP_FINISHED_DAYS.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.JOB_KEEP_FINISHED_DAYS)
+    deleted, _ = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff).delete()
+    return deleted
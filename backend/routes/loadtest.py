@@ -0,0 +1,346 @@
+"""
+Asyncio HTTP load generator for the API.
+
+Virtual users each keep one keep-alive HTTP/1.1 connection to the server
+under test (runserver, gunicorn, uvicorn...), log in through
+/api/auth/token/ and run scenarios picked at random by weight until the run
+ends. Every scenario run is timed end to end. The client only uses the
+standard library, so no third-party client overhead ends up in the numbers.
+
+Run it with `manage.py loadtest` against a database seeded with
+`manage.py seed_load_data`.
+"""
+import asyncio
+import io
+import json
+import random
+import ssl
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import suppress
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+from PIL import Image as PILImage
+
+
+USERNAME_PREFIX = 'loadtest-'
+# Result of a scenario run that failed without an HTTP status
+NETWORK_ERRORS = (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError)
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f'HTTP {status}: {body[:200]!r}')
+        self.status = status
+
+
+class Connection:
+    """
+    Minimal keep-alive HTTP/1.1 client connection.
+    """
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.host_header = parts.netloc
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            with suppress(OSError):
+                await self.writer.wait_closed()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """
+        Send a request and return (status, body). A request on a reused
+        connection the server has closed meanwhile is retried once on a new
+        one.
+        """
+        reused = self.writer is not None
+        if not reused:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        try:
+            return await asyncio.wait_for(self._exchange(method, path, body, headers or {}), self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            if not reused:
+                raise
+            return await self.request(method, path, body, headers)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _exchange(self, method, path, body, headers):
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host_header}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        version, status = (await self.reader.readuntil(b'\r\n')).split(None, 2)[:2]
+        response_headers = {}
+        while (line := await self.reader.readuntil(b'\r\n')) != b'\r\n':
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        status = int(status)
+        if status in (204, 304) or method == 'HEAD':
+            data = b''
+        elif 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = await self._read_chunked()
+        else:
+            data = await self.reader.read()
+            response_headers['connection'] = 'close'
+
+        if response_headers.get('connection', '').lower() == 'close' or version == b'HTTP/1.0':
+            await self.close()
+        return status, data
+
+    async def _read_chunked(self):
+        chunks = []
+        while size := int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16):
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+        while await self.reader.readuntil(b'\r\n') != b'\r\n':
+            pass
+        return b''.join(chunks)
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content_type, data) in files.items():
+        body.write((
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode())
+        body.write(data + b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class VirtualUser:
+    """
+    One simulated client with its own connection, token and random stream.
+    """
+
+    def __init__(self, connection, token, seed):
+        self.connection = connection
+        self.token = token
+        self.rng = random.Random(seed)
+
+    async def call(self, method, path, body=b'', content_type=None, expect=(200,)):
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        if content_type:
+            headers['Content-Type'] = content_type
+        status, data = await self.connection.request(method, path, body, headers)
+        if status not in expect:
+            raise HTTPStatusError(status, data)
+        return data
+
+    async def get_json(self, path):
+        return json.loads(await self.call('GET', path))
+
+    async def post_json(self, path, payload):
+        return await self.call('POST', path, json.dumps(payload).encode(), 'application/json', expect=(200, 201))
+
+
+class Dataset:
+    """
+    What the scenarios need to know about the seeded database.
+    """
+
+    def __init__(self, route_ids, pages, words, image):
+        self.route_ids = route_ids
+        self.pages = pages
+        self.words = words
+        self.image = image
+
+
+async def browse(user, data):
+    await user.get_json(f'/api/routes/?page={user.rng.randint(1, data.pages)}')
+
+
+async def detail(user, data):
+    route_id = user.rng.choice(data.route_ids)
+    await user.get_json(f'/api/routes/{route_id}/')
+
+
+async def search(user, data):
+    await user.get_json('/api/routes/?' + urlencode({'search': user.rng.choice(data.words)}))
+
+
+async def comment(user, data):
+    await user.post_json('/api/routes/comments/', {
+        'route': user.rng.choice(data.route_ids),
+        'text': f'Load test comment {user.rng.getrandbits(32):08x}',
+    })
+
+
+async def upload(user, data):
+    body, content_type = _multipart(
+        {'route': user.rng.choice(data.route_ids), 'caption': 'Load test image'},
+        {'image': ('loadtest.jpg', 'image/jpeg', data.image)},
+    )
+    await user.call('POST', '/api/routes/images/', body, content_type, expect=(201,))
+
+
+SCENARIOS = {
+    'browse': browse,
+    'detail': detail,
+    'search': search,
+    'comment': comment,
+    'upload': upload,
+}
+DEFAULT_MIX = {'browse': 50, 'detail': 25, 'search': 15, 'comment': 7, 'upload': 3}
+
+
+def parse_mix(value):
+    """
+    Scenario weights from 'browse=50,detail=25,...'.
+    """
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Unknown scenario {name!r}; choose from {", ".join(SCENARIOS)}.')
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError('At least one scenario needs a positive weight.')
+    return mix
+
+
+def _test_image():
+    buffer = io.BytesIO()
+    PILImage.effect_noise((640, 480), 64).convert('RGB').save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+async def login(base_url, usernames, password, timeout):
+    """
+    Access tokens for the given users from /api/auth/token/.
+    """
+    async def token(username):
+        connection = Connection(base_url, timeout)
+        try:
+            user = VirtualUser(connection, None, 0)
+            return json.loads(await user.post_json('/api/auth/token/', {'username': username, 'password': password}))['access']
+        finally:
+            await connection.close()
+
+    return await asyncio.gather(*(token(username) for username in usernames))
+
+
+async def discover(base_url, token, timeout, pages=5):
+    """
+    Route ids, page count and title words of the seeded routes.
+    """
+    connection = Connection(base_url, timeout)
+    user = VirtualUser(connection, token, 0)
+    try:
+        first = await user.get_json('/api/routes/')
+        if not first['results']:
+            raise ValueError('The server has no routes; seed the database first.')
+        results = list(first['results'])
+        total_pages = -(-first['count'] // len(first['results']))
+        for page in range(2, min(pages, total_pages) + 1):
+            results += (await user.get_json(f'/api/routes/?page={page}'))['results']
+    finally:
+        await connection.close()
+    words = sorted({word.lower() for route in results for word in route['title'].split() if len(word) > 3})
+    return Dataset([route['id'] for route in results], total_pages, words or ['route'], _test_image())
+
+
+class Stats:
+    """
+    Latencies and failures per scenario.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+
+    def record(self, scenario, seconds, error=None):
+        self.latencies[scenario].append(seconds)
+        if error is not None:
+            self.errors[scenario][error] += 1
+
+    def summary(self, duration):
+        rows = []
+        for scenario in sorted(self.latencies, key=lambda name: -len(self.latencies[name])):
+            rows.append(self._row(scenario, self.latencies[scenario], self.errors[scenario], duration))
+        everything = [seconds for latencies in self.latencies.values() for seconds in latencies]
+        if everything:
+            errors = sum((counter for counter in self.errors.values()), Counter())
+            rows.append(self._row('total', everything, errors, duration))
+        return rows
+
+    def _row(self, scenario, latencies, errors, duration):
+        milliseconds = np.asarray(latencies) * 1000
+        p50, p90, p95, p99 = np.percentile(milliseconds, [50, 90, 95, 99])
+        failed = sum(errors.values())
+        return {
+            'scenario': scenario,
+            'requests': len(latencies),
+            'throughput': len(latencies) / duration,
+            'error_rate': failed / len(latencies),
+            'errors': {str(error): count for error, count in errors.most_common()},
+            'p50_ms': p50,
+            'p90_ms': p90,
+            'p95_ms': p95,
+            'p99_ms': p99,
+            'max_ms': milliseconds.max(),
+        }
+
+
+async def run(base_url, mix, concurrency, duration, tokens, data, timeout, ramp_up=0, think_time=0):
+    """
+    Run `concurrency` virtual users for `duration` seconds after a ramp-up
+    and return the Stats and the measured time. Only scenario runs started
+    after the ramp-up are recorded, so the numbers describe the full load.
+    """
+    loop = asyncio.get_running_loop()
+    stats = Stats()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    measured_from = loop.time() + ramp_up
+    deadline = measured_from + duration
+
+    async def virtual_user(number):
+        await asyncio.sleep(ramp_up * number / concurrency)
+        connection = Connection(base_url, timeout)
+        user = VirtualUser(connection, tokens[number % len(tokens)] if tokens else None, number)
+        try:
+            while loop.time() < deadline:
+                scenario = user.rng.choices(names, weights)[0]
+                measured = loop.time() >= measured_from
+                start = time.perf_counter()
+                error = None
+                try:
+                    await SCENARIOS[scenario](user, data)
+                except HTTPStatusError as exc:
+                    error = exc.status
+                except NETWORK_ERRORS as exc:
+                    error = type(exc).__name__
+                if measured:
+                    stats.record(scenario, time.perf_counter() - start, error)
+                if think_time:
+                    await asyncio.sleep(user.rng.expovariate(1 / think_time))
+        finally:
+            await connection.close()
+
+    await asyncio.gather(*(virtual_user(number) for number in range(concurrency)))
+    return stats, loop.time() - measured_from
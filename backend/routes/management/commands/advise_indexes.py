@@ -0,0 +1,274 @@
+import random
+import re
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, migrations, models
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from routes import views as route_views
+from routes.models import Route, RouteCountry, Location, Image, Comment
+from users import views as user_views
+from users.models import User
+
+
+# Plan fragments that indicate a sort no index can serve
+TEMP_SORT_MARKERS = ('USE TEMP B-TREE', 'Sort  (', 'Using filesort')
+# Full scans: SQLite "SCAN <table>" without an index, PostgreSQL "Seq Scan on <table>"
+SCAN_PATTERNS = (re.compile(r'\bSCAN (\w+)(?!.*\bINDEX\b)'), re.compile(r'Seq Scan on (\w+)'))
+# Lookups an index can serve as a leading column
+EQUALITY_LOOKUPS = ('exact', 'in', 'isnull')
+
+# (label, view, url kwargs, query params)
+SCENARIOS = [
+    ('routes: list', route_views.RouteListCreateView, {}, {}),
+    ('routes: difficulty', route_views.RouteListCreateView, {}, {'difficulty': 'hard'}),
+    ('routes: duration_days', route_views.RouteListCreateView, {}, {'duration_days': '2'}),
+    ('routes: country', route_views.RouteListCreateView, {}, {'country': 'IT'}),
+    ('routes: bbox', route_views.RouteListCreateView, {}, {'bbox': '5,44,15,48'}),
+    ('routes: order by distance', route_views.RouteListCreateView, {}, {'ordering': '-distance'}),
+    ('routes: order by title', route_views.RouteListCreateView, {}, {'ordering': 'title'}),
+    ('routes: order by trending', route_views.RouteListCreateView, {}, {'ordering': '-trending'}),
+    ('routes: search', route_views.RouteListCreateView, {}, {'search': 'pass'}),
+    ('routes: detail', route_views.RouteDetailView, {'pk': 1}, {}),
+    ('routes: feed', route_views.RouteFeedView, {}, {}),
+    ('routes: by user', route_views.UserRoutesView, {'user_id': 1}, {}),
+    ('locations: list', route_views.LocationListCreateView, {}, {}),
+    ('locations: type', route_views.LocationListCreateView, {}, {'location_type': 'hotel'}),
+    ('locations: country', route_views.LocationListCreateView, {}, {'country': 'IT'}),
+    ('locations: detail', route_views.LocationDetailView, {'pk': 1}, {}),
+    ('locations: by route', route_views.RouteLocationsView, {'route_id': 1}, {}),
+    ('images: list', route_views.ImageListCreateView, {}, {}),
+    ('images: detail', route_views.ImageDetailView, {'pk': 1}, {}),
+    ('comments: list', route_views.CommentListCreateView, {}, {}),
+    ('comments: detail', route_views.CommentDetailView, {'pk': 1}, {}),
+    ('comments: by route', route_views.RouteCommentsView, {'route_id': 1}, {}),
+    ('users: list', user_views.UserListView, {}, {}),
+    ('users: detail', user_views.UserDetailView, {'pk': 1}, {}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the querysets behind the API views against a seeded test database, '
+        'flag full scans and temporary sorts in their query plans and recommend indexes '
+        'on the filtered and ordered columns of the scanned tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=5000, help='Number of routes to seed.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timing runs per query.')
+        parser.add_argument('--write-migration', action='store_true', help='Write migrations adding the recommended indexes.')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.seed(options['routes'])
+            self.advise(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, route_count):
+        self.stdout.write(f'Seeding {route_count} routes...')
+        rng = random.Random(42)
+        words = ['pass', 'coast', 'valley', 'lake', 'ridge', 'loop', 'canyon', 'forest']
+        countries = ['IT', 'FR', 'DE', 'AT', 'CH', 'ES']
+        difficulties = [choice for choice, _ in Route.DIFFICULTY_CHOICES]
+        location_types = [choice for choice, _ in Location.LOCATION_TYPE_CHOICES]
+
+        users = User.objects.bulk_create([
+            User(username=f'seed{i}', email=f'seed{i}@example.com', password='!')
+            for i in range(max(route_count // 50, 1))
+        ])
+        routes = Route.objects.bulk_create([
+            Route(
+                title=f'{rng.choice(words).title()} {rng.choice(words)} {i}',
+                description=' '.join(rng.choices(words, k=12)),
+                difficulty=rng.choice(difficulties),
+                geojson={'type': 'LineString', 'coordinates': [[rng.uniform(-10, 30), rng.uniform(35, 60)] for _ in range(20)]},
+                distance=rng.uniform(10, 800),
+                duration_days=rng.randint(1, 7),
+                trending=rng.random(),
+                creator=rng.choice(users),
+            )
+            for i in range(route_count)
+        ], batch_size=1000)
+        Location.objects.bulk_create([
+            Location(
+                name=f'POI {i}',
+                location_type=rng.choice(location_types),
+                latitude=rng.uniform(35, 60),
+                longitude=rng.uniform(-10, 30),
+                country=rng.choice(countries),
+                route=rng.choice(routes),
+                creator=rng.choice(users),
+            )
+            for i in range(route_count * 3)
+        ], batch_size=1000)
+        RouteCountry.objects.bulk_create([
+            RouteCountry(route=route, country=country, position=position)
+            for route in routes
+            for position, country in enumerate(rng.sample(countries, rng.randint(1, 2)))
+        ], batch_size=1000)
+        Image.objects.bulk_create([
+            Image(image=f'route_images/seed{i}.jpg', route=rng.choice(routes), uploader=rng.choice(users))
+            for i in range(route_count * 2)
+        ], batch_size=1000)
+        Comment.objects.bulk_create([
+            Comment(text='Great ride', route=rng.choice(routes), author=rng.choice(users))
+            for i in range(route_count * 4)
+        ], batch_size=1000)
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def page_queryset(self, view_class, kwargs, params):
+        factory = APIRequestFactory()
+        request = factory.get('/', params)
+        force_authenticate(request, user=User.objects.order_by('pk').first())
+        view = view_class()
+        view.args, view.kwargs, view.format_kwarg = (), kwargs, None
+        view.request = view.initialize_request(request, **kwargs)
+        view.headers = {}
+
+        queryset = view.filter_queryset(view.get_queryset())
+        lookup = view.lookup_url_kwarg or view.lookup_field
+        if lookup in kwargs:
+            return queryset.filter(**{view.lookup_field: kwargs[lookup]})
+        return queryset[:settings.REST_FRAMEWORK['PAGE_SIZE']]
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset._chain())
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    def inspect(self, queryset):
+        """
+        The query plan, a list of its flags for display, the tables it
+        scans in full and whether it sorts in a temporary structure.
+        """
+        plan = queryset.explain()
+        scanned, temp_sort = set(), False
+        for line in plan.splitlines():
+            for pattern in SCAN_PATTERNS:
+                match = pattern.search(line)
+                if match:
+                    scanned.add(match.group(1))
+            if any(marker in line for marker in TEMP_SORT_MARKERS):
+                temp_sort = True
+        flags = [f'full scan of {table}' for table in sorted(scanned)] + (['temp sort'] if temp_sort else [])
+        return plan, flags, scanned, temp_sort
+
+    def candidate_fields(self, queryset):
+        """
+        Fields of an index serving the queryset's own table: columns it
+        compares for equality, then the ones it orders by, or failing that
+        the first column it compares by range.
+        """
+        query = queryset.query
+        alias = query.get_initial_alias()
+        equality, ranges = [], []
+        for lookup in query.where.children:
+            lhs = getattr(lookup, 'lhs', None)
+            if getattr(lhs, 'alias', None) != alias or not hasattr(lhs, 'target'):
+                continue
+            name = lhs.target.name
+            target = equality if lookup.lookup_name in EQUALITY_LOOKUPS else ranges
+            if name not in equality and name not in target:
+                target.append(name)
+
+        ordering = query.order_by or (query.get_meta().ordering if query.default_ordering else [])
+        order_fields = []
+        for field in ordering:
+            if not isinstance(field, str) or '__' in field or field.lstrip('-') in ('pk', '?'):
+                continue
+            if field.lstrip('-') not in equality:
+                order_fields.append(field)
+        fields = equality + (order_fields or ranges[:1])
+        return [field for field in fields if field != query.get_meta().pk.name]
+
+    def is_covered(self, model, fields):
+        """
+        Whether an existing index already starts with `fields`.
+        """
+        wanted = [field.lstrip('-') for field in fields]
+        existing = [[f.lstrip('-') for f in index.fields] for index in model._meta.indexes]
+        existing += [[field.name] for field in model._meta.fields if field.db_index or field.primary_key or field.unique]
+        return any(index[:len(wanted)] == wanted for index in existing)
+
+    def advise(self, options):
+        results = []
+        recommended = {}
+        for label, view_class, kwargs, params in SCENARIOS:
+            queryset = self.page_queryset(view_class, kwargs, params)
+            plan, flags, scanned, temp_sort = self.inspect(queryset)
+            before = self.measure(queryset, options['repeat'])
+            index = None
+            model = queryset.model
+            if model._meta.db_table in scanned or temp_sort:
+                fields = self.candidate_fields(queryset)
+                if fields and not self.is_covered(model, fields):
+                    key = (model, tuple(fields))
+                    if key not in recommended:
+                        index = models.Index(fields=fields)
+                        index.set_name_with_model(model)
+                        recommended[key] = index
+                    index = recommended[key]
+            results.append([label, view_class, kwargs, params, flags, before, index, plan])
+
+        if recommended:
+            with connection.schema_editor() as editor:
+                for (model, _), index in recommended.items():
+                    editor.add_index(model, index)
+
+        self.stdout.write('')
+        for label, view_class, kwargs, params, flags, before, index, plan in results:
+            queryset = self.page_queryset(view_class, kwargs, params)
+            after = self.measure(queryset, options['repeat'])
+            _, flags_after, _, _ = self.inspect(queryset)
+            status = ', '.join(flags) or 'ok'
+            line = f'{label:28} {status:38} {before:8.2f} ms -> {after:8.2f} ms'
+            if index:
+                line += f'  [{index.name}: {", ".join(index.fields)}]'
+                if flags_after:
+                    line += f' still: {", ".join(flags_after)}'
+            self.stdout.write(line)
+            if options['verbosity'] > 1:
+                self.stdout.write(self.style.NOTICE(plan))
+
+        if not recommended:
+            self.stdout.write(self.style.SUCCESS('\nNo new indexes recommended.'))
+            return
+
+        self.stdout.write('\nRecommended indexes (add them to the models\' Meta.indexes):')
+        for (model, fields), index in recommended.items():
+            self.stdout.write(f'  {model.__name__}: models.Index(fields={list(fields)!r}, name={index.name!r})')
+
+        if options['write_migration']:
+            self.write_migrations(recommended)
+
+    def write_migrations(self, recommended):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        by_app = {}
+        for (model, _), index in recommended.items():
+            by_app.setdefault(model._meta.app_label, []).append(
+                migrations.AddIndex(model_name=model._meta.model_name, index=index)
+            )
+
+        for app_label, operations in by_app.items():
+            leaf = loader.graph.leaf_nodes(app_label)[0]
+            number = int(leaf[1].split('_', 1)[0]) + 1
+            migration = migrations.Migration(f'{number:04d}_advised_indexes', app_label)
+            migration.dependencies = [leaf]
+            migration.operations = operations
+            writer = MigrationWriter(migration)
+            with open(writer.path, 'w', encoding='utf-8') as f:
+                f.write(writer.as_string())
+            self.stdout.write(self.style.SUCCESS(f'Wrote {writer.path}'))
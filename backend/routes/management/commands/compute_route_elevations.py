@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from routes.elevation import compute_elevation, get_dem_source
+from routes.models import Route, RouteElevation
+
+
+def _compute(item):
+    route_id, geojson = item
+    return route_id, compute_elevation(geojson)
+
+
+class Command(BaseCommand):
+    help = 'Compute elevation profiles for routes from the local DEM tiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='Only compute routes without an elevation profile.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if get_dem_source() is None:
+            raise CommandError('ELEVATION_DEM_DIR does not point to a directory of DEM tiles.')
+
+        routes = Route.objects.all()
+        if options['missing']:
+            routes = routes.filter(elevation__isnull=True)
+        items = routes.values_list('id', 'geojson').iterator(chunk_size=options['batch_size'])
+
+        computed = 0
+        # Spawned, not forked, so workers do not share this process's
+        # database connections; close them anyway before starting the pool
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+        )
+        with pool:
+            # Executor.map submits everything up front, so feed it one batch
+            # at a time to keep memory bounded on large tables.
+            while batch := list(islice(items, options['batch_size'])):
+                results = [
+                    RouteElevation(route_id=route_id, **values)
+                    for route_id, values in pool.map(_compute, batch, chunksize=8)
+                    if values is not None
+                ]
+                computed += self._save(results)
+
+        self.stdout.write(self.style.SUCCESS(f'Computed elevation for {computed} routes.'))
+
+    def _save(self, batch):
+        with transaction.atomic():
+            RouteElevation.objects.filter(route_id__in=[e.route_id for e in batch]).delete()
+            RouteElevation.objects.bulk_create(batch)
+        return len(batch)
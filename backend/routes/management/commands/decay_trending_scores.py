@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from routes import trending
+
+
+class Command(BaseCommand):
+    help = 'Apply time decay to route trending scores. Run periodically, e.g. hourly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute all scores from recent activity.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = trending.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt trending scores for {count} routes.'))
+        else:
+            factor = trending.decay()
+            self.stdout.write(self.style.SUCCESS(f'Decayed trending scores by a factor of {factor:.4f}.'))
@@ -0,0 +1,65 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from routes.geocoding import BoundaryIndex
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Replace the bundled country boundaries in GEOCODER_BOUNDARIES_FILE with a downloaded GeoJSON file. '
+        'The URL should point to a fixed release, and the download must match the given SHA-256 digest.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='GeoJSON FeatureCollection to download.')
+        parser.add_argument('--sha256', required=True, help='Expected hex SHA-256 digest of the download.')
+        parser.add_argument('--timeout', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        path = Path(settings.GEOCODER_BOUNDARIES_FILE)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix='.', suffix='.tmp', delete=False) as temp:
+            try:
+                with urlopen(options['url'], timeout=options['timeout']) as response:
+                    while chunk := response.read(CHUNK_SIZE):
+                        digest.update(chunk)
+                        temp.write(chunk)
+            except (URLError, OSError) as exc:
+                temp.close()
+                os.unlink(temp.name)
+                raise CommandError(f"Downloading {options['url']} failed: {exc}")
+        try:
+            if digest.hexdigest() != options['sha256'].lower():
+                raise CommandError(f"The download has SHA-256 {digest.hexdigest()}, expected {options['sha256']}.")
+            count = self.validate(temp.name)
+        except CommandError:
+            os.unlink(temp.name)
+            raise
+        os.replace(temp.name, path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved the boundaries of {count} countries to {path}. Run `manage.py geocode_countries` to apply them.'
+        ))
+
+    def validate(self, filename):
+        """
+        Load the download as the geocoder would and return its number of
+        countries.
+        """
+        try:
+            index = BoundaryIndex.from_geojson(filename)
+        except (ValueError, AttributeError, TypeError, IndexError):
+            raise CommandError('The download is not a GeoJSON FeatureCollection of country polygons.')
+        if not index.countries:
+            raise CommandError(f'No polygon features with a {settings.GEOCODER_CODE_PROPERTY!r} property found.')
+        return len(index.countries)
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from routes.geocoding import get_boundary_index, route_countries
+from routes.models import Location, Route, RouteCountry
+from routes.sync import stamp
+from users.stats import refresh_countries
+
+
+class Command(BaseCommand):
+    help = 'Reverse geocode routes and locations to countries from the local boundaries file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='Only geocode routes and locations without countries.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        index = get_boundary_index()
+        if index is None:
+            raise CommandError('GEOCODER_BOUNDARIES_FILE does not point to a boundaries GeoJSON file.')
+        batch_size = options['batch_size']
+
+        routes = Route.objects.order_by('pk')
+        locations = Location.objects.order_by('pk')
+        if options['missing']:
+            routes = routes.filter(countries__isnull=True)
+            locations = locations.filter(country='')
+
+        creators = set()
+        geocoded = 0
+        last_pk = 0
+        while batch := list(routes.filter(pk__gt=last_pk).values_list('id', 'creator_id', 'geojson')[:batch_size]):
+            entries = [
+                RouteCountry(route_id=route_id, country=code, position=position)
+                for route_id, _, geojson in batch
+                for position, code in enumerate(route_countries(geojson, index))
+            ]
+            with transaction.atomic():
+                RouteCountry.objects.filter(route_id__in=[row[0] for row in batch]).delete()
+                RouteCountry.objects.bulk_create(entries)
+            creators.update(row[1] for row in batch)
+            geocoded += len(batch)
+            last_pk = batch[-1][0]
+        self.stdout.write(f'Geocoded {geocoded} routes.')
+
+        geocoded = 0
+        last_pk = 0
+        while batch := list(locations.filter(pk__gt=last_pk).values_list('id', 'longitude', 'latitude')[:batch_size]):
+            ids, lngs, lats = zip(*batch)
+            with transaction.atomic():
+                Location.objects.bulk_update(
+                    [Location(pk=pk, country=code or '') for pk, code in zip(ids, index.locate(lngs, lats))],
+                    ['country'],
+                    batch_size=batch_size,
+                )
+                # Countries are synced, so clients need the changed rows
+                stamp(Location, ids)
+            geocoded += len(batch)
+            last_pk = ids[-1]
+        self.stdout.write(f'Geocoded {geocoded} locations.')
+
+        for user_id in creators:
+            refresh_countries(user_id)
+        self.stdout.write(self.style.SUCCESS(f'Updated countries for {len(creators)} users.'))
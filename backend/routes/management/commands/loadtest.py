@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from routes import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive a running server with concurrent virtual users running a weighted mix of scenarios '
+        '(browse, detail, search, comment, upload) and report throughput, latency percentiles and errors.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Virtual users running at once.')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run after ramp-up.')
+        parser.add_argument('--ramp-up', type=float, default=0, help='Seconds over which virtual users are started; scenarios started meanwhile are not counted.')
+        parser.add_argument('--think-time', type=float, default=0, help='Mean pause in seconds between scenarios.')
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in loadtest.DEFAULT_MIX.items()),
+                            help='Scenario weights, e.g. browse=50,detail=25,search=15,comment=7,upload=3.')
+        parser.add_argument('--users', type=int, default=10, help='Seeded users to log in as (see seed_load_data).')
+        parser.add_argument('--password', default='loadtest', help='Password of the seeded users.')
+        parser.add_argument('--anonymous', action='store_true', help='Do not log in (write scenarios will fail).')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as failed.')
+        parser.add_argument('--json', dest='json_path', help='Also write the report as JSON to this file.')
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        try:
+            stats, elapsed = asyncio.run(self.run(mix, options))
+        except (OSError, ValueError, KeyError, loadtest.HTTPStatusError) as exc:
+            raise CommandError(f'Could not set up the run: {exc}')
+
+        rows = stats.summary(elapsed)
+        self.report(rows, elapsed, options)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'options': {key: options[key] for key in ('url', 'concurrency', 'duration', 'ramp_up', 'mix')}, 'results': rows}, f, indent=2)
+
+    async def run(self, mix, options):
+        url, timeout = options['url'].rstrip('/'), options['timeout']
+        tokens = []
+        if not options['anonymous']:
+            usernames = [f'{loadtest.USERNAME_PREFIX}{i}' for i in range(options['users'])]
+            tokens = await loadtest.login(url, usernames, options['password'], timeout)
+        data = await loadtest.discover(url, tokens[0] if tokens else None, timeout)
+        self.stdout.write(
+            f'Running {options["concurrency"]} virtual users against {url} for {options["duration"]:g}s '
+            f'({len(data.route_ids)} routes, {data.pages} list pages)...'
+        )
+        return await loadtest.run(
+            url, mix, options['concurrency'], options['duration'], tokens, data, timeout,
+            ramp_up=options['ramp_up'], think_time=options['think_time'],
+        )
+
+    def report(self, rows, elapsed, options):
+        header = f'{"scenario":<10} {"requests":>9} {"req/s":>8} {"errors":>7} {"p50":>8} {"p90":>8} {"p95":>8} {"p99":>8} {"max":>8}'
+        self.stdout.write(f'\nMeasured {elapsed:.1f}s after ramp-up. Latencies in ms.\n')
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in rows:
+            line = (
+                f'{row["scenario"]:<10} {row["requests"]:>9} {row["throughput"]:>8.1f} {row["error_rate"]:>7.1%} '
+                f'{row["p50_ms"]:>8.1f} {row["p90_ms"]:>8.1f} {row["p95_ms"]:>8.1f} {row["p99_ms"]:>8.1f} {row["max_ms"]:>8.1f}'
+            )
+            self.stdout.write(self.style.ERROR(line) if row['error_rate'] else line)
+        for row in rows[:-1]:
+            if row['errors']:
+                details = ', '.join(f'{error} x{count}' for error, count in row['errors'].items())
+                self.stdout.write(self.style.WARNING(f'{row["scenario"]} errors: {details}'))
+        if rows and '429' in rows[-1]['errors']:
+            self.stdout.write(self.style.WARNING(
+                "429s come from the server's throttle. To measure its capacity instead, set "
+                f"THROTTLE_EXEMPT_USERNAME_PREFIX = '{loadtest.USERNAME_PREFIX}' on the server."
+            ))
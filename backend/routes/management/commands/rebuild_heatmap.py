@@ -0,0 +1,94 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from routes import tasks
+from routes.heatmap import REBUILD_FLAG_SECONDS, REBUILD_KEY, accumulate, pack_bins, route_bins, write_tiles
+from routes.models import HeatmapContribution, HeatmapTile, Job, Route
+
+
+# Seconds between checks for refresh jobs still running when the rebuild starts
+WAIT_POLL = 1.0
+
+
+class Command(BaseCommand):
+    help = (
+        'Rasterize all routes into the heatmap density tiles from scratch. Tiles fill in as the '
+        'rebuild progresses; route changes made meanwhile are applied at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--flush-tiles', type=int, default=1000, help='Write the summed tiles to the database once this many are held in memory.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started_at = timezone.now()
+        cache.set(REBUILD_KEY, True, REBUILD_FLAG_SECONDS)
+        try:
+            self.wait_for_refresh_jobs(started_at)
+            counted, tiles = self.rebuild(batch_size, options['flush_tiles'])
+        finally:
+            cache.delete(REBUILD_KEY)
+        replayed = self.replay(started_at)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rasterized {counted} routes into {tiles} tiles, replayed {replayed} route changes.'
+        ))
+
+    def wait_for_refresh_jobs(self, started_at):
+        """
+        Let refresh jobs that started before the rebuild flag was set finish.
+        """
+        running = Job.objects.filter(
+            task=tasks.refresh_route_heatmap.task_name, status=Job.RUNNING, started_at__lt=started_at,
+        )
+        deadline = time.monotonic() + settings.JOB_TIMEOUT_SECONDS
+        while running.exists() and time.monotonic() < deadline:
+            time.sleep(WAIT_POLL)
+
+    def rebuild(self, batch_size, flush_tiles):
+        with transaction.atomic():
+            HeatmapTile.objects.all().delete()
+            HeatmapContribution.objects.all().delete()
+
+        # Grids are summed in memory and added to the stored tiles whenever
+        # enough of them pile up
+        grids = {}
+        counted = 0
+        routes = Route.objects.order_by('pk')
+        last_pk = 0
+        while batch := list(routes.filter(pk__gt=last_pk).values_list('id', 'geojson')[:batch_size]):
+            contributions = []
+            for route_id, geojson in batch:
+                bins = route_bins(geojson)
+                if len(bins):
+                    accumulate(grids, bins)
+                    contributions.append(HeatmapContribution(route_id=route_id, bins=pack_bins(bins)))
+                    counted += 1
+            HeatmapContribution.objects.bulk_create(contributions)
+            if len(grids) >= flush_tiles:
+                write_tiles(grids)
+                grids = {}
+            cache.set(REBUILD_KEY, True, REBUILD_FLAG_SECONDS)
+            last_pk = batch[-1][0]
+        write_tiles(grids)
+        return counted, HeatmapTile.objects.count()
+
+    def replay(self, started_at):
+        """
+        Apply the route changes whose refresh jobs were skipped during the
+        rebuild.
+        """
+        route_ids = {
+            kwargs['route_id']
+            for kwargs in Job.objects.filter(
+                task=tasks.refresh_route_heatmap.task_name, started_at__gte=started_at,
+            ).values_list('kwargs', flat=True)
+        }
+        for route_id in sorted(route_ids):
+            tasks.refresh_route_heatmap(route_id=route_id)
+        return len(route_ids)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from routes.clusters import encode_cells
+from routes.models import Location
+
+
+class Command(BaseCommand):
+    help = 'Compute the map cells used for POI clustering.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='Only compute locations without a cell.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        locations = Location.objects.order_by('pk')
+        if options['missing']:
+            locations = locations.filter(cell__isnull=True)
+
+        updated = 0
+        last_pk = 0
+        while batch := list(locations.filter(pk__gt=last_pk).values_list('id', 'longitude', 'latitude')[:batch_size]):
+            ids, lngs, lats = zip(*batch)
+            cells = encode_cells(lngs, lats).tolist()
+            Location.objects.bulk_update(
+                [Location(pk=pk, cell=cell) for pk, cell in zip(ids, cells)],
+                ['cell'],
+                batch_size=batch_size,
+            )
+            updated += len(batch)
+            last_pk = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Computed cells for {updated} locations.'))
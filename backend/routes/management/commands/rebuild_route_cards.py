@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from routes.cards import BUILD_BATCH, build_cards
+from routes.models import Route
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the pre-rendered cards served by the route lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='Only build routes without a card.')
+
+    def handle(self, *args, **options):
+        routes = Route.objects.order_by('pk')
+        if options['missing']:
+            routes = routes.filter(card__isnull=True)
+
+        built = 0
+        last_pk = 0
+        while batch := list(routes.filter(pk__gt=last_pk).values_list('id', flat=True)[:BUILD_BATCH]):
+            built += len(build_cards(batch))
+            last_pk = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Built {built} route cards.'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from routes.cells import route_cells
+from routes.models import Route, RouteCell
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the grid cells used to find routes passing through an area.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='Only index routes without cells.')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        routes = Route.objects.order_by('pk')
+        if options['missing']:
+            routes = routes.filter(cells__isnull=True)
+
+        indexed = 0
+        cells = 0
+        last_pk = 0
+        while batch := list(routes.filter(pk__gt=last_pk).values_list('id', 'geojson')[:batch_size]):
+            entries = [
+                RouteCell(route_id=route_id, cell=cell)
+                for route_id, geojson in batch
+                for cell in route_cells(geojson).tolist()
+            ]
+            with transaction.atomic():
+                RouteCell.objects.filter(route_id__in=[route_id for route_id, _ in batch]).delete()
+                RouteCell.objects.bulk_create(entries, batch_size=2000)
+            indexed += len(batch)
+            cells += len(entries)
+            last_pk = batch[-1][0]
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} routes in {cells} cells.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from routes.feed import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed personalized route feeds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only rebuild feeds for these user ids.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_feeds(user_ids=options['users'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt feeds for {count} users.'))
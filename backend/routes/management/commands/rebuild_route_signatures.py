@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from routes.duplicates import build_signature
+from routes.models import Route, RouteSignature
+
+
+class Command(BaseCommand):
+    help = 'Rebuild geometry signatures used for duplicate route detection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        created = 0
+        batch = []
+
+        with transaction.atomic():
+            RouteSignature.objects.all().delete()
+            for route in Route.objects.only('id', 'geojson').iterator(chunk_size=batch_size):
+                signature = build_signature(route.geojson)
+                if signature is None:
+                    continue
+                batch.append(RouteSignature(route_id=route.id, **signature))
+                if len(batch) >= batch_size:
+                    RouteSignature.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            if batch:
+                RouteSignature.objects.bulk_create(batch)
+                created += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} route signatures.'))
@@ -0,0 +1,94 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from routes import jobs
+from routes.models import Job
+
+
+# Seconds between requeueing stale jobs and purging finished ones
+HOUSEKEEPING_INTERVAL = 3600
+
+
+def _run(job_id):
+    close_old_connections()
+    try:
+        return job_id, jobs.run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs with a pool of threads or processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Jobs run at once.')
+        parser.add_argument('--processes', action='store_true', help='Run jobs in processes instead of threads (for CPU-bound tasks).')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between queue checks when idle.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        self.verbosity = options['verbosity']
+        if options['processes']:
+            # Spawned, not forked, so workers do not share this process's database connections
+            pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            )
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        name = jobs.worker_name()
+        self.stdout.write(f'Worker {name} running {workers} jobs at once.')
+
+        running = set()
+        last_housekeeping = 0
+        try:
+            while True:
+                if time.monotonic() - last_housekeeping > HOUSEKEEPING_INTERVAL:
+                    self.housekeeping()
+                    last_housekeeping = time.monotonic()
+
+                free = workers - len(running)
+                if free:
+                    for job_id in jobs.claim(free, name):
+                        running.add(pool.submit(_run, job_id))
+
+                if not running:
+                    if options['once']:
+                        break
+                    close_old_connections()
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.report(future)
+        except KeyboardInterrupt:
+            self.stdout.write(f'Stopping, waiting for {len(running)} running jobs...')
+            for future in running:
+                self.report(future)
+        finally:
+            pool.shutdown(wait=True)
+
+    def report(self, future):
+        try:
+            job_id, status = future.result()
+        except Exception as exc:
+            self.stderr.write(self.style.ERROR(f'Worker error: {exc!r}'))
+            return
+        if status == Job.FAILED:
+            self.stdout.write(self.style.ERROR(f'Job {job_id} failed'))
+        elif status == Job.PENDING:
+            self.stdout.write(self.style.WARNING(f'Job {job_id} failed, will be retried'))
+        elif self.verbosity > 1:
+            self.stdout.write(f'Job {job_id} done')
+
+    def housekeeping(self):
+        requeued = jobs.requeue_stale()
+        purged = jobs.purge_finished()
+        if requeued or purged:
+            self.stdout.write(f'Requeued {requeued} stale jobs, purged {purged} finished jobs.')
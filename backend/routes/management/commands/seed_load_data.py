@@ -0,0 +1,85 @@
+import random
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from routes.geometry import path_length_km
+from routes.loadtest import USERNAME_PREFIX
+from routes.models import Route, Location, Comment
+from routes.sync import stamp
+from users.models import User
+from users.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Seed users, routes, POIs and comments for load tests (see the loadtest command).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--routes', type=int, default=1000)
+        parser.add_argument('--points', type=int, default=300, help='Points per route path.')
+        parser.add_argument('--password', default='loadtest')
+        parser.add_argument('--clear', action='store_true', help='Delete the load test users and everything they created first.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(f'Deleted {deleted} objects.')
+
+        rng = random.Random(42)
+        walk = np.random.default_rng(42)
+        words = ['alpine', 'pass', 'coast', 'valley', 'lake', 'ridge', 'loop', 'canyon', 'forest', 'gorge', 'summit', 'vineyard']
+        difficulties = [choice for choice, _ in Route.DIFFICULTY_CHOICES]
+        location_types = [choice for choice, _ in Location.LOCATION_TYPE_CHOICES]
+
+        users = []
+        for i in range(options['users']):
+            user, _ = User.objects.get_or_create(
+                username=f'{USERNAME_PREFIX}{i}', defaults={'email': f'{USERNAME_PREFIX}{i}@example.com'},
+            )
+            user.set_password(options['password'])
+            user.save(update_fields=['password'])
+            users.append(user)
+
+        with transaction.atomic():
+            routes = []
+            for i in range(options['routes']):
+                start = (walk.uniform(5, 16), walk.uniform(44, 48))
+                points = np.round(start + np.cumsum(walk.normal(0, 0.004, (options['points'], 2)), axis=0), 6).tolist()
+                routes.append(Route(
+                    title=f'{rng.choice(words).title()} {rng.choice(words)} {i}',
+                    description=' '.join(rng.choices(words, k=40)),
+                    difficulty=rng.choice(difficulties),
+                    geojson={'type': 'LineString', 'coordinates': points},
+                    distance=round(path_length_km(points), 1),
+                    duration_days=rng.randint(1, 5),
+                    trending=rng.random(),
+                    creator=rng.choice(users),
+                ))
+            routes = Route.objects.bulk_create(routes, batch_size=500)
+            locations = Location.objects.bulk_create([
+                Location(
+                    name=f'POI {i}',
+                    location_type=rng.choice(location_types),
+                    latitude=route.geojson['coordinates'][0][1],
+                    longitude=route.geojson['coordinates'][0][0],
+                    route=route,
+                    creator=rng.choice(users),
+                )
+                for i, route in enumerate(routes * 3)
+            ], batch_size=1000)
+            comments = Comment.objects.bulk_create([
+                Comment(text=' '.join(rng.choices(words, k=10)), route=rng.choice(routes), author=rng.choice(users))
+                for _ in range(len(routes) * 5)
+            ], batch_size=1000)
+            # bulk_create skips the save signals that number changes for sync
+            for model, rows in ((Route, routes), (Location, locations), (Comment, comments)):
+                stamp(model, [row.pk for row in rows])
+        rebuild_stats([user.pk for user in users])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(routes)} routes for {len(users)} users ({USERNAME_PREFIX}0..{len(users) - 1}, '
+            f'password "{options["password"]}"). Run `manage.py rebuild_route_cards --missing` and '
+            '`manage.py rebuild_route_cells --missing` before measuring.'
+        ))
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0003_route_duration_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteSignature',
+            fields=[
+                ('route', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='routes.route')),
+                ('start_cell', models.BigIntegerField()),
+                ('end_cell', models.BigIntegerField()),
+                ('min_lat', models.FloatField()),
+                ('min_lng', models.FloatField()),
+                ('max_lat', models.FloatField()),
+                ('max_lng', models.FloatField()),
+                ('points', models.JSONField(help_text='Resampled [lng, lat] points of the route path')),
+            ],
+            options={
+                'db_table': 'route_signatures',
+                'indexes': [models.Index(fields=['start_cell', 'end_cell'], name='route_signa_start_c_d4f8cf_idx')],
+            },
+        ),
+    ]
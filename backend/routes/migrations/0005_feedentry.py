@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0004_routesignature'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='routes.route')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'route_feed',
+                'indexes': [models.Index(fields=['user', '-score'], name='route_feed_user_id_ee5091_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'route'), name='unique_feed_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0005_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteElevation',
+            fields=[
+                ('route', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='elevation', serialize=False, to='routes.route')),
+                ('profile', models.JSONField(help_text='[distance_km, elevation_m] samples along the route')),
+                ('total_ascent', models.FloatField(help_text='Total ascent in meters')),
+                ('total_descent', models.FloatField(help_text='Total descent in meters')),
+                ('min_elevation', models.FloatField(help_text='Lowest point in meters')),
+                ('max_elevation', models.FloatField(help_text='Highest point in meters')),
+                ('max_grade', models.FloatField(help_text='Steepest grade in percent')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'route_elevations',
+            },
+        ),
+    ]
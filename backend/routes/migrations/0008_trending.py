@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0007_imageupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'trending_state',
+            },
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='trending',
+            field=models.FloatField(db_index=True, default=0, help_text='Time-decayed activity score, relative to TrendingState.epoch'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0010_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='cell',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, help_text='Morton code of the map tile containing the POI (see routes/clusters.py)', null=True),
+        ),
+    ]
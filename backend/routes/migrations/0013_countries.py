@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0012_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='country',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Country code', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='RouteCountry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', models.CharField(help_text='Country code', max_length=10)),
+                ('position', models.PositiveIntegerField(help_text='Order in which the route enters the country')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='countries', to='routes.route')),
+            ],
+            options={
+                'db_table': 'route_countries',
+                'ordering': ['route', 'position'],
+                'indexes': [models.Index(fields=['country', 'route'], name='route_count_country_b8812c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('route', 'country'), name='unique_route_country')],
+            },
+        ),
+    ]
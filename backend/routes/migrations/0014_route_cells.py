@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0013_countries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell', models.BigIntegerField(help_text='Morton code of the grid cell')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cells', to='routes.route')),
+            ],
+            options={
+                'db_table': 'route_cells',
+                'indexes': [models.Index(fields=['cell', 'route'], name='route_cells_cell_7429f0_idx')],
+                'constraints': [models.UniqueConstraint(fields=('route', 'cell'), name='unique_route_cell')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0014_route_cells'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteCard',
+            fields=[
+                ('route', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='routes.route')),
+                ('data', models.TextField(help_text='RouteListSerializer output as JSON')),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'route_cards',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+def clear_cards(apps, schema_editor):
+    # Cards no longer embed the creator; they are rebuilt when next listed
+    apps.get_model('routes', 'RouteCard').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0015_route_cards'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_cards, migrations.RunPython.noop),
+    ]
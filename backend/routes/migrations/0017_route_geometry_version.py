@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0016_clear_route_cards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='geometry_version',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented on every geometry change'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0017_route_geometry_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeatmapContribution',
+            fields=[
+                ('route_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('bins', models.BinaryField(help_text='zlib-compressed uint64 codes of the bins at HEATMAP_MAX_ZOOM')),
+            ],
+            options={
+                'db_table': 'heatmap_contributions',
+            },
+        ),
+        migrations.CreateModel(
+            name='HeatmapTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('x', models.PositiveIntegerField()),
+                ('y', models.PositiveIntegerField()),
+                ('counts', models.BinaryField(help_text='zlib-compressed int32 grid of routes per bin')),
+                ('peak', models.PositiveIntegerField(help_text='Largest count in the grid')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'heatmap_tiles',
+                'constraints': [models.UniqueConstraint(fields=('zoom', 'x', 'y'), name='unique_heatmap_tile')],
+            },
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    # Rows written so far have sequence 0 and are sent by full syncs only
+    apps.get_model('routes', 'SyncSequence').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0018_heatmap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+                ('purged_seq', models.BigIntegerField(default=0, help_text='Highest sequence number of a purged tombstone')),
+            ],
+            options={
+                'db_table': 'sync_sequence',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comments_updated_e10d2b_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='image',
+            name='images_updated_c02f12_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='location',
+            name='locations_updated_b92107_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='route',
+            name='routes_updated_4df9cd_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tombstone',
+            name='tombstones_deleted_e79d8d_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='sync_seq',
+            field=models.BigIntegerField(default=0, help_text='Sync change sequence number of the last write'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='sync_seq',
+            field=models.BigIntegerField(default=0, help_text='Sync change sequence number of the last write'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='sync_seq',
+            field=models.BigIntegerField(default=0, help_text='Sync change sequence number of the last write'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='sync_seq',
+            field=models.BigIntegerField(default=0, help_text='Sync change sequence number of the last write'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='sync_seq',
+            field=models.BigIntegerField(default=0, help_text='Sync change sequence number of the delete'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['sync_seq', 'id'], name='comments_sync_se_2ad1fd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['sync_seq', 'id'], name='images_sync_se_241348_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['sync_seq', 'id'], name='locations_sync_se_023e63_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['sync_seq', 'id'], name='routes_sync_se_9f1803_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['sync_seq', 'id'], name='tombstones_sync_se_9e5acc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at'], name='tombstones_deleted_e1ba76_idx'),
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:50
+
+from django.db import migrations, models
+
+
+def fill_endpoints(apps, schema_editor):
+    # Existing signatures take their endpoints from the resampled track, which
+    # keeps the first and last point; rebuild_route_signatures stores the
+    # exact ones
+    RouteSignature = apps.get_model('routes', 'RouteSignature')
+    batch = []
+    for signature in RouteSignature.objects.only('route_id', 'points').iterator(chunk_size=500):
+        signature.start_lng, signature.start_lat = signature.points[0]
+        signature.end_lng, signature.end_lat = signature.points[-1]
+        batch.append(signature)
+        if len(batch) >= 500:
+            RouteSignature.objects.bulk_update(batch, ['start_lng', 'start_lat', 'end_lng', 'end_lat'])
+            batch = []
+    RouteSignature.objects.bulk_update(batch, ['start_lng', 'start_lat', 'end_lng', 'end_lat'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0019_sync_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routesignature',
+            name='start_lng',
+            field=models.FloatField(default=0.0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='routesignature',
+            name='start_lat',
+            field=models.FloatField(default=0.0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='routesignature',
+            name='end_lng',
+            field=models.FloatField(default=0.0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='routesignature',
+            name='end_lat',
+            field=models.FloatField(default=0.0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_endpoints, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 
 class Route(models.Model):
@@ -21,6 +24,7 @@ class Route(models.Model):
     # Route data
     geojson = models.JSONField(help_text="GeoJSON LineString data for the route path")
     distance = models.FloatField(help_text="Distance in kilometers")
+    geometry_version = models.PositiveIntegerField(default=0, help_text="Incremented on every geometry change")
     duration_days = models.PositiveIntegerField(
         null=True,
         blank=True,
@@ -30,13 +34,30 @@ class Route(models.Model):
     # Relationships
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='routes')
 
+    # Popularity
+    trending = models.FloatField(
+        default=0,
+        db_index=True,
+        help_text="Time-decayed activity score, relative to TrendingState.epoch"
+    )
+
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    sync_seq = models.BigIntegerField(default=0, help_text="Sync change sequence number of the last write")
 
     class Meta:
         db_table = 'routes'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='routes_created_9ec7ee_idx'),
+            models.Index(fields=['difficulty', '-created_at'], name='routes_difficu_80b3cc_idx'),
+            models.Index(fields=['duration_days', '-created_at'], name='routes_duratio_671749_idx'),
+            models.Index(fields=['-distance'], name='routes_distanc_be4c0b_idx'),
+            models.Index(fields=['title'], name='routes_title_c85a5d_idx'),
+            models.Index(fields=['creator', '-created_at'], name='routes_creator_c9a066_idx'),
+            models.Index(fields=['sync_seq', 'id']),
+        ]
 
     def __str__(self):
         return self.title
@@ -65,6 +86,11 @@ class Location(models.Model):
     # Geographic data
     latitude = models.FloatField()
     longitude = models.FloatField()
+    cell = models.BigIntegerField(
+        null=True, blank=True, editable=False, db_index=True,
+        help_text="Morton code of the map tile containing the POI (see routes/clusters.py)",
+    )
+    country = models.CharField(max_length=10, blank=True, editable=False, db_index=True, help_text="Country code")
 
     # Relationships
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='locations', null=True, blank=True)
@@ -73,15 +99,115 @@ class Location(models.Model):
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    sync_seq = models.BigIntegerField(default=0, help_text="Sync change sequence number of the last write")
 
     class Meta:
         db_table = 'locations'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='locations_created_d89693_idx'),
+            models.Index(fields=['route', '-created_at'], name='locations_route_i_3a9109_idx'),
+            models.Index(fields=['sync_seq', 'id']),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RouteCountry(models.Model):
+    """
+    A country crossed by a route, found by offline reverse geocoding.
+    """
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='countries')
+    country = models.CharField(max_length=10, help_text="Country code")
+    position = models.PositiveIntegerField(help_text="Order in which the route enters the country")
+
+    class Meta:
+        db_table = 'route_countries'
+        ordering = ['route', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['route', 'country'], name='unique_route_country'),
+        ]
+        indexes = [
+            models.Index(fields=['country', 'route']),
+        ]
+
+    def __str__(self):
+        return f"Route {self.route_id} crosses {self.country}"
+
+
+class RouteCell(models.Model):
+    """
+    A grid cell crossed by a route's path, for "routes passing through"
+    queries (see routes/cells.py).
+    """
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='cells')
+    cell = models.BigIntegerField(help_text="Morton code of the grid cell")
+
+    class Meta:
+        db_table = 'route_cells'
+        constraints = [
+            models.UniqueConstraint(fields=['route', 'cell'], name='unique_route_cell'),
+        ]
+        indexes = [
+            models.Index(fields=['cell', 'route']),
+        ]
+
+    def __str__(self):
+        return f"Route {self.route_id} crosses cell {self.cell}"
+
+
+class RouteCard(models.Model):
+    """
+    Pre-rendered JSON of a route as shown in route lists (see routes/cards.py).
+    """
+    route = models.OneToOneField(Route, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    data = models.TextField(help_text="RouteListSerializer output as JSON")
+    built_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'route_cards'
+
+    def __str__(self):
+        return f"Card of route {self.route_id}"
+
+
+class HeatmapTile(models.Model):
+    """
+    Route density of one map tile of the heatmap layer (see routes/heatmap.py).
+    """
+    zoom = models.PositiveSmallIntegerField()
+    x = models.PositiveIntegerField()
+    y = models.PositiveIntegerField()
+    counts = models.BinaryField(help_text="zlib-compressed int32 grid of routes per bin")
+    peak = models.PositiveIntegerField(help_text="Largest count in the grid")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'heatmap_tiles'
+        constraints = [
+            models.UniqueConstraint(fields=['zoom', 'x', 'y'], name='unique_heatmap_tile'),
+        ]
+
+    def __str__(self):
+        return f"Heatmap tile {self.zoom}/{self.x}/{self.y}"
+
+
+class HeatmapContribution(models.Model):
+    """
+    Heatmap bins a route was counted in, so they can be subtracted when the
+    route changes. Not a foreign key: deleted routes still need subtracting.
+    """
+    route_id = models.PositiveIntegerField(primary_key=True)
+    bins = models.BinaryField(help_text="zlib-compressed uint64 codes of the bins at HEATMAP_MAX_ZOOM")
+
+    class Meta:
+        db_table = 'heatmap_contributions'
+
+    def __str__(self):
+        return f"Heatmap contribution of route {self.route_id}"
+
+
 class Image(models.Model):
     """
     Images attached to routes or locations.
@@ -97,10 +223,16 @@ class Image(models.Model):
 
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sync_seq = models.BigIntegerField(default=0, help_text="Sync change sequence number of the last write")
 
     class Meta:
         db_table = 'images'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='images_created_4dae36_idx'),
+            models.Index(fields=['sync_seq', 'id']),
+        ]
 
     def __str__(self):
         if self.route:
@@ -110,6 +242,35 @@ class Image(models.Model):
         return f"Image {self.id}"
 
 
+class ImageUpload(models.Model):
+    """
+    A chunked image upload in progress.
+    Chunks are written to a temporary file until the upload is finalized
+    into an Image.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=200)
+    total_size = models.PositiveBigIntegerField(help_text="Size of the complete file in bytes")
+    received_size = models.PositiveBigIntegerField(default=0, help_text="Bytes received so far")
+    caption = models.CharField(max_length=200, blank=True)
+
+    # Relationships of the resulting image
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='image_uploads', null=True, blank=True)
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='image_uploads', null=True, blank=True)
+    uploader = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='image_uploads')
+
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'image_uploads'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.received_size}/{self.total_size})"
+
+
 class Comment(models.Model):
     """
     Comments on routes.
@@ -124,10 +285,199 @@ class Comment(models.Model):
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    sync_seq = models.BigIntegerField(default=0, help_text="Sync change sequence number of the last write")
 
     class Meta:
         db_table = 'comments'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='comments_created_d5740c_idx'),
+            models.Index(fields=['route', 'created_at'], name='comments_route_i_e879e7_idx'),
+            models.Index(fields=['sync_seq', 'id']),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.route.title}"
+
+
+class RouteSignature(models.Model):
+    """
+    Compact geometry fingerprint of a route used for duplicate detection.
+    Start/end grid cells are indexed for candidate lookup; the resampled
+    track confirms candidates without loading the full GeoJSON.
+    """
+    route = models.OneToOneField(Route, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+
+    # Fingerprint: grid cells of the first and last point
+    start_cell = models.BigIntegerField()
+    end_cell = models.BigIntegerField()
+
+    # Bounding box
+    min_lat = models.FloatField()
+    min_lng = models.FloatField()
+    max_lat = models.FloatField()
+    max_lng = models.FloatField()
+
+    # First and last point, for the itinerary graph
+    start_lng = models.FloatField()
+    start_lat = models.FloatField()
+    end_lng = models.FloatField()
+    end_lat = models.FloatField()
+
+    # Resampled, quantized track
+    points = models.JSONField(help_text="Resampled [lng, lat] points of the route path")
+
+    class Meta:
+        db_table = 'route_signatures'
+        indexes = [
+            models.Index(fields=['start_cell', 'end_cell']),
+        ]
+
+    def __str__(self):
+        return f"Signature for route {self.route_id}"
+
+
+class FeedEntry(models.Model):
+    """
+    Precomputed relevance score of a route for a user's personalized feed.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='feed_entries')
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='feed_entries')
+    score = models.FloatField()
+
+    class Meta:
+        db_table = 'route_feed'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'route'], name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-score']),
+        ]
+
+    def __str__(self):
+        return f"Route {self.route_id} for user {self.user_id} ({self.score:.2f})"
+
+
+class RouteElevation(models.Model):
+    """
+    Elevation profile and climb statistics of a route, sampled from the
+    local DEM tiles.
+    """
+    route = models.OneToOneField(Route, on_delete=models.CASCADE, primary_key=True, related_name='elevation')
+
+    profile = models.JSONField(help_text="[distance_km, elevation_m] samples along the route")
+    total_ascent = models.FloatField(help_text="Total ascent in meters")
+    total_descent = models.FloatField(help_text="Total descent in meters")
+    min_elevation = models.FloatField(help_text="Lowest point in meters")
+    max_elevation = models.FloatField(help_text="Highest point in meters")
+    max_grade = models.FloatField(help_text="Steepest grade in percent")
+
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'route_elevations'
+
+    def __str__(self):
+        return f"Elevation for route {self.route_id}"
+
+
+class TrendingState(models.Model):
+    """
+    Reference time of the stored trending scores.
+    Scores are kept relative to `epoch` and rescaled by the decay pass.
+    """
+    epoch = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'trending_state'
+
+    def __str__(self):
+        return f"Trending scores as of {self.epoch}"
+
+
+class Job(models.Model):
+    """
+    Background job run by the `run_jobs` worker.
+    Identical pending jobs are merged through `dedup_key`.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=200, help_text="Registered task name")
+    kwargs = models.JSONField(default=dict, blank=True)
+    dedup_key = models.CharField(max_length=64, help_text="Hash of the task name and arguments")
+    priority = models.IntegerField(default=0, help_text="Higher runs first")
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True, help_text="Worker that ran the last attempt")
+
+    # Metadata
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
+
+
+class SyncSequence(models.Model):
+    """
+    Counter numbering the changes seen by sync clients (single row, pk=1).
+    Writers increment it under the row lock, so numbers follow commit order.
+    """
+    value = models.BigIntegerField(default=0)
+    purged_seq = models.BigIntegerField(default=0, help_text="Highest sequence number of a purged tombstone")
+
+    class Meta:
+        db_table = 'sync_sequence'
+
+    def __str__(self):
+        return f"Sync sequence at {self.value}"
+
+
+class Tombstone(models.Model):
+    """
+    Record of a deleted route, location, image or comment, so sync clients
+    can drop their copy.
+    """
+    model = models.CharField(max_length=20, help_text="Sync collection name, e.g. 'routes'")
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+    sync_seq = models.BigIntegerField(default=0, help_text="Sync change sequence number of the delete")
+
+    class Meta:
+        db_table = 'tombstones'
+        indexes = [
+            models.Index(fields=['sync_seq', 'id']),
+            models.Index(fields=['deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.model} {self.object_id}"
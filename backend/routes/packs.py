@@ -0,0 +1,267 @@
+"""
+Offline route packs.
+
+A pack is a zip with everything needed to ride a route without signal:
+route.json (geometry and elevation), locations.json, comments.json,
+images.json with a thumbnail per image, and the preview image. Its
+manifest.json lists the SHA-256 of every file, and the pack version is a
+hash of that list, so unchanged content keeps its version.
+
+Packs are built once per version under MEDIA_ROOT/route_packs/<route id>/.
+Files are written to the zip one at a time as they are collected, into a
+temporary file that is renamed once complete, so a pack is never held in
+memory whole.
+A client sending the version it already has (`since`) gets a delta zip
+with only the added or changed files and the list of removed ones.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Q
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+
+from .models import Location, Image, Comment, RouteElevation
+from .previews import ensure_preview
+
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def pack_dir(route_id):
+    return Path(settings.MEDIA_ROOT) / 'route_packs' / str(route_id)
+
+
+def thumbnail_dir():
+    return Path(settings.MEDIA_ROOT) / 'route_packs' / 'thumbnails'
+
+
+def _dump(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':')).encode()
+
+
+def _temp_file(directory):
+    directory.mkdir(parents=True, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=directory, prefix='.', suffix='.tmp', delete=False)
+
+
+def _write_atomic(path, data):
+    with _temp_file(path.parent) as temp:
+        temp.write(data)
+    os.replace(temp.name, path)
+
+
+def source_stamp(route):
+    """
+    Cheap fingerprint of everything a pack is built from. Packs are only
+    rebuilt (and hashed) when it changes.
+    """
+    locations = Location.objects.filter(route=route).aggregate(n=Count('id'), last=Max('updated_at'))
+    images = Image.objects.filter(Q(route=route) | Q(location__route=route)).aggregate(n=Count('id'), last=Max('updated_at'))
+    comments = Comment.objects.filter(route=route).aggregate(
+        n=Count('id'), last=Max('updated_at'), authors=Max('author__updated_at'),
+    )
+    elevation = RouteElevation.objects.filter(route=route).values_list('computed_at', flat=True).first()
+    # Usernames of the creator and comment authors are part of the pack
+    parts = [route.updated_at, route.creator.updated_at, locations, images, comments, elevation]
+    return hashlib.sha256(_dump(parts)).hexdigest()[:16]
+
+
+def thumbnail_path(image_id):
+    return thumbnail_dir() / f'{image_id}.webp'
+
+
+def image_thumbnail(image):
+    """
+    WebP thumbnail of an uploaded image, cached on disk until the image is
+    changed or deleted. Returns None if the file is missing or unreadable.
+    """
+    path = thumbnail_path(image.pk)
+    if path.exists():
+        return path.read_bytes()
+    try:
+        with PILImage.open(image.image.path) as source:
+            picture = ImageOps.exif_transpose(source).convert('RGB')
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
+    size = settings.ROUTE_PACK_IMAGE_SIZE
+    picture.thumbnail((size, size))
+    buffer = io.BytesIO()
+    picture.save(buffer, format='WEBP', quality=80)
+    data = buffer.getvalue()
+    _write_atomic(path, data)
+    return data
+
+
+def collect_files(route):
+    """
+    The pack's files as (name, bytes) pairs, generated one at a time.
+    """
+    elevation = RouteElevation.objects.filter(route=route).values(
+        'profile', 'total_ascent', 'total_descent', 'min_elevation', 'max_elevation', 'max_grade',
+    ).first()
+    yield 'route.json', _dump({
+        'id': route.pk,
+        'title': route.title,
+        'description': route.description,
+        'difficulty': route.difficulty,
+        'distance': route.distance,
+        'duration_days': route.duration_days,
+        'creator': route.creator.username,
+        'geojson': route.geojson,
+        'elevation': elevation,
+        'created_at': route.created_at,
+        'updated_at': route.updated_at,
+    })
+    yield 'locations.json', _dump(list(Location.objects.filter(route=route).order_by('id').values(
+        'id', 'name', 'description', 'location_type', 'latitude', 'longitude', 'updated_at',
+    )))
+    yield 'comments.json', _dump([
+        {'id': pk, 'author': author, 'text': text, 'created_at': created_at, 'updated_at': updated_at}
+        for pk, author, text, created_at, updated_at in Comment.objects.filter(route=route).order_by(
+            'created_at', 'id',
+        ).values_list('id', 'author__username', 'text', 'created_at', 'updated_at')
+    ])
+
+    images = []
+    for image in Image.objects.filter(Q(route=route) | Q(location__route=route)).order_by('id'):
+        thumbnail = image_thumbnail(image)
+        if thumbnail is None:
+            continue
+        name = f'images/{image.pk}.webp'
+        yield name, thumbnail
+        images.append({
+            'id': image.pk,
+            'file': name,
+            'caption': image.caption,
+            'route': image.route_id,
+            'location': image.location_id,
+            'created_at': image.created_at,
+        })
+    yield 'images.json', _dump(images)
+
+    preview = ensure_preview(route)
+    if preview is not None:
+        yield 'preview.webp', preview.read_bytes()
+
+
+def _compression(name):
+    # Thumbnails are already compressed
+    return zipfile.ZIP_STORED if name.endswith('.webp') else zipfile.ZIP_DEFLATED
+
+
+def _write_pack(route, files):
+    """
+    Write (name, bytes) pairs to a temporary zip as they come, followed by
+    the manifest. Returns the temporary path and the manifest.
+    """
+    entries = {}
+    with _temp_file(pack_dir(route.pk)) as temp:
+        try:
+            with zipfile.ZipFile(temp, 'w') as archive:
+                for name, data in files:
+                    archive.writestr(name, data, compress_type=_compression(name))
+                    entries[name] = {'sha256': hashlib.sha256(data).hexdigest(), 'size': len(data)}
+                entries = dict(sorted(entries.items()))
+                version = hashlib.sha256(_dump(entries)).hexdigest()[:16]
+                manifest = {'route': route.pk, 'version': version, 'files': entries}
+                archive.writestr(MANIFEST_NAME, _dump(manifest), compress_type=zipfile.ZIP_DEFLATED)
+        except BaseException:
+            os.unlink(temp.name)
+            raise
+    return Path(temp.name), manifest
+
+
+def load_manifest(route_id, version):
+    path = pack_dir(route_id) / f'{version}.json'
+    if not version.isalnum() or not path.exists():
+        return None
+    return json.loads(path.read_bytes())
+
+
+def build_pack(route):
+    """
+    Return the current manifest of a route's pack, building the pack if
+    its sources changed.
+    """
+    stamp_key = f'route-pack:{route.pk}:{source_stamp(route)}'
+    version = cache.get(stamp_key)
+    if version:
+        manifest = load_manifest(route.pk, version)
+        if manifest and (pack_dir(route.pk) / f'{version}.zip').exists():
+            return manifest
+
+    temp, manifest = _write_pack(route, collect_files(route))
+    directory = pack_dir(route.pk)
+    zip_path = directory / f'{manifest["version"]}.zip'
+    if zip_path.exists():
+        temp.unlink()
+    else:
+        os.replace(temp, zip_path)
+        _write_atomic(directory / f'{manifest["version"]}.json', _dump(manifest))
+        prune_packs(route.pk)
+    cache.set(stamp_key, manifest['version'], 60 * 60 * 24)
+    return manifest
+
+
+def delta_pack(route, manifest, since):
+    """
+    Path of a zip with the files changed since version `since`, or None if
+    that version is unknown.
+    """
+    if not since.isalnum():
+        return None
+    directory = pack_dir(route.pk)
+    path = directory / f'{since}-{manifest["version"]}.zip'
+    if path.exists():
+        return path
+    previous = load_manifest(route.pk, since)
+    if previous is None:
+        return None
+
+    changed = [
+        name for name, entry in manifest['files'].items()
+        if previous['files'].get(name, {}).get('sha256') != entry['sha256']
+    ]
+    delta = dict(manifest, since=since, removed=sorted(set(previous['files']) - set(manifest['files'])))
+    with _temp_file(directory) as temp:
+        try:
+            with zipfile.ZipFile(directory / f'{manifest["version"]}.zip') as full, zipfile.ZipFile(temp, 'w') as archive:
+                for name in changed:
+                    info = zipfile.ZipInfo(name, date_time=full.getinfo(name).date_time)
+                    info.compress_type = _compression(name)
+                    with full.open(name) as source, archive.open(info, 'w') as target:
+                        shutil.copyfileobj(source, target)
+                archive.writestr(MANIFEST_NAME, _dump(delta), compress_type=zipfile.ZIP_DEFLATED)
+        except BaseException:
+            os.unlink(temp.name)
+            raise
+    os.replace(temp.name, path)
+    return path
+
+
+def prune_packs(route_id):
+    """
+    Keep the files of the ROUTE_PACK_KEEP_VERSIONS newest versions.
+    """
+    manifests = sorted(pack_dir(route_id).glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in manifests[settings.ROUTE_PACK_KEEP_VERSIONS:]:
+        version = old.stem
+        for path in pack_dir(route_id).glob(f'*{version}*'):
+            path.unlink(missing_ok=True)
+
+
+def remove_packs(route_id):
+    shutil.rmtree(pack_dir(route_id), ignore_errors=True)
+
+
+def remove_thumbnail(image_id):
+    thumbnail_path(image_id).unlink(missing_ok=True)
@@ -0,0 +1,120 @@
+"""
+Static route preview thumbnails.
+
+Previews are small images of the route polyline drawn with Pillow, cached
+on disk under MEDIA_ROOT/route_previews/ and keyed by route id and
+updated_at, so an edited route gets a new file and URL. They are rendered
+by a background job after a route is saved, or on first request.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from PIL import Image as PILImage, ImageDraw
+
+from .geometry import extract_coordinates
+
+
+BACKGROUND_COLOR = '#f5f5f5'
+ROUTE_COLOR = '#ff6b35'
+START_COLOR = '#2e9e44'
+END_COLOR = '#d62828'
+
+# Draw at a higher resolution and downsample for smooth lines
+SUPERSAMPLE = 2
+
+
+def preview_version(route):
+    return int(route.updated_at.timestamp() * 1_000_000)
+
+
+def preview_dir():
+    return Path(settings.MEDIA_ROOT) / 'route_previews'
+
+
+def preview_path(route):
+    extension = settings.ROUTE_PREVIEW_FORMAT.lower()
+    return preview_dir() / f'{route.pk}-{preview_version(route)}.{extension}'
+
+
+def _project(points):
+    """
+    Web Mercator projection of (lng, lat) points, in radians.
+    """
+    coords = np.asarray(points, dtype=np.float64)
+    lats = np.clip(coords[:, 1], -85.0, 85.0)
+    x = np.radians(coords[:, 0])
+    y = np.log(np.tan(np.pi / 4 + np.radians(lats) / 2))
+    return x, y
+
+
+def render_preview(geojson):
+    """
+    Draw a route path into a Pillow image, or return None if it has fewer
+    than two points.
+    """
+    points = extract_coordinates(geojson)
+    if len(points) < 2:
+        return None
+
+    width, height = settings.ROUTE_PREVIEW_SIZE
+    canvas_width, canvas_height = width * SUPERSAMPLE, height * SUPERSAMPLE
+    padding = 12 * SUPERSAMPLE
+
+    x, y = _project(points)
+    span_x = max(np.ptp(x), 1e-9)
+    span_y = max(np.ptp(y), 1e-9)
+    scale = min((canvas_width - 2 * padding) / span_x, (canvas_height - 2 * padding) / span_y)
+    offset_x = (canvas_width - span_x * scale) / 2
+    offset_y = (canvas_height - span_y * scale) / 2
+    pixels = np.column_stack([
+        offset_x + (x - x.min()) * scale,
+        canvas_height - (offset_y + (y - y.min()) * scale),
+    ]).round().astype(np.int32)
+
+    # Simplify by snapping to pixels and dropping consecutive repeats
+    changed = np.any(np.diff(pixels, axis=0) != 0, axis=1)
+    pixels = pixels[np.concatenate(([True], changed))]
+    path = [tuple(p) for p in pixels.tolist()]
+
+    image = PILImage.new('RGB', (canvas_width, canvas_height), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(image)
+    if len(path) > 1:
+        draw.line(path, fill=ROUTE_COLOR, width=3 * SUPERSAMPLE, joint='curve')
+    marker = 4 * SUPERSAMPLE
+    for (px, py), color in ((path[0], START_COLOR), (path[-1], END_COLOR)):
+        draw.ellipse((px - marker, py - marker, px + marker, py + marker), fill=color, outline='white', width=SUPERSAMPLE)
+
+    return image.resize((width, height), PILImage.LANCZOS)
+
+
+def remove_previews(route_id, keep=None):
+    for path in preview_dir().glob(f'{route_id}-*'):
+        if path != keep:
+            path.unlink(missing_ok=True)
+
+
+def ensure_preview(route):
+    """
+    Return the path of the route's current preview, rendering it if needed.
+    Returns None for routes without a drawable path.
+    """
+    path = preview_path(route)
+    if path.exists():
+        return path
+
+    image = render_preview(route.geojson)
+    if image is None:
+        return None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix='.', suffix='.tmp', delete=False) as temp:
+        try:
+            image.save(temp, format=settings.ROUTE_PREVIEW_FORMAT)
+        except BaseException:
+            os.unlink(temp.name)
+            raise
+    os.replace(temp.name, path)
+    remove_previews(route.pk, keep=path)
+    return path
@@ -1,12 +1,58 @@
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Route, Location, Image, Comment
+from .models import Route, Location, Image, Comment, ImageUpload, RouteElevation
+from users.models import User
 from users.serializers import UserSerializer
+from .duplicates import find_duplicates
+from .geometry import clean_line
+from .previews import preview_version
+from .clusters import MAX_ZOOM, count_tiles
+from .editing import GeometryConflict
 
 
-class ImageSerializer(serializers.ModelSerializer):
+def serialize_users(user_ids, context=None):
+    """
+    {id: serialized user} for the given ids, loaded with one query.
+    """
+    users = User.objects.in_bulk([user_id for user_id in user_ids if user_id is not None])
+    return {user.pk: data for user, data in zip(users.values(), UserSerializer(users.values(), many=True, context=context).data)}
+
+
+class SideloadUsersMixin:
+    """
+    With a `sideloaded_users` set in the context (`?sideload=users`), the
+    nested user in `sideload_user_field` is replaced by its id and the id is
+    added to the set, so the view can list each user once.
+    """
+    sideload_user_field = None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('sideloaded_users') is not None:
+            fields.pop(self.sideload_user_field)
+            fields[f'{self.sideload_user_field}_id'] = serializers.IntegerField(read_only=True)
+        return fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        users = self.context.get('sideloaded_users')
+        if users is not None:
+            users.add(getattr(instance, f'{self.sideload_user_field}_id'))
+        return data
+
+
+class ImageSerializer(SideloadUsersMixin, serializers.ModelSerializer):
     """
     Serializer for Image model.
     """
+    sideload_user_field = 'uploader'
     uploader = UserSerializer(read_only=True)
     uploader_id = serializers.IntegerField(write_only=True, required=False)
 
@@ -47,10 +93,59 @@ class ImageSerializer(serializers.ModelSerializer):
         return super().to_internal_value(data)
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class ImageUploadSerializer(serializers.ModelSerializer):
+    """
+    Serializer for starting a chunked image upload and reporting its progress.
+    """
+    class Meta:
+        model = ImageUpload
+        fields = [
+            'id',
+            'filename',
+            'total_size',
+            'received_size',
+            'caption',
+            'route',
+            'location',
+            'created_at',
+        ]
+        read_only_fields = ['id', 'received_size', 'created_at']
+
+    def validate_total_size(self, value):
+        limit = settings.IMAGE_UPLOAD_MAX_SIZE
+        if value == 0:
+            raise serializers.ValidationError("File must not be empty.")
+        if value > limit:
+            raise serializers.ValidationError(f"File must not be larger than {limit} bytes.")
+        return value
+
+    def validate_filename(self, value):
+        """
+        Keep only the base name; it ends up in a media path.
+        """
+        name = os.path.basename(value.replace('\\', '/')).strip()
+        try:
+            default_storage.get_valid_name(name)
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError("Enter a valid file name.")
+        return name
+
+
+class ImageUploadFinalizeSerializer(serializers.Serializer):
+    """
+    Body of an upload finalize: whether to create a POI at the photo's GPS
+    position, and its name and type.
+    """
+    create_location = serializers.BooleanField(default=False)
+    name = serializers.CharField(max_length=Location._meta.get_field('name').max_length, required=False, allow_blank=True)
+    location_type = serializers.ChoiceField(choices=Location.LOCATION_TYPE_CHOICES, default='viewpoint')
+
+
+class CommentSerializer(SideloadUsersMixin, serializers.ModelSerializer):
     """
     Serializer for Comment model.
     """
+    sideload_user_field = 'author'
     author = UserSerializer(read_only=True)
     author_id = serializers.IntegerField(write_only=True, required=False)
 
@@ -68,10 +163,11 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'author']
 
 
-class LocationSerializer(serializers.ModelSerializer):
+class LocationSerializer(SideloadUsersMixin, serializers.ModelSerializer):
     """
     Serializer for Location (POI) model.
     """
+    sideload_user_field = 'creator'
     creator = UserSerializer(read_only=True)
     creator_id = serializers.IntegerField(write_only=True, required=False)
     images = ImageSerializer(many=True, read_only=True)
@@ -85,6 +181,7 @@ class LocationSerializer(serializers.ModelSerializer):
             'location_type',
             'latitude',
             'longitude',
+            'country',
             'route',
             'creator',
             'creator_id',
@@ -92,18 +189,73 @@ class LocationSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'creator']
+        read_only_fields = ['id', 'country', 'created_at', 'updated_at', 'creator']
 
 
-class RouteSerializer(serializers.ModelSerializer):
+class GeoJSONCleanupMixin:
+    """
+    Validates route GeoJSON, quantizes its coordinates and drops duplicate
+    or stationary points. Responses to writes report how many points were
+    removed under `geometry_cleanup`.
+    """
+
+    def validate_geojson(self, value):
+        """
+        Validate GeoJSON format.
+        """
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("GeoJSON must be a valid JSON object.")
+
+        if 'type' not in value:
+            raise serializers.ValidationError("GeoJSON must have a 'type' field.")
+
+        if 'coordinates' not in value:
+            raise serializers.ValidationError("GeoJSON must have a 'coordinates' field.")
+
+        if value['type'] not in ('LineString', 'MultiLineString'):
+            return value
+
+        lines = value['coordinates'] if value['type'] == 'MultiLineString' else [value['coordinates']]
+        if not isinstance(lines, list):
+            raise serializers.ValidationError("GeoJSON 'coordinates' must be an array.")
+
+        precision = settings.GEOJSON_COORDINATE_PRECISION
+        min_spacing_km = settings.GEOJSON_MIN_POINT_SPACING_M / 1000
+        cleaned = []
+        try:
+            for line in lines:
+                cleaned.append(clean_line(line, precision, min_spacing_km) if line else [])
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+        points_before = sum(len(line) for line in lines)
+        points_after = sum(len(line) for line in cleaned)
+        self._geometry_cleanup = {
+            'points_before': points_before,
+            'points_after': points_after,
+            'removed_points': points_before - points_after,
+        }
+        return {**value, 'coordinates': cleaned if value['type'] == 'MultiLineString' else cleaned[0]}
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        report = getattr(self, '_geometry_cleanup', None)
+        if report is not None:
+            data['geometry_cleanup'] = report
+        return data
+
+
+class RouteSerializer(GeoJSONCleanupMixin, serializers.ModelSerializer):
     """
     Serializer for Route model.
     """
     creator = UserSerializer(read_only=True)
     creator_id = serializers.IntegerField(write_only=True, required=False)
+    geometry_version = serializers.IntegerField(min_value=0, required=False)
     locations = LocationSerializer(many=True, read_only=True)
     images = ImageSerializer(many=True, read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
+    countries = serializers.SerializerMethodField()
 
     # Count fields
     locations_count = serializers.SerializerMethodField()
@@ -118,8 +270,10 @@ class RouteSerializer(serializers.ModelSerializer):
             'description',
             'difficulty',
             'geojson',
+            'geometry_version',
             'distance',
             'duration_days',
+            'countries',
             'creator',
             'creator_id',
             'locations',
@@ -133,6 +287,42 @@ class RouteSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'creator']
 
+    def validate(self, attrs):
+        if self.instance is not None and 'geojson' in attrs and 'geometry_version' not in attrs:
+            raise serializers.ValidationError({
+                'geometry_version': 'The geometry_version the new path is based on is required.',
+            })
+        return attrs
+
+    def create(self, validated_data):
+        validated_data.pop('geometry_version', None)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        """
+        Save only the submitted fields; `trending` is changed concurrently
+        by activity signals and the decay pass and must not be written back.
+        A new path is saved only if `geometry_version` is still current,
+        checked and bumped with a conditional UPDATE as for geometry patches.
+        """
+        version = validated_data.pop('geometry_version', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        with transaction.atomic():
+            if 'geojson' in validated_data:
+                bumped = Route.objects.filter(pk=instance.pk, geometry_version=version).update(
+                    geometry_version=F('geometry_version') + 1,
+                )
+                if not bumped:
+                    current = Route.objects.filter(pk=instance.pk).values_list('geometry_version', flat=True).first()
+                    raise GeometryConflict(current)
+                instance.geometry_version = version + 1
+            instance.save(update_fields=list(validated_data) + ['updated_at'])
+        return instance
+
+    def get_countries(self, obj):
+        return [entry.country for entry in obj.countries.all()]
+
     def get_locations_count(self, obj):
         return obj.locations.count()
 
@@ -143,16 +333,19 @@ class RouteSerializer(serializers.ModelSerializer):
         return obj.comments.count()
 
 
-class RouteListSerializer(serializers.ModelSerializer):
+class RouteListSerializer(SideloadUsersMixin, serializers.ModelSerializer):
     """
     Lightweight serializer for listing routes.
     Doesn't include nested data for better performance.
     """
+    sideload_user_field = 'creator'
     creator = UserSerializer(read_only=True)
     locations_count = serializers.SerializerMethodField()
     images_count = serializers.SerializerMethodField()
     comments_count = serializers.SerializerMethodField()
     first_image = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
+    countries = serializers.SerializerMethodField()
 
     class Meta:
         model = Route
@@ -163,15 +356,20 @@ class RouteListSerializer(serializers.ModelSerializer):
             'difficulty',
             'distance',
             'duration_days',
+            'countries',
             'creator',
             'locations_count',
             'images_count',
             'comments_count',
             'first_image',
+            'preview_url',
             'created_at',
         ]
         read_only_fields = ['id', 'created_at', 'creator']
 
+    def get_countries(self, obj):
+        return [entry.country for entry in obj.countries.all()]
+
     def get_locations_count(self, obj):
         return obj.locations.count()
 
@@ -191,12 +389,23 @@ class RouteListSerializer(serializers.ModelSerializer):
             return first_image.image.url
         return None
 
+    def get_preview_url(self, obj):
+        """Static map thumbnail of the route, versioned so edits bust caches."""
+        url = f"{reverse('route-preview', args=[obj.pk])}?v={preview_version(obj)}"
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(url)
+        return url
+
 
-class RouteCreateSerializer(serializers.ModelSerializer):
+class RouteCreateSerializer(GeoJSONCleanupMixin, serializers.ModelSerializer):
     """
     Serializer for creating routes.
     Simplified without nested data.
+    Reports likely duplicates of the submitted path in the response.
     """
+    possible_duplicates = serializers.SerializerMethodField()
+
     class Meta:
         model = Route
         fields = [
@@ -206,19 +415,157 @@ class RouteCreateSerializer(serializers.ModelSerializer):
             'geojson',
             'distance',
             'duration_days',
+            'possible_duplicates',
         ]
 
-    def validate_geojson(self, value):
-        """
-        Validate GeoJSON format.
-        """
-        if not isinstance(value, dict):
-            raise serializers.ValidationError("GeoJSON must be a valid JSON object.")
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        geojson = attrs.get('geojson')
+        if geojson is not None:
+            exclude_id = self.instance.pk if self.instance else None
+            self._possible_duplicates = find_duplicates(geojson, exclude_route_id=exclude_id)
+        return attrs
 
-        if 'type' not in value:
-            raise serializers.ValidationError("GeoJSON must have a 'type' field.")
+    def get_possible_duplicates(self, obj):
+        return getattr(self, '_possible_duplicates', [])
 
-        if 'coordinates' not in value:
-            raise serializers.ValidationError("GeoJSON must have a 'coordinates' field.")
 
+class RouteElevationSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a route's elevation profile.
+    """
+    class Meta:
+        model = RouteElevation
+        fields = [
+            'route',
+            'profile',
+            'total_ascent',
+            'total_descent',
+            'min_elevation',
+            'max_elevation',
+            'max_grade',
+            'computed_at',
+        ]
+        read_only_fields = fields
+
+
+class GeometryOperationSerializer(serializers.Serializer):
+    """
+    One splice of a route line: points [start, end) are replaced by
+    `coordinates`. `insert` has no end, `delete` no coordinates.
+    """
+    op = serializers.ChoiceField(choices=['insert', 'replace', 'delete'])
+    line = serializers.IntegerField(min_value=0, default=0, help_text="Line index in a MultiLineString")
+    start = serializers.IntegerField(min_value=0)
+    end = serializers.IntegerField(min_value=0, required=False)
+    coordinates = serializers.ListField(child=serializers.ListField(child=serializers.FloatField()), required=False)
+
+    def validate(self, attrs):
+        op = attrs['op']
+        if op == 'insert':
+            if 'end' in attrs:
+                raise serializers.ValidationError({'end': "Inserts take only a start index."})
+            attrs['end'] = attrs['start']
+        elif attrs.get('end') is None or attrs['end'] <= attrs['start']:
+            raise serializers.ValidationError({'end': "Expected an end index greater than start."})
+        if op == 'delete':
+            if attrs.get('coordinates'):
+                raise serializers.ValidationError({'coordinates': "Deletes take no coordinates."})
+            attrs['coordinates'] = []
+        elif not attrs.get('coordinates'):
+            raise serializers.ValidationError({'coordinates': "This field is required."})
+        return attrs
+
+
+class GeometryPatchSerializer(serializers.Serializer):
+    """
+    Body of a geometry patch: the geometry_version it was based on and the
+    operations, applied in order.
+    """
+    version = serializers.IntegerField(min_value=0)
+    operations = GeometryOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    """
+    Query parameters for typeahead suggestions.
+    """
+    q = serializers.CharField(max_length=100, trim_whitespace=False)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.AUTOCOMPLETE_MAX_RESULTS, default=8)
+
+
+class ItineraryQuerySerializer(serializers.Serializer):
+    """
+    Query parameters for the itinerary planner.
+    """
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    days = serializers.IntegerField(min_value=1, max_value=30)
+    max_gap_km = serializers.FloatField(min_value=0, required=False)
+    max_difficulty = serializers.ChoiceField(choices=Route.DIFFICULTY_CHOICES, required=False)
+
+    def validate_max_gap_km(self, value):
+        limit = settings.ITINERARY_MAX_GAP_KM
+        if value > limit:
+            raise serializers.ValidationError(f"Ensure this value is less than or equal to {limit}.")
         return value
+
+
+class LocationClusterQuerySerializer(serializers.Serializer):
+    """
+    Query parameters for POI clusters.
+    """
+    bbox = serializers.CharField(help_text="min_lng,min_lat,max_lng,max_lat")
+    zoom = serializers.IntegerField(min_value=0, max_value=MAX_ZOOM)
+    type = serializers.ChoiceField(choices=Location.LOCATION_TYPE_CHOICES, required=False)
+
+    def validate_bbox(self, value):
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError("Expected min_lng,min_lat,max_lng,max_lat.")
+        if not (-180 <= min_lng < max_lng <= 180 and -90 <= min_lat < max_lat <= 90):
+            raise serializers.ValidationError("Invalid bounding box.")
+        return min_lng, min_lat, max_lng, max_lat
+
+    def validate(self, attrs):
+        if count_tiles(attrs['bbox'], attrs['zoom']) > settings.POI_CLUSTER_MAX_TILES:
+            raise serializers.ValidationError({'bbox': "Bounding box is too large for this zoom level."})
+        return attrs
+
+
+class SyncRouteSerializer(serializers.ModelSerializer):
+    """
+    Flat route representation for delta sync; related objects sync separately.
+    """
+    class Meta:
+        model = Route
+        fields = [
+            'id', 'title', 'description', 'difficulty', 'geojson', 'geometry_version', 'distance',
+            'duration_days', 'creator', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+
+class SyncLocationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Location
+        fields = [
+            'id', 'name', 'description', 'location_type', 'latitude', 'longitude', 'country',
+            'route', 'creator', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+
+class SyncImageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Image
+        fields = ['id', 'image', 'caption', 'route', 'location', 'uploader', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+
+class SyncCommentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Comment
+        fields = ['id', 'text', 'route', 'author', 'created_at', 'updated_at']
+        read_only_fields = fields
@@ -0,0 +1,143 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Route, Location, Image, Comment
+from .jobs import enqueue, PRIORITY_HIGH, PRIORITY_LOW
+from .previews import remove_previews
+from .packs import remove_packs, remove_thumbnail
+from .clusters import location_cell, invalidate_cell
+from .sync import record_change, record_deletion
+from .geocoding import location_country
+from .cards import invalidate_cards
+from . import autocomplete, itineraries, tasks, trending
+
+
+def refresh_cards(*route_ids):
+    """
+    Drop the list cards of changed routes and queue jobs rebuilding them.
+    """
+    route_ids = {route_id for route_id in route_ids if route_id}
+    if not route_ids:
+        return
+    invalidate_cards(route_ids)
+    for route_id in route_ids:
+        enqueue(tasks.refresh_route_card, priority=PRIORITY_HIGH, route_id=route_id)
+
+
+@receiver(pre_save, sender=Route)
+def route_pre_save(sender, instance, raw=False, **kwargs):
+    """
+    Give new routes their initial trending score.
+    """
+    if instance._state.adding and not raw:
+        instance.trending = trending.activity_boost('route')
+
+
+@receiver(post_save, sender=Route)
+def route_saved(sender, instance, raw=False, **kwargs):
+    """
+    Number the change for sync clients, keep the route's itinerary graph
+    and autocomplete entry in sync and queue jobs refreshing its geometry
+    signature, path cells, list card, elevation, feed scores, preview
+    image, countries and heatmap bins.
+    """
+    if raw:
+        return
+    record_change(instance)
+    itineraries.update_route(instance)
+    autocomplete.update_route(instance)
+    refresh_cards(instance.pk)
+    enqueue(tasks.refresh_route_signature, priority=PRIORITY_HIGH, route_id=instance.pk)
+    if not getattr(instance, '_cells_updated', False):
+        enqueue(tasks.refresh_route_cells, priority=PRIORITY_HIGH, route_id=instance.pk)
+    enqueue(tasks.refresh_route_feeds, route_id=instance.pk)
+    enqueue(tasks.render_route_preview, route_id=instance.pk)
+    enqueue(tasks.refresh_route_countries, route_id=instance.pk)
+    enqueue(tasks.refresh_route_heatmap, priority=PRIORITY_LOW, route_id=instance.pk)
+    enqueue(tasks.refresh_route_elevation, priority=PRIORITY_LOW, route_id=instance.pk)
+
+
+@receiver(post_delete, sender=Route)
+def route_deleted(sender, instance, **kwargs):
+    itineraries.remove_route(instance.pk)
+    autocomplete.remove('route', instance.pk)
+    enqueue(tasks.refresh_route_heatmap, priority=PRIORITY_LOW, route_id=instance.pk)
+    remove_previews(instance.pk)
+    remove_packs(instance.pk)
+    record_deletion(instance)
+
+
+@receiver(pre_save, sender=Location)
+def location_pre_save(sender, instance, raw=False, **kwargs):
+    """
+    Set the POI's map cell and country, remembering the stored cell and
+    route so both cached cluster tiles and route cards can be dropped.
+    """
+    instance._cluster_previous = None
+    instance._card_previous_route = None
+    if instance.pk and not raw:
+        previous = Location.objects.filter(pk=instance.pk).values_list('cell', 'location_type', 'route_id').first()
+        if previous:
+            instance._cluster_previous = previous[:2]
+            instance._card_previous_route = previous[2]
+    instance.cell = location_cell(instance.longitude, instance.latitude)
+    instance.country = location_country(instance.longitude, instance.latitude)
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    record_change(instance)
+    previous = getattr(instance, '_cluster_previous', None)
+    if previous:
+        invalidate_cell(*previous)
+    invalidate_cell(instance.cell, instance.location_type)
+    if created and instance.route_id:
+        trending.record_activity(instance.route_id, 'location', instance.created_at)
+    autocomplete.update_location(instance)
+    refresh_cards(instance.route_id, getattr(instance, '_card_previous_route', None))
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    invalidate_cell(instance.cell, instance.location_type)
+    autocomplete.remove('location', instance.pk)
+    record_deletion(instance)
+    refresh_cards(instance.route_id)
+
+
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    record_change(instance)
+    if created and instance.route_id:
+        trending.record_activity(instance.route_id, 'image', instance.created_at)
+    if not created:
+        remove_thumbnail(instance.pk)
+    refresh_cards(instance.route_id)
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted(sender, instance, **kwargs):
+    record_deletion(instance)
+    remove_thumbnail(instance.pk)
+    refresh_cards(instance.route_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    record_change(instance)
+    if created:
+        trending.record_activity(instance.route_id, 'comment', instance.created_at)
+        refresh_cards(instance.route_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    record_deletion(instance)
+    refresh_cards(instance.route_id)
+
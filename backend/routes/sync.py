@@ -0,0 +1,217 @@
+"""
+Delta sync for mobile clients.
+
+Every write a sync client can see takes the next number of a change
+sequence: a counter row incremented inside the writing transaction, whose
+row lock is held until commit, so numbers are handed out in commit order.
+Saved rows carry the number in `sync_seq` and deletes are recorded as
+tombstones with one. A sync token holds the highest number the client has
+seen; the next sync sends the rows and tombstones numbered above it, up to
+the counter value read when the sync started. Nothing committed later can
+get a number below that, so no change is skipped.
+
+Results are paged with a signed cursor holding the sync window, the
+collection being read and the (sync_seq, id) of the last row sent. The
+new sync token is returned with the last page.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import Route, Location, Image, Comment, Tombstone, SyncSequence
+from .serializers import (
+    SyncRouteSerializer,
+    SyncLocationSerializer,
+    SyncImageSerializer,
+    SyncCommentSerializer,
+)
+
+
+# (collection name, model, serializer) in the order they are sent
+COLLECTIONS = [
+    ('routes', Route, SyncRouteSerializer),
+    ('locations', Location, SyncLocationSerializer),
+    ('images', Image, SyncImageSerializer),
+    ('comments', Comment, SyncCommentSerializer),
+]
+COLLECTION_NAMES = {model: name for name, model, _ in COLLECTIONS}
+
+TOKEN_SALT = 'routes.sync.token'
+CURSOR_SALT = 'routes.sync.cursor'
+# Rows numbered per query by stamp()
+STAMP_BATCH = 1000
+
+
+class SyncTokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Sync token is too old; sync again without `since`.'
+    default_code = 'sync_token_expired'
+
+
+def next_sequence(count=1):
+    """
+    Reserve `count` sequence numbers and return the highest. Call inside
+    the transaction making the change; the counter stays locked until it
+    commits.
+    """
+    with transaction.atomic():
+        if not SyncSequence.objects.filter(pk=1).update(value=F('value') + count):
+            SyncSequence.objects.create(pk=1, value=count)
+        return SyncSequence.objects.filter(pk=1).values_list('value', flat=True).get()
+
+
+def current_sequence():
+    """
+    Highest committed sequence number and the highest purged one.
+    """
+    return SyncSequence.objects.filter(pk=1).values_list('value', 'purged_seq').first() or (0, 0)
+
+
+def stamp(model, pks):
+    """
+    Mark rows changed by a write that bypasses save signals, such as
+    bulk_create or bulk_update.
+    """
+    pks = list(pks)
+    if not pks:
+        return
+    with transaction.atomic():
+        seq = next_sequence()
+        for i in range(0, len(pks), STAMP_BATCH):
+            model.objects.filter(pk__in=pks[i:i + STAMP_BATCH]).update(sync_seq=seq)
+
+
+def make_token(seq):
+    return signing.dumps({'seq': seq}, salt=TOKEN_SALT, compress=True)
+
+
+def read_token(token):
+    """
+    Sequence number up to which the token's holder is in sync.
+    """
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise ValidationError({'since': 'Invalid sync token.'})
+    if not isinstance(data, dict) or 'seq' not in data:
+        # Tokens from before the change sequence was kept
+        raise SyncTokenExpired()
+    try:
+        seq = int(data['seq'])
+    except (TypeError, ValueError):
+        raise ValidationError({'since': 'Invalid sync token.'})
+    if seq < current_sequence()[1]:
+        raise SyncTokenExpired()
+    return seq
+
+
+def make_cursor(since, until, stage, after=None):
+    return signing.dumps({
+        'since': since,
+        'until': until,
+        'stage': stage,
+        'after': list(after) if after else None,
+    }, salt=CURSOR_SALT, compress=True)
+
+
+def read_cursor(cursor):
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+        since = int(data['since']) if data['since'] is not None else None
+        after = (int(data['after'][0]), int(data['after'][1])) if data['after'] else None
+        return since, int(data['until']), int(data['stage']), after
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def _window(queryset, since, until, after):
+    queryset = queryset.filter(sync_seq__lte=until)
+    if since is not None:
+        queryset = queryset.filter(sync_seq__gt=since)
+    if after:
+        seq, pk = after
+        queryset = queryset.filter(Q(sync_seq__gt=seq) | Q(sync_seq=seq, id__gt=pk))
+    return queryset.order_by('sync_seq', 'id')
+
+
+def sync_page(since=None, until=None, stage=0, after=None, page_size=None, context=None):
+    """
+    One page of changes numbered in (since, until]. `since` None means a
+    full sync, which needs no tombstones.
+    """
+    if until is None:
+        until = current_sequence()[0]
+    remaining = page_size or settings.SYNC_PAGE_SIZE
+    last_stage = len(COLLECTIONS) if since is not None else len(COLLECTIONS) - 1
+    changes = {name: [] for name, _, _ in COLLECTIONS}
+    deleted = {name: [] for name, _, _ in COLLECTIONS}
+    cursor = None
+
+    while stage <= last_stage and remaining > 0:
+        if stage < len(COLLECTIONS):
+            name, model, serializer_class = COLLECTIONS[stage]
+            rows = list(_window(model.objects.all(), since, until, after)[:remaining + 1])
+            more = len(rows) > remaining
+            rows = rows[:remaining]
+            changes[name] += serializer_class(rows, many=True, context=context).data
+        else:
+            rows = list(_window(Tombstone.objects.all(), since, until, after)[:remaining + 1])
+            more = len(rows) > remaining
+            rows = rows[:remaining]
+            for tombstone in rows:
+                deleted[tombstone.model].append(tombstone.object_id)
+
+        remaining -= len(rows)
+        if more:
+            last = rows[-1]
+            cursor = make_cursor(since, until, stage, (last.sync_seq, last.id))
+            break
+        stage += 1
+        after = None
+        if remaining == 0 and stage <= last_stage:
+            cursor = make_cursor(since, until, stage)
+
+    return {
+        'changes': changes,
+        'deleted': deleted,
+        'cursor': cursor,
+        'sync_token': None if cursor else make_token(until),
+    }
+
+
+def record_change(instance):
+    """
+    Number a saved route, location, image or comment as the latest change.
+    """
+    with transaction.atomic():
+        instance.sync_seq = next_sequence()
+        type(instance).objects.filter(pk=instance.pk).update(sync_seq=instance.sync_seq)
+
+
+def record_deletion(instance):
+    with transaction.atomic():
+        Tombstone.objects.create(
+            model=COLLECTION_NAMES[type(instance)], object_id=instance.pk, sync_seq=next_sequence(),
+        )
+
+
+def purge_tombstones():
+    """
+    Delete tombstones older than SYNC_TOMBSTONE_DAYS. Tokens from before
+    the newest purged tombstone are rejected, so no client needs them.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    with transaction.atomic():
+        expired = Tombstone.objects.filter(deleted_at__lt=cutoff)
+        purged_seq = expired.aggregate(seq=Max('sync_seq'))['seq']
+        if purged_seq is None:
+            return 0
+        deleted, _ = expired.filter(sync_seq__lte=purged_seq).delete()
+        SyncSequence.objects.filter(pk=1, purged_seq__lt=purged_seq).update(purged_seq=purged_seq)
+    return deleted
@@ -0,0 +1,82 @@
+"""
+Background tasks run by the job worker after routes change.
+"""
+from users.stats import refresh_countries
+
+from .cards import build_cards
+from .cells import update_route_cells
+from .duplicates import update_route_signature
+from .elevation import update_route_elevation
+from .feed import rebuild_feeds, refresh_route_feed
+from .geocoding import update_route_countries
+from .heatmap import rebuilding, update_route_heatmap
+from .jobs import task
+from .models import Route
+from .previews import ensure_preview
+
+
+def _get_route(route_id, *fields):
+    queryset = Route.objects.only(*fields) if fields else Route.objects.all()
+    return queryset.filter(pk=route_id).first()
+
+
+@task
+def refresh_route_signature(route_id):
+    route = _get_route(route_id, 'id', 'geojson')
+    if route is not None:
+        update_route_signature(route)
+
+
+@task
+def refresh_route_elevation(route_id):
+    route = _get_route(route_id, 'id', 'geojson')
+    if route is not None:
+        update_route_elevation(route)
+
+
+@task
+def refresh_route_feeds(route_id):
+    route = _get_route(route_id, 'id')
+    if route is not None:
+        refresh_route_feed(route)
+
+
+@task
+def build_user_feed(user_id):
+    rebuild_feeds([user_id])
+
+
+@task
+def render_route_preview(route_id):
+    route = _get_route(route_id, 'id', 'geojson', 'updated_at')
+    if route is not None:
+        ensure_preview(route)
+
+
+@task
+def refresh_route_countries(route_id):
+    route = _get_route(route_id, 'id', 'geojson', 'creator_id')
+    if route is not None and update_route_countries(route) is not None:
+        refresh_countries(route.creator_id)
+        build_cards([route_id])
+
+
+@task
+def refresh_route_cells(route_id):
+    route = _get_route(route_id, 'id', 'geojson')
+    if route is not None:
+        update_route_cells(route)
+
+
+@task
+def refresh_route_card(route_id):
+    build_cards([route_id])
+
+
+@task
+def refresh_route_heatmap(route_id):
+    # Replayed by rebuild_heatmap when it is done
+    if rebuilding():
+        return
+    route = _get_route(route_id, 'id', 'geojson')
+    update_route_heatmap(route_id, route.geojson if route is not None else None)
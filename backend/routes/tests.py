@@ -1,3 +1,481 @@
-from django.test import TestCase
+import asyncio
+import io
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import autocomplete, cells, itineraries, loadtest, packs, sync, tasks, throttling
+from .geometry import clean_line, cumulative_distance_km
+from .feed import refresh_route_feed
+from .models import Comment, FeedEntry, Image, ImageUpload, Job, Location, Route, Tombstone
+
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+UNTHROTTLED = {scope: {'capacity': 10 ** 9, 'refill_rate': 10 ** 9} for scope in ('user', 'anon')}
+PATH = {'type': 'LineString', 'coordinates': [[10.0, 45.0], [10.01, 45.01], [10.02, 45.0]]}
+
+
+def create_user(username='rider'):
+    return get_user_model().objects.create_user(username, f'{username}@example.com', 'correct-horse-42')
+
+
+def temporary_media(test_case):
+    media_root = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+    override = override_settings(MEDIA_ROOT=media_root, IMAGE_UPLOAD_TEMP_DIR=f'{media_root}/uploads_tmp')
+    override.enable()
+    test_case.addCleanup(override.disable)
+    return media_root
+
+
+def create_route(creator, **fields):
+    fields = {'title': 'Passo dello Stelvio', 'description': 'Hairpins', 'difficulty': 'hard',
+              'distance': 3.0, 'geojson': PATH, **fields}
+    return Route.objects.create(creator=creator, **fields)
+
+
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        throttling._store = None
+        self.addCleanup(setattr, throttling, '_store', None)
+
+    def test_endpoint_cost(self):
+        path = reverse('route-autocomplete')
+        request = APIRequestFactory().get(path)
+        request.resolver_match = resolve(path)
+        self.assertEqual(throttling.endpoint_cost(request), 0.25)
+        request.method = 'DELETE'
+        self.assertEqual(throttling.endpoint_cost(request), throttling.DEFAULT_COST)
+
+    def test_local_bucket_refills(self):
+        store = throttling.LocalBucketStore()
+        for _ in range(4):
+            self.assertEqual(store.consume('k', 1, 4, 2.0, 100.0), 0)
+        self.assertEqual(store.consume('k', 1, 4, 2.0, 100.0), 0.5)
+        self.assertEqual(store.consume('k', 1, 4, 2.0, 100.5), 0)
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_cache_bucket_counts_fractional_costs(self):
+        store = throttling.CacheBucketStore()
+        for _ in range(8):
+            self.assertEqual(store.consume('frac', 0.25, 2, 1.0, 1000.0), 0)
+        self.assertEqual(store.consume('frac', 0.25, 2, 1.0, 1001.5), 0.5)
+        # The next window starts with a full bucket
+        self.assertEqual(store.consume('frac', 0.25, 2, 1.0, 1002.0), 0)
+
+    @override_settings(THROTTLE_BUCKETS={'user': {'capacity': 3, 'refill_rate': 0.01}, 'anon': {'capacity': 3, 'refill_rate': 0.01}})
+    def test_requests_are_charged_their_cost(self):
+        client = APIClient()
+        # Route list requests cost 2, so the second one overdraws the bucket
+        self.assertEqual(client.get(reverse('route-list-create')).status_code, 200)
+        response = client.get(reverse('route-list-create'))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    @override_settings(
+        THROTTLE_BUCKETS={'user': {'capacity': 3, 'refill_rate': 0.01}, 'anon': {'capacity': 3, 'refill_rate': 0.01}},
+        THROTTLE_EXEMPT_USERNAME_PREFIX='loadtest-',
+    )
+    def test_exempt_users_are_not_throttled(self):
+        client = APIClient()
+        client.force_authenticate(create_user('loadtest-0'))
+        for _ in range(3):
+            self.assertEqual(client.get(reverse('route-list-create')).status_code, 200)
+        client.force_authenticate(create_user('rider'))
+        client.get(reverse('route-list-create'))
+        self.assertEqual(client.get(reverse('route-list-create')).status_code, 429)
+
+    def test_autocomplete_does_not_query_the_database(self):
+        autocomplete.get_index()
+        client = APIClient()
+        with self.assertNumQueries(0):
+            response = client.get(reverse('route-autocomplete'), {'q': 'pass'})
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(THROTTLE_BUCKETS=UNTHROTTLED)
+class RouteGeometryVersionTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.route = create_route(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('route-detail', args=[self.route.pk])
+        self.new_path = {'type': 'LineString', 'coordinates': [[11.0, 46.0], [11.01, 46.01]]}
+
+    def test_new_path_requires_version(self):
+        response = self.client.patch(self.url, {'geojson': self.new_path}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('geometry_version', response.data)
+
+    def test_other_fields_need_no_version(self):
+        response = self.client.patch(self.url, {'title': 'Stelvio'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_current_version_saves_and_bumps(self):
+        response = self.client.patch(self.url, {'geojson': self.new_path, 'geometry_version': 0}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.geometry_version, 1)
+        self.assertEqual(self.route.geojson['coordinates'][0], [11.0, 46.0])
+
+    def test_outdated_version_conflicts(self):
+        Route.objects.filter(pk=self.route.pk).update(geometry_version=3)
+        response = self.client.patch(self.url, {'geojson': self.new_path, 'geometry_version': 2}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['version'], 3)
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.geojson, PATH)
+
+    def test_outdated_geometry_patch_conflicts(self):
+        Route.objects.filter(pk=self.route.pk).update(geometry_version=1)
+        operations = [{'op': 'replace', 'start': 1, 'end': 2, 'coordinates': [[10.015, 45.015]]}]
+        url = reverse('route-geometry', args=[self.route.pk])
+        response = self.client.patch(url, {'version': 0, 'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.patch(url, {'version': 1, 'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.geometry_version, 2)
+
+
+@override_settings(THROTTLE_BUCKETS=UNTHROTTLED)
+class AdminBulkDeleteTests(TestCase):
+
+    def setUp(self):
+        temporary_media(self)
+        self.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'correct-horse-42')
+        self.client.force_login(self.admin)
+        self.user = create_user()
+        self.routes = [create_route(self.user, title=f'Route {i}') for i in range(3)]
+        for route in self.routes:
+            location = Location.objects.create(
+                route=route, creator=self.user, name='Viewpoint', location_type='viewpoint', latitude=45.0, longitude=10.0,
+            )
+            Image.objects.create(
+                route=route, location=location, uploader=self.user,
+                image=SimpleUploadedFile('photo.gif', b'GIF89a\x01\x00\x01\x00\x00\x00\x00;', content_type='image/gif'),
+            )
+            Comment.objects.create(route=route, author=self.user, text='Great road')
+
+    def delete_selected(self, model):
+        url = reverse(f'admin:routes_{model._meta.model_name}_changelist')
+        response = self.client.post(url, {
+            'action': 'delete_selected',
+            'post': 'yes',
+            '_selected_action': list(model.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(model.objects.exists())
+
+    def test_bulk_delete(self):
+        for model in (Comment, Image, Location, Route):
+            with self.subTest(model=model.__name__):
+                self.delete_selected(model)
+        self.assertEqual(Tombstone.objects.filter(model='locations').count(), 3)
+        stats = self.user.stats
+        stats.refresh_from_db()
+        self.assertEqual((stats.route_count, stats.locations_count, stats.images_count, stats.comments_count), (0, 0, 0, 0))
+
+
+@override_settings(THROTTLE_BUCKETS=UNTHROTTLED)
+class ResumableUploadTests(TestCase):
+
+    def setUp(self):
+        temporary_media(self)
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (64, 48), 'orange').save(buffer, format='JPEG')
+        self.data = buffer.getvalue()
+        response = self.client.post(reverse('image-upload-create'), {
+            'filename': '../../summit.jpg', 'total_size': len(self.data), 'caption': 'Summit',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['filename'], 'summit.jpg')
+        self.url = reverse('image-upload-detail', args=[response.data['id']])
+
+    def put_chunk(self, offset, data):
+        return self.client.generic('PUT', self.url, data, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunks_resume_and_finalize(self):
+        middle = len(self.data) // 2
+        response = self.put_chunk(0, self.data[:middle])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['received_size'], middle)
+
+        # A retried chunk at an old offset is refused with the offset to resume from
+        response = self.put_chunk(0, self.data[:middle])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['received_size'], middle)
+        self.assertEqual(self.client.get(self.url).data['received_size'], middle)
+
+        response = self.put_chunk(middle, self.data[middle:] + b'extra')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.put_chunk(middle, self.data[middle:]).status_code, 200)
+
+        response = self.client.post(f'{self.url}finalize/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        image = Image.objects.get()
+        self.assertEqual(image.caption, 'Summit')
+        with image.image.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(ImageUpload.objects.exists())
+
+    def test_incomplete_upload_is_not_finalized(self):
+        self.put_chunk(0, self.data[:10])
+        response = self.client.post(f'{self.url}finalize/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['received_size'], 10)
+
+
+class ItineraryGraphTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, itineraries, '_graph', None)
+        user = create_user()
+        self.first = create_route(user)
+        self.second = create_route(user, title='Passo Gavia', geojson={
+            'type': 'LineString', 'coordinates': [[10.03, 45.0], [10.2, 45.1], [10.5, 45.2]],
+        })
+        for route in (self.first, self.second):
+            tasks.refresh_route_signature(route_id=route.pk)
+
+    def test_graph_is_built_from_signature_endpoints(self):
+        with self.assertNumQueries(1):
+            graph = itineraries.build_graph()
+        self.assertEqual(graph.nodes[self.second.pk].start, (10.03, 45.0))
+        self.assertEqual(graph.nodes[self.second.pk].end, (10.5, 45.2))
+        itinerary = graph.plan((10.0, 45.0), days=2, max_gap_km=5)[0]
+        self.assertEqual([leg.node.id for leg in itinerary], [self.first.pk, self.second.pk])
+
+    def test_expired_graph_is_rebuilt_in_the_background(self):
+        graph = itineraries.get_graph()
+        graph.built_at = time.monotonic() - settings.ITINERARY_GRAPH_TTL - 1
+        self.addCleanup(setattr, itineraries, '_rebuilding', False)
+        with mock.patch.object(itineraries.threading, 'Thread') as thread, self.assertNumQueries(0):
+            self.assertIs(itineraries.get_graph(), graph)
+            self.assertIs(itineraries.get_graph(), graph)
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once_with()
+
+
+@override_settings(THROTTLE_BUCKETS=UNTHROTTLED)
+class RoutesPassingTests(TestCase):
+
+    def setUp(self):
+        user = create_user()
+        # A 10 km circle around (10, 45); 9.5 km is 0.0853 degrees of latitude
+        self.routes = {
+            name: create_route(user, title=name, geojson={'type': 'LineString', 'coordinates': coordinates})
+            for name, coordinates in {
+                'through': [[9.9, 45.0], [10.1, 45.0]],
+                'skimming': [[9.98, 45.0853], [10.02, 45.0853]],
+                'near miss': [[9.98, 45.0934], [10.02, 45.0934]],
+                'far': [[11.0, 46.0], [11.1, 46.1]],
+            }.items()
+        }
+        for route in self.routes.values():
+            tasks.refresh_route_cells(route_id=route.pk)
+
+    def passing(self, shape):
+        return set(Route.objects.filter(cells.routes_passing(shape)).values_list('title', flat=True))
+
+    def test_circle(self):
+        self.assertEqual(self.passing(cells.CircleShape(10.0, 45.0, 10)), {'through', 'skimming'})
+
+    def test_polygon(self):
+        shape = cells.PolygonShape([[9.99, 45.08], [10.01, 45.08], [10.01, 45.09], [9.99, 45.09]])
+        self.assertEqual(self.passing(shape), {'skimming'})
+
+    def test_circle_filter(self):
+        response = APIClient().get(reverse('route-list-create'), {'circle': '10,45,10'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({route['title'] for route in response.json()['results']}, {'through', 'skimming'})
+
+    def test_long_id_lists_take_one_parameter(self):
+        ids = [route.pk for route in self.routes.values()] + list(range(10 ** 6, 10 ** 6 + 300_000))
+        self.assertEqual(Route.objects.filter(id__in=cells._id_list(ids)).count(), 4)
+
+
+class CleanLineTests(TestCase):
+
+    def test_points_are_spaced_from_the_last_kept_point(self):
+        # About 0.3 km apart along a meridian
+        coordinates = [[10.0, 45.0 + i * 0.0027] for i in range(12)]
+        points = np.array(clean_line(coordinates, 6, 0.5))
+        steps = np.diff(cumulative_distance_km(points[:, 0], points[:, 1]))
+        self.assertTrue((steps[:-1] >= 0.5).all())
+        self.assertEqual(points[0].tolist(), coordinates[0])
+        self.assertEqual(points[-1].tolist(), coordinates[-1])
+
+    def test_duplicates_and_jitter_are_dropped(self):
+        coordinates = [[10.0, 45.0], [10.0, 45.0], [10.00001, 45.0], [10.01, 45.0], [10.01, 45.0]]
+        self.assertEqual(clean_line(coordinates, 6, 0.005), [[10.0, 45.0], [10.01, 45.0]])
+        self.assertEqual(clean_line(coordinates, 6, 0), [[10.0, 45.0], [10.00001, 45.0], [10.01, 45.0]])
+
+
+@override_settings(THROTTLE_BUCKETS=UNTHROTTLED)
+class RouteFeedTests(TestCase):
+
+    def setUp(self):
+        self.reader = create_user('reader')
+        self.reader_route = create_route(self.reader, title='Home loop')
+        author = create_user('author')
+        self.routes = [create_route(author, title=f'Route {i}') for i in range(3)]
+        for route in [self.reader_route, *self.routes]:
+            tasks.refresh_route_signature(route_id=route.pk)
+            tasks.refresh_route_cells(route_id=route.pk)
+
+    def test_first_read_builds_the_feed(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        response = client.get(reverse('route-feed'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 3)
+        job = Job.objects.get(task=tasks.build_user_feed.task_name)
+        self.assertEqual(job.kwargs, {'user_id': self.reader.pk})
+
+        tasks.build_user_feed(user_id=self.reader.pk)
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 3)
+
+    def test_nearby_user_without_a_feed_gets_a_full_one(self):
+        refresh_route_feed(self.routes[0])
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=self.reader).values_list('route_id', flat=True)),
+            {route.pk for route in self.routes},
+        )
+
+
+class RoutePackSourceTests(TestCase):
+
+    def setUp(self):
+        temporary_media(self)
+        user = create_user()
+        self.route = create_route(user)
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (64, 48), 'orange').save(buffer, format='JPEG')
+        self.image = Image.objects.create(
+            route=self.route, uploader=user, image=SimpleUploadedFile('photo.jpg', buffer.getvalue()),
+        )
+
+    def test_caption_change_changes_the_stamp(self):
+        stamp = packs.source_stamp(self.route)
+        self.image.caption = 'Summit'
+        self.image.save()
+        self.assertNotEqual(packs.source_stamp(self.route), stamp)
+
+    def test_thumbnail_is_dropped_with_its_image(self):
+        self.assertIsNotNone(packs.image_thumbnail(self.image))
+        path = packs.thumbnail_path(self.image.pk)
+        self.assertTrue(path.exists())
+        self.image.save()
+        self.assertFalse(path.exists())
+        packs.image_thumbnail(self.image)
+        self.image.delete()
+        self.assertFalse(path.exists())
+
+
+class LoadTestRunTests(TestCase):
+
+    def test_ramp_up_is_not_measured(self):
+        started = []
+
+        async def scenario(user, data):
+            started.append(asyncio.get_running_loop().time())
+            await asyncio.sleep(0.01)
+
+        async def run():
+            begin = asyncio.get_running_loop().time()
+            stats, elapsed = await loadtest.run('http://127.0.0.1:9', {'tick': 1}, 4, 0.2, [], None, 1, ramp_up=0.2)
+            return begin, stats, elapsed
+
+        with mock.patch.dict(loadtest.SCENARIOS, {'tick': scenario}):
+            begin, stats, elapsed = asyncio.run(run())
+        recorded = len(stats.latencies['tick'])
+        self.assertGreater(recorded, 0)
+        self.assertLessEqual(recorded, len([t for t in started if t >= begin + 0.2]))
+        self.assertLess(recorded, len(started))
+        self.assertLess(elapsed, 0.3)
+
+
+@override_settings(THROTTLE_BUCKETS=UNTHROTTLED)
+class SyncTombstoneTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        user = create_user()
+        self.route = create_route(user)
+        self.location = Location.objects.create(
+            route=self.route, creator=user, name='Viewpoint', location_type='viewpoint', latitude=45.0, longitude=10.0,
+        )
+        self.comments = [Comment.objects.create(route=self.route, author=user, text=f'Comment {i}') for i in range(3)]
+
+    def sync(self, **params):
+        # Follow the cursors of one sync and merge its pages
+        changes, deleted = {}, {}
+        response = self.client.get(reverse('sync'), params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            for name, rows in response.data['changes'].items():
+                changes.setdefault(name, []).extend(row['id'] for row in rows)
+            for name, ids in response.data['deleted'].items():
+                deleted.setdefault(name, []).extend(ids)
+            if response.data['cursor'] is None:
+                return changes, deleted, response.data['sync_token']
+            response = self.client.get(reverse('sync'), {'cursor': response.data['cursor']})
+
+    def test_deletes_are_sent_once_as_tombstones(self):
+        changes, deleted, token = self.sync()
+        self.assertEqual(len(changes['comments']), 3)
+        self.assertFalse(any(deleted.values()))
+
+        deleted_ids = [self.comments[0].pk, self.comments[1].pk]
+        location_id = self.location.pk
+        for comment in self.comments[:2]:
+            comment.delete()
+        self.location.delete()
+        changes, deleted, token = self.sync(since=token)
+        self.assertEqual(sorted(deleted['comments']), sorted(deleted_ids))
+        self.assertEqual(deleted['locations'], [location_id])
+        self.assertEqual(changes['comments'], [])
+
+        changes, deleted, _ = self.sync(since=token)
+        self.assertFalse(any(deleted.values()))
+
+    @override_settings(SYNC_PAGE_SIZE=1)
+    def test_tombstones_are_paged(self):
+        _, _, token = self.sync()
+        comment_ids = [comment.pk for comment in self.comments]
+        Comment.objects.filter(route=self.route).delete()
+        self.route.title = 'Stelvio'
+        self.route.save()
+        changes, deleted, _ = self.sync(since=token)
+        self.assertEqual(changes['routes'], [self.route.pk])
+        self.assertEqual(sorted(deleted['comments']), comment_ids)
+
+    def test_tokens_older_than_purged_tombstones_expire(self):
+        _, _, token = self.sync()
+        self.comments[0].delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS + 1))
+        self.assertEqual(sync.purge_tombstones(), 1)
+        response = self.client.get(reverse('sync'), {'since': token})
+        self.assertEqual(response.status_code, 410)
+        # A full sync still works and hands out a usable token
+        _, _, token = self.sync()
+        self.assertEqual(self.client.get(reverse('sync'), {'since': token}).status_code, 200)
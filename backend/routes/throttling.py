@@ -0,0 +1,190 @@
+"""
+Cost-based throttling and load shedding.
+
+Every endpoint has a cost per request (see ENDPOINT_COSTS, keyed by URL
+name). CostThrottle charges that cost against a token bucket per user, or
+per IP for anonymous clients, and answers 429 with Retry-After once the
+bucket is empty. Buckets live in process memory by default, or in a
+Redis or Memcached cache shared by all workers. ConcurrencyLimitMiddleware caps how many expensive
+requests a worker process serves at once and sheds the rest with 503, so
+cheap endpoints keep their latency under abuse.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+
+DEFAULT_COST = 1
+# CacheBucketStore counts costs in hundredths, as cache.incr adds integers
+COST_UNITS = 100
+
+# Cost of a request per URL name and method. Full-geometry reads, uploads
+# and planner queries are the most expensive in response size and queries.
+# Typeahead requests come with every keystroke but are answered from an
+# in-memory index.
+ENDPOINT_COSTS = {
+    'route-list-create': {'GET': 2, 'POST': 5},
+    'route-feed': {'GET': 2},
+    'route-itineraries': {'GET': 5},
+    'route-autocomplete': {'GET': 0.25},
+    'route-detail': {'GET': 8, 'PUT': 8, 'PATCH': 8, 'DELETE': 3},
+    'route-geometry': {'PATCH': 3},
+    'user-routes': {'GET': 2},
+    'route-locations': {'GET': 2},
+    'route-comments': {'GET': 1},
+    'route-elevation': {'GET': 3},
+    'route-preview': {'GET': 1},
+    'route-heatmap': {'GET': 1},
+    'route-pack': {'GET': 10},
+    'route-pack-manifest': {'GET': 2},
+    'location-list-create': {'GET': 2, 'POST': 2},
+    'location-clusters': {'GET': 2},
+    'location-detail': {'GET': 1, 'PUT': 2, 'PATCH': 2, 'DELETE': 2},
+    'image-list-create': {'GET': 2, 'POST': 10},
+    'image-detail': {'GET': 1, 'DELETE': 2},
+    'image-upload-create': {'POST': 2},
+    'image-upload-detail': {'GET': 1, 'PUT': 5, 'DELETE': 1},
+    'image-upload-finalize': {'POST': 10},
+    'comment-list-create': {'GET': 1, 'POST': 2},
+    'comment-detail': {'GET': 1, 'PUT': 2, 'PATCH': 2, 'DELETE': 1},
+    'sync': {'GET': 5},
+}
+
+
+def endpoint_cost(request):
+    """
+    Cost of a request according to ENDPOINT_COSTS.
+    """
+    match = getattr(request, 'resolver_match', None)
+    costs = ENDPOINT_COSTS.get(match.url_name if match else None, {})
+    return costs.get(request.method, DEFAULT_COST)
+
+
+class LocalBucketStore:
+    """
+    Token buckets kept in process memory.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def consume(self, key, cost, capacity, refill_rate, now):
+        """
+        Take `cost` tokens from the bucket at `key`. Returns the number of
+        seconds to wait before the request could succeed, or 0 if it did.
+        """
+        with self.lock:
+            tokens, last = self.buckets.get(key, (capacity, now))
+            tokens, wait = _take(tokens, last, cost, capacity, refill_rate, now)
+            self.buckets[key] = (tokens, now)
+        return wait
+
+
+class CacheBucketStore:
+    """
+    Buckets shared between worker processes through the default cache,
+    which needs an atomic incr (Redis or Memcached). A bucket is
+    approximated by a window of capacity / refill_rate seconds in which
+    `capacity` can be spent, counted with a single incr per request.
+    """
+
+    def consume(self, key, cost, capacity, refill_rate, now):
+        window = capacity / refill_rate
+        number = math.floor(now / window)
+        cache_key = f'throttle:{key}:{number}'
+        units = round(min(cost, capacity) * COST_UNITS)
+        timeout = math.ceil(window) + 1
+        cache.add(cache_key, 0, timeout=timeout)
+        try:
+            spent = cache.incr(cache_key, units)
+        except ValueError:
+            # The window expired between add and incr
+            cache.add(cache_key, units, timeout=timeout)
+            spent = units
+        if spent <= capacity * COST_UNITS:
+            return 0
+        return (number + 1) * window - now
+
+
+def _take(tokens, last, cost, capacity, refill_rate, now):
+    cost = min(cost, capacity)
+    tokens = min(capacity, tokens + max(now - last, 0) * refill_rate)
+    if tokens >= cost:
+        return tokens - cost, 0
+    return tokens, (cost - tokens) / refill_rate
+
+
+_store = None
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        _store = import_string(settings.THROTTLE_BUCKET_STORE)()
+    return _store
+
+
+class CostThrottle(BaseThrottle):
+    """
+    Token bucket throttle charging each request its endpoint cost. Users
+    whose username starts with THROTTLE_EXEMPT_USERNAME_PREFIX are not
+    throttled.
+    """
+
+    def allow_request(self, request, view):
+        if request.user and request.user.is_authenticated:
+            prefix = settings.THROTTLE_EXEMPT_USERNAME_PREFIX
+            if prefix and request.user.username.startswith(prefix):
+                return True
+            scope, ident = 'user', request.user.pk
+        else:
+            scope, ident = 'anon', self.get_ident(request)
+        bucket = settings.THROTTLE_BUCKETS[scope]
+
+        self.retry_after = get_bucket_store().consume(
+            f'{scope}:{ident}',
+            endpoint_cost(request),
+            bucket['capacity'],
+            bucket['refill_rate'],
+            time.time(),
+        )
+        return self.retry_after == 0
+
+    def wait(self):
+        return self.retry_after
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Shed expensive requests with 503 when a worker process is already
+    serving THROTTLE_MAX_CONCURRENT_EXPENSIVE of them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slots = threading.BoundedSemaphore(settings.THROTTLE_MAX_CONCURRENT_EXPENSIVE)
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            if getattr(request, '_holds_expensive_slot', False):
+                request._holds_expensive_slot = False
+                self.slots.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if endpoint_cost(request) < settings.THROTTLE_EXPENSIVE_COST:
+            return None
+        if not self.slots.acquire(blocking=False):
+            response = JsonResponse({'detail': 'Server is busy, please retry shortly.'}, status=503)
+            response['Retry-After'] = str(settings.THROTTLE_RETRY_AFTER)
+            return response
+        request._holds_expensive_slot = True
+        return None
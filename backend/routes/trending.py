@@ -0,0 +1,109 @@
+"""
+Time-decayed trending scores for routes.
+
+Activity (new routes, comments, images and POIs) adds a weight to the
+route's `trending` score that decays exponentially with
+TRENDING_HALF_LIFE_HOURS. To avoid touching every row as time passes,
+scores are stored relative to a shared epoch: an event at time t adds
+weight * exp(rate * (t - epoch)). Since all scores decay at the same rate
+this keeps the ordering exact at any moment. The periodic decay pass
+multiplies every score by exp(-rate * (now - epoch)) and moves the epoch
+to now, which keeps the stored numbers small.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Route, Location, Image, Comment, TrendingState
+
+
+WEIGHTS = {
+    'route': 1.0,
+    'location': 1.0,
+    'image': 2.0,
+    'comment': 3.0,
+}
+
+# Scores below this are reset to 0 by the decay pass
+NEGLIGIBLE_SCORE = 1e-4
+
+
+def decay_rate():
+    """
+    Decay rate per second.
+    """
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def get_epoch():
+    state, _ = TrendingState.objects.get_or_create(pk=1)
+    return state.epoch
+
+
+def activity_boost(kind, at=None, epoch=None):
+    """
+    Score contribution of an activity of `kind` happening at `at`.
+    """
+    at = at or timezone.now()
+    epoch = epoch or get_epoch()
+    return WEIGHTS[kind] * math.exp(decay_rate() * (at - epoch).total_seconds())
+
+
+def record_activity(route_id, kind, at=None):
+    """
+    Add an activity to a route's trending score with a single UPDATE.
+    """
+    Route.objects.filter(pk=route_id).update(trending=F('trending') + activity_boost(kind, at))
+
+
+def decay(now=None):
+    """
+    Move the epoch to `now`, rescaling all scores accordingly.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        state, _ = TrendingState.objects.select_for_update().get_or_create(pk=1)
+        factor = math.exp(-decay_rate() * (now - state.epoch).total_seconds())
+        Route.objects.filter(trending__gt=0).update(trending=F('trending') * factor)
+        Route.objects.filter(trending__gt=0, trending__lt=NEGLIGIBLE_SCORE).update(trending=0)
+        state.epoch = now
+        state.save(update_fields=['epoch'])
+    return factor
+
+
+def rebuild(now=None, half_lives=10, batch_size=1000):
+    """
+    Recompute all scores from the activity of the last `half_lives`
+    half-lives and reset the epoch to `now`.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS * half_lives)
+    rate = decay_rate()
+
+    scores = defaultdict(float)
+    events = [
+        ('route', Route.objects.filter(created_at__gte=since).values_list('id', 'created_at')),
+        ('location', Location.objects.filter(created_at__gte=since, route__isnull=False).values_list('route_id', 'created_at')),
+        ('image', Image.objects.filter(created_at__gte=since, route__isnull=False).values_list('route_id', 'created_at')),
+        ('comment', Comment.objects.filter(created_at__gte=since).values_list('route_id', 'created_at')),
+    ]
+    for kind, rows in events:
+        for route_id, created_at in rows.iterator(chunk_size=batch_size):
+            scores[route_id] += WEIGHTS[kind] * math.exp(-rate * (now - created_at).total_seconds())
+
+    with transaction.atomic():
+        state, _ = TrendingState.objects.select_for_update().get_or_create(pk=1)
+        Route.objects.filter(trending__gt=0).update(trending=0)
+        Route.objects.bulk_update(
+            [Route(pk=route_id, trending=score) for route_id, score in scores.items()],
+            ['trending'],
+            batch_size=batch_size,
+        )
+        state.epoch = now
+        state.save(update_fields=['epoch'])
+    return len(scores)
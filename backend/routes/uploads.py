@@ -0,0 +1,116 @@
+"""
+Chunked, resumable image uploads.
+
+Each chunk is streamed from the request body straight into the upload's
+temporary file at the checked offset, while the upload's row is locked so
+two requests cannot write the same range. Every byte is written once, and
+on finalize the temporary file is renamed into the media storage, so the
+image is never held in memory as a whole.
+"""
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image as PILImage, UnidentifiedImageError
+
+
+CHUNK_READ_SIZE = 64 * 1024
+GPS_IFD = 0x8825
+
+
+def temp_path(upload):
+    """
+    Path of the temporary file that collects an upload's chunks.
+    """
+    return Path(settings.IMAGE_UPLOAD_TEMP_DIR) / f'{upload.id}.part'
+
+
+def create_temp_file(upload):
+    path = temp_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return path
+
+
+def write_chunk(upload, stream, length):
+    """
+    Copy up to `length` bytes from `stream` into the upload's temporary
+    file at its current offset. Returns the number of bytes written, which
+    may be short if the client disconnects. Call with the upload locked.
+    """
+    written = 0
+    with open(temp_path(upload), 'r+b') as f:
+        f.seek(upload.received_size)
+        f.truncate()
+        try:
+            while written < length:
+                data = stream.read(min(CHUNK_READ_SIZE, length - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+        except OSError:
+            # Connection dropped mid-chunk: keep what arrived so the client
+            # can resume from the new offset.
+            pass
+    return written
+
+
+def discard(upload):
+    temp_path(upload).unlink(missing_ok=True)
+
+
+def move_to_storage(upload, upload_to):
+    """
+    Move a completed upload into the default storage and return the stored
+    file name. The move is a rename when the temporary directory is on the
+    same filesystem as MEDIA_ROOT.
+    """
+    name = default_storage.get_valid_name(os.path.basename(upload.filename))
+    name = default_storage.get_available_name(os.path.join(upload_to, name))
+    destination = Path(default_storage.path(name))
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(temp_path(upload), destination)
+    return name
+
+
+def verify_image(upload):
+    """
+    Return True if the upload's temporary file is a readable image.
+    """
+    try:
+        with PILImage.open(temp_path(upload)) as img:
+            img.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        return False
+    return True
+
+
+def _to_degrees(value, ref):
+    degrees, minutes, seconds = (float(part) for part in value)
+    result = degrees + minutes / 60 + seconds / 3600
+    return -result if ref in ('S', 'W') else result
+
+
+def read_gps(path):
+    """
+    Return the (latitude, longitude) stored in an image's EXIF data, or None.
+    """
+    try:
+        with PILImage.open(path) as img:
+            gps = img.getexif().get_ifd(GPS_IFD)
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    # GPSLatitudeRef=1, GPSLatitude=2, GPSLongitudeRef=3, GPSLongitude=4
+    if not all(key in gps for key in (1, 2, 3, 4)):
+        return None
+    try:
+        latitude = _to_degrees(gps[2], gps[1])
+        longitude = _to_degrees(gps[4], gps[3])
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return round(latitude, 6), round(longitude, 6)
@@ -4,18 +4,31 @@ from . import views
 urlpatterns = [
     # Route endpoints
     path('', views.RouteListCreateView.as_view(), name='route-list-create'),
+    path('feed/', views.RouteFeedView.as_view(), name='route-feed'),
+    path('autocomplete/', views.AutocompleteView.as_view(), name='route-autocomplete'),
+    path('heatmap/<int:zoom>/<int:x>/<int:y>.png', views.HeatmapTileView.as_view(), name='route-heatmap'),
+    path('itineraries/', views.ItineraryPlannerView.as_view(), name='route-itineraries'),
     path('<int:pk>/', views.RouteDetailView.as_view(), name='route-detail'),
     path('user/<int:user_id>/', views.UserRoutesView.as_view(), name='user-routes'),
+    path('<int:route_id>/geometry/', views.RouteGeometryView.as_view(), name='route-geometry'),
     path('<int:route_id>/locations/', views.RouteLocationsView.as_view(), name='route-locations'),
     path('<int:route_id>/comments/', views.RouteCommentsView.as_view(), name='route-comments'),
+    path('<int:route_id>/elevation/', views.RouteElevationView.as_view(), name='route-elevation'),
+    path('<int:route_id>/preview/', views.RoutePreviewView.as_view(), name='route-preview'),
+    path('<int:route_id>/pack/', views.RoutePackView.as_view(), name='route-pack'),
+    path('<int:route_id>/pack/manifest/', views.RoutePackManifestView.as_view(), name='route-pack-manifest'),
 
     # Location endpoints
     path('locations/', views.LocationListCreateView.as_view(), name='location-list-create'),
+    path('locations/clusters/', views.LocationClusterView.as_view(), name='location-clusters'),
     path('locations/<int:pk>/', views.LocationDetailView.as_view(), name='location-detail'),
 
     # Image endpoints
     path('images/', views.ImageListCreateView.as_view(), name='image-list-create'),
     path('images/<int:pk>/', views.ImageDetailView.as_view(), name='image-detail'),
+    path('images/uploads/', views.ImageUploadCreateView.as_view(), name='image-upload-create'),
+    path('images/uploads/<uuid:pk>/', views.ImageUploadDetailView.as_view(), name='image-upload-detail'),
+    path('images/uploads/<uuid:pk>/finalize/', views.ImageUploadFinalizeView.as_view(), name='image-upload-finalize'),
 
     # Comment endpoints
     path('comments/', views.CommentListCreateView.as_view(), name='comment-list-create'),
@@ -1,20 +1,105 @@
+import json
+
 from rest_framework import generics, permissions, status, filters
 from rest_framework.response import Response
+from rest_framework.exceptions import NotFound
+from rest_framework.views import APIView
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Route, Location, Image, Comment
+from .models import Route, Location, Image, Comment, ImageUpload, FeedEntry, RouteElevation
+from .filters import RouteFilter, LocationFilter
 from .serializers import (
     RouteSerializer,
     RouteListSerializer,
     RouteCreateSerializer,
     LocationSerializer,
     ImageSerializer,
-    CommentSerializer
+    ImageUploadSerializer,
+    ImageUploadFinalizeSerializer,
+    CommentSerializer,
+    GeometryPatchSerializer,
+    AutocompleteQuerySerializer,
+    ItineraryQuerySerializer,
+    LocationClusterQuerySerializer,
+    RouteElevationSerializer,
+    serialize_users,
 )
+from .itineraries import get_graph
+from . import autocomplete
+from .elevation import update_route_elevation
+from .previews import ensure_preview
+from .clusters import clusters_for_bbox
+from .editing import patch_geometry
+from .heatmap import tile_png
+from .jobs import enqueue, PRIORITY_HIGH
+from . import cards, packs, sync, tasks
+from . import uploads
 
 
 # ===== ROUTE VIEWS =====
 
-class RouteListCreateView(generics.ListCreateAPIView):
+class SideloadUsersListMixin:
+    """
+    Opt-in normalized lists: with `?sideload=users` rows carry only user ids
+    and each distinct user is listed once in `included.users`, loaded with
+    one query.
+    """
+
+    def sideload_users(self):
+        return self.request.method == 'GET' and 'users' in self.request.query_params.get('sideload', '').split(',')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.sideload_users():
+            context['sideloaded_users'] = set()
+        return context
+
+    def list(self, request, *args, **kwargs):
+        if not self.sideload_users():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page if page is not None else queryset, many=True)
+        data = serializer.data
+        included = {'users': serialize_users(serializer.context['sideloaded_users'], {'request': request})}
+        if page is not None:
+            response = self.get_paginated_response(data)
+            response.data['included'] = included
+            return response
+        return Response({'results': data, 'included': included})
+
+
+class RouteCardListMixin(SideloadUsersListMixin):
+    """
+    List routes from their pre-rendered cards (see routes/cards.py): only
+    the ids of the page are selected and the stored JSON is joined into the
+    response. Other formats, like the browsable API, use the serializer.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).values_list('id', flat=True)
+        page = self.paginate_queryset(queryset)
+        route_ids = list(page if page is not None else queryset)
+        body, users = cards.render_list(route_ids, request, sideload_users=self.sideload_users())
+        included = f', "included": {{"users": {users}}}' if users is not None else ''
+        if page is not None:
+            envelope = json.dumps({
+                'count': self.paginator.page.paginator.count,
+                'next': self.paginator.get_next_link(),
+                'previous': self.paginator.get_previous_link(),
+            })
+            body = f'{envelope[:-1]}, "results": {body}{included}}}'
+        elif included:
+            body = f'{{"results": {body}{included}}}'
+        return HttpResponse(body, content_type='application/json')
+
+
+class RouteListCreateView(RouteCardListMixin, generics.ListCreateAPIView):
     """
     API endpoint to list and create routes.
     GET /api/routes/ - List all routes
@@ -23,13 +108,17 @@ class RouteListCreateView(generics.ListCreateAPIView):
     Filters:
     - search: Search by title or description
     - difficulty: Filter by difficulty (easy, moderate, hard, expert)
+    - country: Routes crossing a country (code or name, e.g. IT or Italy)
+
+    Ordering:
+    - ordering: created_at, distance, title or trending (prefix with - for descending)
     """
-    queryset = Route.objects.all().select_related('creator').prefetch_related('locations', 'images', 'comments')
+    queryset = Route.objects.all().select_related('creator').prefetch_related('locations', 'images', 'comments', 'countries')
     permission_classes = [permissions.AllowAny]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'description']
-    filterset_fields = ['difficulty', 'duration_days']
-    ordering_fields = ['created_at', 'distance', 'title']
+    filterset_class = RouteFilter
+    ordering_fields = ['created_at', 'distance', 'title', 'trending']
     ordering = ['-created_at']
 
     def get_serializer_class(self):
@@ -48,7 +137,7 @@ class RouteDetailView(generics.RetrieveUpdateDestroyAPIView):
     PUT/PATCH /api/routes/<id>/ - Update route
     DELETE /api/routes/<id>/ - Delete route
     """
-    queryset = Route.objects.all().select_related('creator').prefetch_related('locations', 'images', 'comments')
+    queryset = Route.objects.all().select_related('creator').prefetch_related('locations', 'images', 'comments', 'countries')
     serializer_class = RouteSerializer
     permission_classes = [permissions.AllowAny]
 
@@ -70,7 +159,228 @@ class RouteDetailView(generics.RetrieveUpdateDestroyAPIView):
         instance.delete()
 
 
-class UserRoutesView(generics.ListAPIView):
+class RouteGeometryView(APIView):
+    """
+    API endpoint to edit part of a route's path.
+    PATCH /api/routes/<route_id>/geometry/
+
+    The body names the geometry_version the edit is based on; edits based
+    on an outdated version get 409 Conflict with the current version.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def patch(self, request, route_id):
+        route = get_object_or_404(Route.objects.only('id', 'creator_id', 'geometry_version'), pk=route_id)
+        if route.creator_id != request.user.id:
+            return Response({'error': 'You can only edit your own routes'}, status=status.HTTP_403_FORBIDDEN)
+        serializer = GeometryPatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        route, cleanup = patch_geometry(route.pk, **serializer.validated_data)
+        return Response({
+            'version': route.geometry_version,
+            'distance': route.distance,
+            'geometry_cleanup': cleanup,
+        })
+
+
+class RouteFeedView(RouteCardListMixin, generics.ListAPIView):
+    """
+    API endpoint for the authenticated user's personalized route feed.
+    GET /api/routes/feed/
+
+    Routes are ordered by their precomputed relevance score. Users without
+    a feed yet get the default newest-first list while theirs is built.
+    """
+    serializer_class = RouteListSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        if FeedEntry.objects.filter(user=user).exists():
+            return Route.objects.filter(feed_entries__user=user).select_related('creator').prefetch_related(
+                'countries',
+            ).order_by('-feed_entries__score')
+        enqueue(tasks.build_user_feed, priority=PRIORITY_HIGH, user_id=user.pk)
+        return Route.objects.exclude(creator=user).select_related('creator').prefetch_related('countries')
+
+
+class RouteElevationView(generics.RetrieveAPIView):
+    """
+    API endpoint to get a route's elevation profile.
+    GET /api/routes/<route_id>/elevation/
+
+    Profiles are computed on save from the local DEM tiles; routes saved
+    before the DEM was configured are computed on first request.
+    """
+    serializer_class = RouteElevationSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_object(self):
+        route = get_object_or_404(Route, pk=self.kwargs['route_id'])
+        try:
+            return route.elevation
+        except RouteElevation.DoesNotExist:
+            elevation = update_route_elevation(route)
+        if elevation is None:
+            raise NotFound('No elevation data is available for this route.')
+        return elevation
+
+
+class RoutePreviewView(APIView):
+    """
+    API endpoint serving a route's static preview image.
+    GET /api/routes/<route_id>/preview/
+
+    Previews are rendered in the background after a route is saved; a
+    missing one is rendered on request. Route list cards link here with a
+    version parameter, so responses can be cached for a long time.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, route_id):
+        route = get_object_or_404(Route.objects.only('id', 'geojson', 'updated_at'), pk=route_id)
+        path = ensure_preview(route)
+        if path is None:
+            raise NotFound('This route has no path to preview.')
+        response = FileResponse(open(path, 'rb'), content_type=f'image/{settings.ROUTE_PREVIEW_FORMAT.lower()}')
+        response['Cache-Control'] = f'public, max-age={settings.ROUTE_PREVIEW_CACHE_SECONDS}'
+        return response
+
+
+class HeatmapTileView(APIView):
+    """
+    API endpoint serving tiles of the route density heatmap.
+    GET /api/routes/heatmap/<zoom>/<x>/<y>.png
+
+    Standard Web Mercator (XYZ) tiles up to HEATMAP_MAX_ZOOM; map clients
+    scale the last level up for higher zooms. Tiles without routes are
+    transparent.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, zoom, x, y):
+        if zoom > settings.HEATMAP_MAX_ZOOM or x >= 2 ** zoom or y >= 2 ** zoom:
+            raise NotFound('No such heatmap tile.')
+        response = HttpResponse(tile_png(zoom, x, y), content_type='image/png')
+        response['Cache-Control'] = f'public, max-age={settings.HEATMAP_TILE_CACHE_SECONDS}'
+        return response
+
+
+class RoutePackView(APIView):
+    """
+    API endpoint to download a route for offline use.
+    GET /api/routes/<route_id>/pack/ - Full pack (zip)
+    GET /api/routes/<route_id>/pack/?since=<version> - Only files changed since that version
+
+    The pack version is sent as the ETag. Unknown `since` versions get the
+    full pack.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, route_id):
+        route = get_object_or_404(Route.objects.select_related('creator'), pk=route_id)
+        manifest = packs.build_pack(route)
+        version = manifest['version']
+        etag = f'"{version}"'
+        since = request.query_params.get('since')
+        if since == version or request.headers.get('If-None-Match') == etag:
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        path = packs.delta_pack(route, manifest, since) if since else None
+        filename = f'route-{route.pk}-{version}.zip'
+        if path is None:
+            path = packs.pack_dir(route.pk) / f'{version}.zip'
+        else:
+            filename = f'route-{route.pk}-{since}-{version}.zip'
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type='application/zip')
+        response['ETag'] = etag
+        return response
+
+
+class RoutePackManifestView(APIView):
+    """
+    API endpoint to check a route's offline pack without downloading it.
+    GET /api/routes/<route_id>/pack/manifest/
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, route_id):
+        route = get_object_or_404(Route.objects.select_related('creator'), pk=route_id)
+        return Response(packs.build_pack(route))
+
+
+class ItineraryPlannerView(APIView):
+    """
+    API endpoint to plan multi-day trips by chaining routes.
+    GET /api/routes/itineraries/?lat=&lng=&days=
+
+    Parameters:
+    - lat, lng: Start point
+    - days: Day budget for the whole trip
+    - max_gap_km: Maximum distance between the end of one route and the start of the next
+    - max_difficulty: Hardest difficulty allowed (easy, moderate, hard, expert)
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        params = ItineraryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        plans = get_graph().plan(
+            start=(data['lng'], data['lat']),
+            days=data['days'],
+            max_gap_km=data.get('max_gap_km', settings.ITINERARY_DEFAULT_GAP_KM),
+            max_difficulty=data.get('max_difficulty'),
+        )
+
+        return Response({
+            'itineraries': [
+                {
+                    'total_distance': sum(leg.node.distance for leg in legs),
+                    'total_days': sum(leg.node.days for leg in legs),
+                    'legs': [
+                        {
+                            'route': leg.node.id,
+                            'title': leg.node.title,
+                            'difficulty': leg.node.difficulty,
+                            'distance': leg.node.distance,
+                            'duration_days': leg.node.days,
+                            'reversed': leg.reversed,
+                            'gap_km': round(leg.gap_km, 2),
+                        }
+                        for leg in legs
+                    ],
+                }
+                for legs in plans
+            ]
+        })
+
+
+class AutocompleteView(APIView):
+    """
+    API endpoint for search box suggestions.
+    GET /api/routes/autocomplete/?q=<prefix>&limit=<n>
+
+    Matches route titles and POI names with a word starting with `q`, most
+    popular first. Answered from an in-memory index, not the database.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        params = AutocompleteQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        suggestions = autocomplete.get_index().suggest(data['q'], data['limit'])
+        return Response({
+            'results': [
+                {'type': kind, 'id': object_id, 'name': name}
+                for (kind, object_id), name in suggestions
+            ]
+        })
+
+
+class UserRoutesView(RouteCardListMixin, generics.ListAPIView):
     """
     API endpoint to list routes by a specific user.
     GET /api/routes/user/<user_id>/
@@ -80,25 +390,54 @@ class UserRoutesView(generics.ListAPIView):
 
     def get_queryset(self):
         user_id = self.kwargs['user_id']
-        return Route.objects.filter(creator_id=user_id).select_related('creator')
+        return Route.objects.filter(creator_id=user_id).select_related('creator').prefetch_related('countries')
 
 
 # ===== LOCATION VIEWS =====
 
-class LocationListCreateView(generics.ListCreateAPIView):
+class LocationListCreateView(SideloadUsersListMixin, generics.ListCreateAPIView):
     """
     API endpoint to list and create locations.
     GET /api/routes/locations/ - List all locations
     POST /api/routes/locations/ - Create new location
+
+    Filters:
+    - location_type, route
+    - country: Locations in a country (code or name, e.g. IT or Italy)
     """
     queryset = Location.objects.all().select_related('creator', 'route')
     serializer_class = LocationSerializer
     permission_classes = [permissions.AllowAny]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = LocationFilter
 
     def perform_create(self, serializer):
         serializer.save(creator=self.request.user)
 
 
+class LocationClusterView(APIView):
+    """
+    API endpoint to get POI clusters for a map viewport.
+    GET /api/routes/locations/clusters/?bbox=&zoom=&type=
+
+    Parameters:
+    - bbox: min_lng,min_lat,max_lng,max_lat of the viewport
+    - zoom: Map zoom level (0-20)
+    - type: Only count POIs of this location type
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        params = LocationClusterQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        return Response({
+            'zoom': data['zoom'],
+            'clusters': clusters_for_bbox(data['bbox'], data['zoom'], data.get('type')),
+        })
+
+
 class LocationDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     API endpoint to get, update, or delete a location.
@@ -116,7 +455,7 @@ class LocationDetailView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.AllowAny()]
 
 
-class RouteLocationsView(generics.ListAPIView):
+class RouteLocationsView(SideloadUsersListMixin, generics.ListAPIView):
     """
     API endpoint to list locations for a specific route.
     GET /api/routes/<route_id>/locations/
@@ -131,7 +470,7 @@ class RouteLocationsView(generics.ListAPIView):
 
 # ===== IMAGE VIEWS =====
 
-class ImageListCreateView(generics.ListCreateAPIView):
+class ImageListCreateView(SideloadUsersListMixin, generics.ListCreateAPIView):
     """
     API endpoint to list and create images.
     GET /api/routes/images/ - List all images
@@ -161,9 +500,122 @@ class ImageDetailView(generics.RetrieveDestroyAPIView):
         return [permissions.AllowAny()]
 
 
+class ImageUploadCreateView(generics.CreateAPIView):
+    """
+    API endpoint to start a chunked image upload.
+    POST /api/routes/images/uploads/
+
+    Body: filename, total_size, and optionally caption, route, location.
+    """
+    serializer_class = ImageUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_create(self, serializer):
+        upload = serializer.save(uploader=self.request.user)
+        uploads.create_temp_file(upload)
+
+
+class ImageUploadDetailView(generics.RetrieveDestroyAPIView):
+    """
+    API endpoint to send chunks of an upload and check its progress.
+    GET /api/routes/images/uploads/<id>/ - Get received_size to resume from
+    PUT /api/routes/images/uploads/<id>/ - Append a chunk (raw request body)
+    DELETE /api/routes/images/uploads/<id>/ - Abort the upload
+
+    PUT requests must send an Upload-Offset header equal to the current
+    received_size; otherwise 409 is returned with the expected offset.
+    """
+    serializer_class = ImageUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ImageUpload.objects.filter(uploader=self.request.user)
+
+    def put(self, request, *args, **kwargs):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'error': 'Upload-Offset and Content-Length headers are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            upload = get_object_or_404(self.get_queryset().select_for_update(), pk=kwargs['pk'])
+            if offset != upload.received_size:
+                return Response({'received_size': upload.received_size}, status=status.HTTP_409_CONFLICT)
+            if offset + length > upload.total_size:
+                return Response({'error': 'Chunk exceeds the declared file size'}, status=status.HTTP_400_BAD_REQUEST)
+            if length:
+                upload.received_size += uploads.write_chunk(upload, request.stream, length)
+                upload.save(update_fields=['received_size', 'updated_at'])
+
+        return Response(self.get_serializer(upload).data)
+
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+        instance.delete()
+
+
+class ImageUploadFinalizeView(APIView):
+    """
+    API endpoint to turn a completed upload into an Image.
+    POST /api/routes/images/uploads/<id>/finalize/
+
+    If the photo has EXIF GPS coordinates they are returned as
+    suggested_location. With create_location=true and a route, a Location
+    is created on the route at those coordinates and the image is attached
+    to it.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        options = ImageUploadFinalizeSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        options = options.validated_data
+
+        with transaction.atomic():
+            upload = get_object_or_404(
+                ImageUpload.objects.select_for_update().filter(uploader=request.user), pk=pk,
+            )
+            if upload.received_size != upload.total_size:
+                return Response({
+                    'error': 'Upload is incomplete',
+                    'received_size': upload.received_size,
+                    'total_size': upload.total_size,
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            if not uploads.verify_image(upload):
+                uploads.discard(upload)
+                upload.delete()
+                return Response({'error': 'Uploaded file is not a valid image'}, status=status.HTTP_400_BAD_REQUEST)
+
+            gps = uploads.read_gps(uploads.temp_path(upload))
+            location = upload.location
+            created_location = None
+            if gps and upload.route and not location and options['create_location']:
+                created_location = Location.objects.create(
+                    name=options.get('name') or upload.caption or upload.filename,
+                    location_type=options['location_type'],
+                    latitude=gps[0],
+                    longitude=gps[1],
+                    route=upload.route,
+                    creator=request.user,
+                )
+                location = created_location
+
+            image = Image(caption=upload.caption, route=upload.route, location=location, uploader=request.user)
+            image.image.name = uploads.move_to_storage(upload, Image._meta.get_field('image').upload_to)
+            image.save()
+            upload.delete()
+
+        data = ImageSerializer(image, context={'request': request}).data
+        data['suggested_location'] = {'latitude': gps[0], 'longitude': gps[1]} if gps else None
+        data['created_location'] = created_location.id if created_location else None
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
 # ===== COMMENT VIEWS =====
 
-class CommentListCreateView(generics.ListCreateAPIView):
+class CommentListCreateView(SideloadUsersListMixin, generics.ListCreateAPIView):
     """
     API endpoint to list and create comments.
     GET /api/routes/comments/ - List all comments
@@ -194,7 +646,7 @@ class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.AllowAny()]
 
 
-class RouteCommentsView(generics.ListAPIView):
+class RouteCommentsView(SideloadUsersListMixin, generics.ListAPIView):
     """
     API endpoint to list comments for a specific route.
     GET /api/routes/<route_id>/comments/
@@ -205,3 +657,28 @@ class RouteCommentsView(generics.ListAPIView):
     def get_queryset(self):
         route_id = self.kwargs['route_id']
         return Comment.objects.filter(route_id=route_id).select_related('author')
+
+
+# ===== SYNC VIEWS =====
+
+class SyncView(APIView):
+    """
+    API endpoint for mobile clients to fetch changes since their last sync.
+    GET /api/sync/ - Everything (first sync)
+    GET /api/sync/?since=<sync_token> - Changes and deletes since that sync
+    GET /api/sync/?cursor=<cursor> - Next page of the same sync
+
+    Keep requesting with `cursor` until it is null; the last page carries
+    the `sync_token` to pass as `since` next time.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        context = {'request': request}
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            since, until, stage, after = sync.read_cursor(cursor)
+            return Response(sync.sync_page(since, until, stage, after, context=context))
+
+        since = request.query_params.get('since')
+        return Response(sync.sync_page(sync.read_token(since) if since else None, context=context))
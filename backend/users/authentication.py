@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from routes.checks import cache_is_shared_memory
+
+
+# Token claim holding the user's auth_version when the token was issued
+AUTH_VERSION_CLAIM = 'auth_version'
+
+
+def user_cache_key(user_id, version):
+    return f'auth_user:{user_id}:{version}'
+
+
+def invalidate_cached_user(user_id, version):
+    if not cache_is_shared_memory():
+        return
+    # Also the previous version, in case this save bumped it
+    cache.delete_many([user_cache_key(user_id, version), user_cache_key(user_id, version - 1)])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that resolves the user from the cache instead of
+    querying the users table on every request.
+    Entries are keyed by the user's auth_version from the token, live for
+    AUTH_USER_CACHE_TTL seconds and are dropped whenever the user is saved
+    or deleted. A user loaded from the database must still have the token's
+    auth_version, so bumping it revokes tokens within the TTL even when the
+    change bypasses save signals. Users are only cached in Redis or
+    Memcached: a process-local cache could not be invalidated from other
+    processes, and a database cache lookup costs as much as loading the
+    user, so with those the user is always loaded.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None or not cache_is_shared_memory():
+            return self._load_user(validated_token)
+
+        key = user_cache_key(user_id, validated_token.get(AUTH_VERSION_CLAIM, 0))
+        user = cache.get(key)
+        if user is None:
+            user = self._load_user(validated_token)
+            cache.set(key, user, settings.AUTH_USER_CACHE_TTL)
+            return user
+
+        # The same checks JWTAuthentication runs on a freshly loaded user
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+    def _load_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if validated_token.get(AUTH_VERSION_CLAIM, 0) != user.auth_version:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+        return user
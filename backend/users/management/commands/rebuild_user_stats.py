@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized riding statistics of users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only rebuild stats for these user ids.')
+
+    def handle(self, *args, **options):
+        count = rebuild_stats(user_ids=options['users'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {count} users.'))
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_country'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_distance', models.FloatField(default=0, help_text="Total distance of the user's routes in kilometers")),
+                ('route_count', models.IntegerField(default=0)),
+                ('easy_routes', models.IntegerField(default=0)),
+                ('moderate_routes', models.IntegerField(default=0)),
+                ('hard_routes', models.IntegerField(default=0)),
+                ('expert_routes', models.IntegerField(default=0)),
+                ('locations_count', models.IntegerField(default=0)),
+                ('images_count', models.IntegerField(default=0)),
+                ('comments_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'user stats',
+                'db_table': 'user_stats',
+            },
+        ),
+    ]
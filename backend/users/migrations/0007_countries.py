@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_advised_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='countries',
+            field=models.JSONField(blank=True, default=list, help_text="Codes of the countries the user's routes cross"),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+
+DIFFICULTY_FIELDS = {
+    'easy': 'easy_routes',
+    'moderate': 'moderate_routes',
+    'hard': 'hard_routes',
+    'expert': 'expert_routes',
+}
+BATCH_SIZE = 1000
+
+
+def create_missing_stats(apps, schema_editor):
+    # Users created before UserStats existed have no row, and the counters
+    # only apply deltas to existing rows; compute theirs from scratch
+    User = apps.get_model('users', 'User')
+    UserStats = apps.get_model('users', 'UserStats')
+    Route = apps.get_model('routes', 'Route')
+    RouteCountry = apps.get_model('routes', 'RouteCountry')
+    Location = apps.get_model('routes', 'Location')
+    Image = apps.get_model('routes', 'Image')
+    Comment = apps.get_model('routes', 'Comment')
+
+    missing = User.objects.filter(stats__isnull=True).order_by('pk')
+    last_pk = 0
+    while user_ids := list(missing.filter(pk__gt=last_pk).values_list('pk', flat=True)[:BATCH_SIZE]):
+        routes = {
+            row['creator_id']: row
+            for row in Route.objects.filter(creator_id__in=user_ids).values('creator_id').annotate(
+                total=Sum('distance'),
+                count=Count('id'),
+                **{field: Count('id', filter=Q(difficulty=difficulty)) for difficulty, field in DIFFICULTY_FIELDS.items()},
+            )
+        }
+        locations = dict(Location.objects.filter(creator_id__in=user_ids).values('creator_id').annotate(n=Count('id')).values_list('creator_id', 'n'))
+        images = dict(Image.objects.filter(uploader_id__in=user_ids).values('uploader_id').annotate(n=Count('id')).values_list('uploader_id', 'n'))
+        comments = dict(Comment.objects.filter(author_id__in=user_ids).values('author_id').annotate(n=Count('id')).values_list('author_id', 'n'))
+        countries = {}
+        for user_id, country in RouteCountry.objects.filter(route__creator_id__in=user_ids).values_list('route__creator_id', 'country').distinct():
+            countries.setdefault(user_id, set()).add(country)
+
+        UserStats.objects.bulk_create([
+            UserStats(
+                user_id=user_id,
+                total_distance=routes.get(user_id, {}).get('total') or 0,
+                route_count=routes.get(user_id, {}).get('count', 0),
+                **{field: routes.get(user_id, {}).get(field, 0) for field in DIFFICULTY_FIELDS.values()},
+                countries=sorted(countries.get(user_id, ())),
+                locations_count=locations.get(user_id, 0),
+                images_count=images.get(user_id, 0),
+                comments_count=comments.get(user_id, 0),
+            )
+            for user_id in user_ids
+        ], ignore_conflicts=True)
+        last_pk = user_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_countries'),
+        ('routes', '0013_countries'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_stats, migrations.RunPython.noop),
+    ]
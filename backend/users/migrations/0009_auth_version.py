@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_create_missing_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='auth_version',
+            field=models.PositiveIntegerField(default=0, help_text="Bumped to revoke the user's tokens and cached copies"),
+        ),
+    ]
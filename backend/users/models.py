@@ -32,6 +32,9 @@ class User(AbstractUser):
     motorcycle_model = models.CharField(max_length=100, blank=True)
     motorcycle_year = models.IntegerField(blank=True, null=True)
 
+    # Authentication
+    auth_version = models.PositiveIntegerField(default=0, help_text="Bumped to revoke the user's tokens and cached copies")
+
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -39,6 +42,46 @@ class User(AbstractUser):
     class Meta:
         db_table = 'users'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='users_created_30b417_idx'),
+        ]
 
     def __str__(self):
         return self.username
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        if self.pk:
+            self.auth_version += 1
+
+
+class UserStats(models.Model):
+    """
+    Materialized riding statistics of a user.
+    Kept up to date by signals on routes, locations, images and comments.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+
+    # Routes
+    total_distance = models.FloatField(default=0, help_text="Total distance of the user's routes in kilometers")
+    route_count = models.IntegerField(default=0)
+    easy_routes = models.IntegerField(default=0)
+    moderate_routes = models.IntegerField(default=0)
+    hard_routes = models.IntegerField(default=0)
+    expert_routes = models.IntegerField(default=0)
+    countries = models.JSONField(default=list, blank=True, help_text="Codes of the countries the user's routes cross")
+
+    # Contributions
+    locations_count = models.IntegerField(default=0)
+    images_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+
+    # Metadata
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'user_stats'
+        verbose_name_plural = 'user stats'
+
+    def __str__(self):
+        return f"Stats for {self.user}"
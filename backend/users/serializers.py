@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import User
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .authentication import AUTH_VERSION_CLAIM
+from .models import User, UserStats
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -27,6 +29,38 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class UserStatsSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a user's materialized riding statistics.
+    """
+    class Meta:
+        model = UserStats
+        fields = [
+            'total_distance',
+            'route_count',
+            'easy_routes',
+            'moderate_routes',
+            'hard_routes',
+            'expert_routes',
+            'countries',
+            'locations_count',
+            'images_count',
+            'comments_count',
+            'updated_at',
+        ]
+        read_only_fields = fields
+
+
+class UserDetailSerializer(UserSerializer):
+    """
+    Serializer for a single user's page, including riding statistics.
+    """
+    stats = UserStatsSerializer(read_only=True)
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + ['stats']
+
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     """
     Serializer for user registration.
@@ -73,6 +107,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
     """
     Serializer for updating user profile.
     """
+    stats = UserStatsSerializer(read_only=True)
+
     class Meta:
         model = User
         fields = [
@@ -88,5 +124,19 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'motorcycle_brand',
             'motorcycle_model',
             'motorcycle_year',
+            'stats',
         ]
-        read_only_fields = ['id', 'username']
+        read_only_fields = ['id', 'username', 'stats']
+
+
+class VersionedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Login serializer whose tokens carry the user's auth_version, checked by
+    CachedJWTAuthentication.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[AUTH_VERSION_CLAIM] = user.auth_version
+        return token
@@ -0,0 +1,80 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from routes.models import Route, Location, Image, Comment
+from .models import User, UserStats
+from .stats import route_deltas, apply_delta, refresh_countries
+from .authentication import invalidate_cached_user
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    invalidate_cached_user(instance.pk, instance.auth_version)
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk, instance.auth_version)
+
+
+@receiver(pre_save, sender=Route)
+def route_pre_save(sender, instance, raw=False, **kwargs):
+    """
+    Remember the stored distance and difficulty so updates apply a delta.
+    """
+    instance._stats_previous = None
+    if instance.pk and not raw:
+        instance._stats_previous = Route.objects.filter(pk=instance.pk).values(
+            'creator_id', 'distance', 'difficulty',
+        ).first()
+
+
+@receiver(post_save, sender=Route)
+def route_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    if previous:
+        apply_delta(previous['creator_id'], route_deltas(previous['distance'], previous['difficulty'], sign=-1))
+    apply_delta(instance.creator_id, route_deltas(instance.distance, instance.difficulty))
+
+
+@receiver(post_delete, sender=Route)
+def route_deleted(sender, instance, **kwargs):
+    apply_delta(instance.creator_id, route_deltas(instance.distance, instance.difficulty, sign=-1), create=False)
+    refresh_countries(instance.creator_id, create=False)
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        apply_delta(instance.creator_id, {'locations_count': 1})
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    apply_delta(instance.creator_id, {'locations_count': -1}, create=False)
+
+
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        apply_delta(instance.uploader_id, {'images_count': 1})
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted(sender, instance, **kwargs):
+    apply_delta(instance.uploader_id, {'images_count': -1}, create=False)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        apply_delta(instance.author_id, {'comments_count': 1})
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    apply_delta(instance.author_id, {'comments_count': -1}, create=False)
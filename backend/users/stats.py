@@ -0,0 +1,111 @@
+"""
+Maintenance of the materialized UserStats rows.
+"""
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from routes.models import Route, RouteCountry, Location, Image, Comment
+from .models import User, UserStats
+
+
+DIFFICULTY_FIELDS = {
+    'easy': 'easy_routes',
+    'moderate': 'moderate_routes',
+    'hard': 'hard_routes',
+    'expert': 'expert_routes',
+}
+
+
+def route_deltas(distance, difficulty, sign=1):
+    """
+    Counter changes for adding (sign=1) or removing (sign=-1) a route.
+    """
+    deltas = {'total_distance': sign * (distance or 0), 'route_count': sign}
+    field = DIFFICULTY_FIELDS.get(difficulty)
+    if field:
+        deltas[field] = sign
+    return deltas
+
+
+def apply_delta(user_id, deltas, create=True):
+    """
+    Add `deltas` ({field: amount}) to a user's stats in a single UPDATE.
+    With `create`, a user without a stats row gets one computed from
+    scratch, which already includes the change. Deletes pass create=False,
+    as they may be part of deleting the user.
+    """
+    updates = {field: F(field) + amount for field, amount in deltas.items() if amount}
+    if updates and not UserStats.objects.filter(user_id=user_id).update(updated_at=timezone.now(), **updates) and create:
+        rebuild_stats([user_id])
+
+
+def user_countries(user_id):
+    """
+    Codes of the countries crossed by a user's routes, sorted.
+    """
+    return sorted(set(RouteCountry.objects.filter(route__creator_id=user_id).values_list('country', flat=True)))
+
+
+def refresh_countries(user_id, create=True):
+    updated = UserStats.objects.filter(user_id=user_id).update(countries=user_countries(user_id), updated_at=timezone.now())
+    if not updated and create:
+        rebuild_stats([user_id])
+
+
+def rebuild_stats(user_ids=None, batch_size=1000):
+    """
+    Recompute stats from scratch for the given users (all users by default).
+    Returns the number of users processed.
+    """
+    users = User.objects.all()
+    routes = Route.objects.values('creator_id').annotate(
+        total=Sum('distance'),
+        count=Count('id'),
+        **{field: Count('id', filter=Q(difficulty=difficulty)) for difficulty, field in DIFFICULTY_FIELDS.items()},
+    )
+    locations = Location.objects.values('creator_id').annotate(n=Count('id'))
+    images = Image.objects.values('uploader_id').annotate(n=Count('id'))
+    comments = Comment.objects.values('author_id').annotate(n=Count('id'))
+    countries = RouteCountry.objects.values_list('route__creator_id', 'country').distinct()
+
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+        routes = routes.filter(creator_id__in=user_ids)
+        locations = locations.filter(creator_id__in=user_ids)
+        images = images.filter(uploader_id__in=user_ids)
+        comments = comments.filter(author_id__in=user_ids)
+        countries = countries.filter(route__creator_id__in=user_ids)
+
+    routes = {row['creator_id']: row for row in routes}
+    locations = {row['creator_id']: row['n'] for row in locations}
+    images = {row['uploader_id']: row['n'] for row in images}
+    comments = {row['author_id']: row['n'] for row in comments}
+    countries_by_user = {}
+    for user_id, country in countries:
+        countries_by_user.setdefault(user_id, set()).add(country)
+
+    stats = []
+    for user_id in users.values_list('id', flat=True):
+        route_row = routes.get(user_id, {})
+        stats.append(UserStats(
+            user_id=user_id,
+            total_distance=route_row.get('total') or 0,
+            route_count=route_row.get('count', 0),
+            **{field: route_row.get(field, 0) for field in DIFFICULTY_FIELDS.values()},
+            countries=sorted(countries_by_user.get(user_id, ())),
+            locations_count=locations.get(user_id, 0),
+            images_count=images.get(user_id, 0),
+            comments_count=comments.get(user_id, 0),
+        ))
+
+    UserStats.objects.bulk_create(
+        stats,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=[
+            'total_distance', 'route_count', *DIFFICULTY_FIELDS.values(), 'countries',
+            'locations_count', 'images_count', 'comments_count', 'updated_at',
+        ],
+    )
+    return len(stats)
@@ -1,3 +1,29 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
 
-# Create your tests here.
+
+UNTHROTTLED = {scope: {'capacity': 10 ** 9, 'refill_rate': 10 ** 9} for scope in ('user', 'anon')}
+
+
+@override_settings(THROTTLE_BUCKETS=UNTHROTTLED)
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('rider', 'rider@example.com', 'correct-horse-42')
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'rider', 'password': 'correct-horse-42'})
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+
+    def test_database_cache_is_not_used_for_users(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('user-profile')).status_code, 200)
+        self.assertFalse([query for query in queries.captured_queries if '"cache"' in query['sql']])
+
+    def test_bumped_auth_version_revokes_token(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(auth_version=F('auth_version') + 1)
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
@@ -3,7 +3,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from .models import User
-from .serializers import UserSerializer, UserRegistrationSerializer, UserProfileSerializer
+from .serializers import UserSerializer, UserDetailSerializer, UserRegistrationSerializer, UserProfileSerializer
 
 
 class UserRegistrationView(generics.CreateAPIView):
@@ -44,8 +44,8 @@ class UserDetailView(generics.RetrieveAPIView):
     API endpoint to get user details by ID.
     GET /api/users/<id>/
     """
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
+    queryset = User.objects.select_related('stats')
+    serializer_class = UserDetailSerializer
     permission_classes = [permissions.AllowAny]
 
 
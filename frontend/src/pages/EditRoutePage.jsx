@@ -46,6 +46,8 @@ export default function EditRoutePage() {
         distance: formData.distance,
         duration_days: formData.duration_days,
         geojson: formData.geojson,
+        // The path is only saved if nobody changed it since it was loaded
+        geometry_version: route.geometry_version,
       });
       
       // Then, upload new images if any
@@ -67,6 +69,13 @@ export default function EditRoutePage() {
       // Navigate to the updated route detail page
       navigate(`/routes/${id}`);
     } catch (error) {
+      if (error.response?.status === 409) {
+        // Show the conflict on the path field
+        error.response.data = {
+          ...error.response.data,
+          geojson: 'This route\'s path was changed since you opened it. Reload the page to edit the latest version.',
+        };
+      }
       // Re-throw the error so RouteForm can handle it
       throw error;
     }
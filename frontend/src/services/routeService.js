@@ -7,6 +7,10 @@ export const routeService = {
     return api.get(`/routes/?${params}`);
   },
 
+  // Typeahead suggestions of route titles and POI names
+  autocomplete: (q, limit = 8) =>
+    api.get('/routes/autocomplete/', { params: { q, limit } }),
+
   // Get single route with full details (locations, images, comments)
   getRoute: (id) =>
     api.get(`/routes/${id}/`),
@@ -16,9 +20,14 @@ export const routeService = {
     api.post('/routes/', routeData),
 
   // Update route (requires auth, creator only)
+  // Send the route's geometry_version along with a new geojson; 409 if it is outdated
   updateRoute: (id, routeData) =>
     api.patch(`/routes/${id}/`, routeData),
 
+  // Edit part of a route path (requires auth, creator only); 409 if version is outdated
+  patchRouteGeometry: (id, version, operations) =>
+    api.patch(`/routes/${id}/geometry/`, { version, operations }),
+
   // Delete route (requires auth, creator only)
   deleteRoute: (id) =>
     api.delete(`/routes/${id}/`),